@@ -1,4 +1,4 @@
 #!/bin/sh
-export DJANGO_SETTINGS_MODULE=know.settings
+export DJANGO_SETTINGS_MODULE=${DJANGO_SETTINGS_MODULE:-know.settings_production}
 cd know/ 
-pipenv run server 0.0.0.0:8000
+pipenv run production-server
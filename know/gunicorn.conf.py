@@ -0,0 +1,34 @@
+# pylint: disable=invalid-name
+"""
+Gunicorn settings for serving know in production (see docker-entrypoint.sh).
+Gunicorn reads this from the directory it's started in.
+"""
+
+import gc
+import os
+import multiprocessing
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+
+# Panels spend most of their time waiting on Wikidata, so each worker process has a
+# few threads that can wait at once
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+
+# Import Django, the app and the .sparql files once in the master, so workers start
+# quickly and share the memory through copy-on-write. The HTTP clients and background
+# refresher notice they've been forked and make their own connections and threads
+preload_app = True
+
+timeout = 60 # Longer than a Wikidata query with its retries (QUERY_DEADLINE)
+keepalive = 5
+
+accesslog = '-'
+
+def when_ready(_):
+    """ Moves the preloaded objects out of the garbage collector's reach before the
+        workers are forked, so collections in a worker don't write to (and so copy)
+        the pages it shares with the master
+    """
+    gc.freeze()
@@ -13,4 +13,23 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'know.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported once Django is set up
+from rdf.parser.http_client import async_http_client # pylint: disable=wrong-import-position
+
+async def application(scope, receive, send):
+    """ Serves Django, and handles the lifespan protocol (which Django doesn't) so the
+        async HTTP client's connections are closed when the server shuts down
+    """
+    if scope['type'] != 'lifespan':
+        return await django_application(scope, receive, send)
+
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({ 'type': 'lifespan.startup.complete' })
+        elif message['type'] == 'lifespan.shutdown':
+            await async_http_client.aclose()
+            await send({ 'type': 'lifespan.shutdown.complete' })
+            return
@@ -44,6 +44,7 @@ INSTALLED_APPS = [
 CORS_ORIGIN_ALLOW_ALL = True
 
 MIDDLEWARE = [
+    'rdf.middleware.ServerTimingMiddleware', # First, so it times everything else too
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -117,4 +118,144 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [],
     'DEFAULT_PERMISSION_CLASSES': [],
     'UNAUTHENTICATED_USER': None,
+    'DEFAULT_RENDERER_CLASSES': [
+        'rdf.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
 }
+
+# Caches
+# https://docs.djangoproject.com/en/3.1/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Formatted knowledge panels. LocMemCache is an in-process LRU, so MAX_ENTRIES
+    # bounds its size. Point this at e.g. memcached to share panels between processes
+    'panels': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'knowledge-panels',
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    },
+    # Which Wikidata ID each VIAF cluster resolved to, kept apart from the panels so
+    # they don't evict them (see VIAF_LINK_CACHE_ALIAS)
+    'viaf_links': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'viaf-links',
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    },
+}
+
+PANEL_CACHE_ALIAS = 'panels'
+VIAF_LINK_CACHE_ALIAS = 'viaf_links'
+
+# How many seconds a panel is cached for, per EntityType name
+PANEL_CACHE_TTLS = {
+    'PERSON': 60 * 60 * 24,
+    'BOOK': 60 * 60 * 24 * 7,
+    'COUNTRY': 60 * 60 * 6, # Populations and heads of state change the most often
+    'LANDMARK': 60 * 60 * 24 * 7,
+    'DEFAULT': 60 * 60,
+}
+
+# The Cache-Control directives panels are sent with, per EntityType name, so browsers
+# and CDNs can cache them. They're sent with ETags, so once max-age is up they can be
+# revalidated with If-None-Match (and stale-while-revalidate lets that happen in the
+# background). A panel that's stale in our cache is sent with a max-age of 0
+PANEL_CACHE_CONTROL = {
+    'PERSON': { 'max-age': 60 * 60, 'stale-while-revalidate': 60 * 60 * 24 },
+    'BOOK': { 'max-age': 60 * 60 * 24, 'stale-while-revalidate': 60 * 60 * 24 * 7 },
+    'COUNTRY': { 'max-age': 60 * 15, 'stale-while-revalidate': 60 * 60 * 6 },
+    'LANDMARK': { 'max-age': 60 * 60 * 24, 'stale-while-revalidate': 60 * 60 * 24 * 7 },
+    'DEFAULT': { 'max-age': 60 * 5, 'stale-while-revalidate': 60 * 60 },
+}
+
+# Determine the entity type and fetch its fields with one Wikidata query
+# (get_entity.sparql) instead of two
+WIKIDATA_COMBINED_RESOLUTION = True
+
+# Where SPARQL queries are sent, and where VIAF clusters are fetched from (None fetches
+# the VIAF URI itself). Point them at the stand-in server from
+# `python manage.py sparql_standin` (e.g. 'http://localhost:8001/sparql' and
+# 'http://localhost:8001/viaf/') to load test without Wikidata or VIAF
+WIKIDATA_ENDPOINT = 'https://query.wikidata.org/sparql'
+VIAF_ENDPOINT = None
+
+# Shared HTTP client used for Wikidata and VIAF requests (rdf/parser/http_client.py)
+HTTP_CLIENT = {
+    'POOL_CONNECTIONS': 4, # How many hosts to keep a connection pool for
+    'POOL_MAXSIZE': 20, # How many keep-alive connections to keep per host
+    'CONNECT_TIMEOUT': 3.05, # Seconds
+    'READ_TIMEOUT': 30, # Seconds
+    'HTTP2': False, # Multiplex requests over HTTP/2 with httpx
+}
+
+# Hedge Wikidata requests: once one has taken longer than WIKIDATA_HEDGE_PERCENTILE of
+# the recent ones (but at least WIKIDATA_HEDGE_MIN_DELAY seconds), send it again and use
+# whichever answers first. At most WIKIDATA_HEDGE_RATIO of requests are hedged, and at
+# most WIKIDATA_HEDGE_MAX_IN_FLIGHT hedges are in flight at once, per process
+WIKIDATA_HEDGE = False
+WIKIDATA_HEDGE_PERCENTILE = 95
+WIKIDATA_HEDGE_MIN_DELAY = 0.05
+WIKIDATA_HEDGE_RATIO = 0.05
+WIKIDATA_HEDGE_MAX_IN_FLIGHT = 4
+# Threads sync requests are sent from so they can be hedged, by default one for each
+# thread that can be waiting on Wikidata (GUNICORN_THREADS and the panel refresh and
+# prefetch workers) and one for each hedge in flight
+WIKIDATA_HEDGE_WORKERS = None
+
+# Serve the panel route (/) with a plain Django view instead of DRF's, which skips
+# content negotiation and the browsable API. It's on in settings_production.py
+PANEL_FAST_PATH = False
+
+# How many seconds the panel route has to respond. Every Wikidata and VIAF request made
+# for it is cut short by what's left (None to wait as long as it takes). If the panel
+# can't be fetched in time, a partial one with just its title and subtitle is sent
+# instead, which is fetched in the last PANEL_PARTIAL_RESERVE seconds
+PANEL_DEADLINE = 10
+PANEL_PARTIAL_RESERVE = 1
+
+# Most URIs the batch panel route (/batch/) accepts in one request
+PANEL_BATCH_MAX_URIS = 50
+
+# Concurrent requests for the same panel are always coalesced within a process. With
+# this on, they're also coalesced across processes by using the panel cache as a lock,
+# which only helps if the panel cache is shared (e.g. memcached)
+PANEL_SINGLE_FLIGHT_CROSS_PROCESS = False
+PANEL_SINGLE_FLIGHT_WAIT = 10 # Seconds to wait on another process' panel
+
+# Once a panel is past its TTL it's served stale (and refreshed in the background) for
+# up to this many more seconds, including while Wikidata is failing
+PANEL_CACHE_STALE_TTL = 60 * 60 * 24 * 7
+PANEL_REFRESH_WORKERS = 2 # Background threads refreshing stale panels
+
+# Prefetch the panels of the entities a panel links to (e.g. a person's spouse, or a
+# book's author) in the background when it's parsed, so following a link is a cache
+# hit. Each process prefetches at most PANEL_PREFETCH_MAX_LINKS links per panel, at
+# PANEL_PREFETCH_RATE a second, and drops them once PANEL_PREFETCH_QUEUE are waiting
+PANEL_PREFETCH = False
+PANEL_PREFETCH_MAX_LINKS = 5
+PANEL_PREFETCH_RATE = 2
+PANEL_PREFETCH_QUEUE = 100
+PANEL_PREFETCH_WORKERS = 2
+
+# A local SQLite store of panels built from a Wikidata dump with
+# `python manage.py ingest_wikidata_dump`. Panels are read from it before querying
+# Wikidata once the file exists, e.g. BASE_DIR / 'panels.sqlite3'
+PANEL_STORE_PATH = None
+
+# Which Wikidata ID each VIAF cluster resolved to is cached in memory, and also in this
+# SQLite file if it's set (e.g. BASE_DIR / 'viaf_links.sqlite3') so it's kept between
+# restarts. Clusters without a Wikidata link are cached for VIAF_NEGATIVE_TTL seconds
+VIAF_CACHE_PATH = None
+VIAF_NEGATIVE_TTL = 60 * 60 * 24
+
+# A sorted index of VIAF cluster ID to Wikidata ID built from VIAF's cluster links file
+# with `python manage.py build_viaf_crosswalk`. It's memory mapped and checked before
+# fetching VIAF clusters once the file exists, e.g. BASE_DIR / 'viaf.crosswalk'
+VIAF_CROSSWALK_PATH = None
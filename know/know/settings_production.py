@@ -0,0 +1,46 @@
+"""
+Production settings for know, used by docker-entrypoint.sh.
+
+The API only serves JSON panels, so this drops the admin, auth, sessions, messages,
+CSRF and template machinery that settings.py has for development, along with the
+middleware that goes with them, and serves the panel route without DRF.
+Use it with DJANGO_SETTINGS_MODULE=know.settings_production
+"""
+
+import os
+from know.settings import * # pylint: disable=wildcard-import,unused-wildcard-import
+
+SECRET_KEY = os.environ.get('DJANGO_SECRET_KEY', SECRET_KEY)
+
+DEBUG = False
+
+ALLOWED_HOSTS = os.environ.get('DJANGO_ALLOWED_HOSTS', '*').split(',')
+
+INSTALLED_APPS = [
+    'corsheaders',
+    'rest_framework',
+    'rdf',
+]
+
+MIDDLEWARE = [
+    'rdf.middleware.ServerTimingMiddleware',
+    'corsheaders.middleware.CorsMiddleware',
+    'django.middleware.security.SecurityMiddleware',
+    'django.middleware.common.CommonMiddleware',
+]
+
+# Nothing is rendered from templates without the browsable API
+TEMPLATES = []
+
+AUTH_PASSWORD_VALIDATORS = []
+
+USE_I18N = False
+
+REST_FRAMEWORK = {
+    **REST_FRAMEWORK,
+    'DEFAULT_RENDERER_CLASSES': ['rdf.renderers.FastJSONRenderer'],
+}
+
+# Serve the panel route with a plain Django view, skipping DRF's request wrapping,
+# content negotiation and renderers
+PANEL_FAST_PATH = True
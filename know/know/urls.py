@@ -13,10 +13,14 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
-from django.contrib import admin
+from django.conf import settings
 from django.urls import path, include
 
 urlpatterns = [
-    path('admin/', admin.site.urls),
     path('', include('rdf.urls')),
 ]
+
+# The production settings don't install the admin
+if 'django.contrib.admin' in settings.INSTALLED_APPS:
+    from django.contrib import admin # pylint: disable=ungrouped-imports
+    urlpatterns.insert(0, path('admin/', admin.site.urls))
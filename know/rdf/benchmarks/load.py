@@ -0,0 +1,77 @@
+import time
+import random
+import itertools
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+import requests
+
+def zipf_workload(entity_ids: List[str], count: int, exponent: float = 1.1,
+                  seed: int = None) -> List[str]:
+    """ Returns count entity IDs drawn with a Zipfian distribution, where the n-th
+        entity is requested in proportion to 1 / n^exponent, like a few popular
+        entities getting most of the traffic
+    """
+    weights = [1 / rank ** exponent for rank in range(1, len(entity_ids) + 1)]
+    cumulative_weights = list(itertools.accumulate(weights))
+    generator = random.Random(seed)
+    return generator.choices(entity_ids, cum_weights=cumulative_weights, k=count)
+
+def percentile(sorted_values: list, percent: float) -> float:
+    """ Returns the nearest-rank percentile of values that are already sorted """
+    if not sorted_values:
+        return 0
+
+    rank = max(1, -(-len(sorted_values) * percent // 100)) # Rounded up
+    return sorted_values[int(rank) - 1]
+
+class LoadDriver:
+    """ Sends panel requests to a running server from `concurrency` threads, as fast
+        as it answers them, timing each one
+    """
+
+    def __init__(self, url: str, concurrency: int = 8, timeout: float = 30):
+        self.url = url
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self._local = threading.local() # Sessions aren't thread safe
+
+    def _get_session(self) -> requests.Session:
+        if not hasattr(self._local, 'session'):
+            self._local.session = requests.Session()
+
+        return self._local.session
+
+    def _request(self, uri: str) -> tuple:
+        started = time.perf_counter()
+        try:
+            response = self._get_session().get(
+                self.url, params={ 'uri': uri }, timeout=self.timeout
+            )
+            outcome = str(response.status_code)
+        except requests.RequestException as err:
+            outcome = type(err).__name__
+
+        return time.perf_counter() - started, outcome
+
+    def run(self, uris: List[str]) -> dict:
+        """ Requests the panel for each URI, returning the throughput, the latency
+            percentiles in milliseconds, and how many requests had each status
+        """
+        started = time.perf_counter()
+        with ThreadPoolExecutor(self.concurrency) as executor:
+            results = list(executor.map(self._request, uris))
+        elapsed = time.perf_counter() - started
+
+        latencies = sorted(latency * 1000 for latency, _ in results)
+        return {
+            'requests': len(results),
+            'seconds': elapsed,
+            'throughput': len(results) / elapsed if elapsed else 0,
+            'p50_ms': percentile(latencies, 50),
+            'p95_ms': percentile(latencies, 95),
+            'p99_ms': percentile(latencies, 99),
+            'max_ms': latencies[-1] if latencies else 0,
+            'statuses': dict(Counter(outcome for _, outcome in results)),
+        }
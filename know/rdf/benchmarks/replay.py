@@ -0,0 +1,120 @@
+import json
+import hashlib
+from pathlib import Path
+from contextlib import contextmanager
+from rdf.parser import wikidata_parser
+from rdf.parser.sparql_reader import read_sparql
+
+RECORDING_DIRECTORY = Path(__file__).resolve().parent / "recordings"
+
+class MissingRecordingException(Exception):
+    """ Raised when a query is made that there's no recorded response for """
+
+class RecordedResponse:
+    """ Stands in for a requests.Response of the Wikidata endpoint. The body is kept
+        encoded, so decoding it is part of whatever is being measured, like it would be
+    """
+
+    def __init__(self, body: bytes, status_code: int = 200):
+        self.content = body
+        self.status_code = status_code
+        self.headers = { 'Content-Type': 'application/sparql-results+json' }
+
+    def json(self) -> dict:
+        """ Decodes the body """
+        return json.loads(self.content)
+
+def _read_recordings(directory: Path):
+    for path in sorted(Path(directory).glob("*.json")):
+        yield json.loads(path.read_text(encoding="utf-8"))
+
+def load_recordings(directory: Path = RECORDING_DIRECTORY) -> dict:
+    """ Returns a dict of query to the encoded response recorded for it. Each recording
+        is a JSON file with the response, and either the query itself or the query's
+        file name and the entity ID bound to it, so they still match if the .sparql
+        files are edited
+    """
+    recordings = {}
+    for recording in _read_recordings(directory):
+        if 'query_file' in recording:
+            query = read_sparql(recording['query_file'], recording['entity_id'])
+        elif 'query' in recording:
+            query = recording['query']
+        else: # e.g. a VIAF cluster
+            continue
+
+        recordings[query] = json.dumps(recording['response']).encode("utf-8")
+
+    return recordings
+
+def load_viaf_recordings(directory: Path = RECORDING_DIRECTORY) -> dict:
+    """ Returns a dict of VIAF cluster ID to its recorded RDF/XML """
+    return {
+        recording['viaf_id']: recording['body'].encode("utf-8")
+        for recording in _read_recordings(directory) if 'viaf_id' in recording
+    }
+
+def recorded_entity_ids(directory: Path = RECORDING_DIRECTORY) -> list:
+    """ Returns the IDs of the entities with a recorded get_entity.sparql response """
+    return sorted({
+        recording['entity_id'] for recording in _read_recordings(directory)
+        if recording.get('query_file') == "get_entity.sparql"
+    })
+
+def save_query_recording(directory: Path, query: str, response: dict) -> Path:
+    """ Records the response to a query, named after its hash """
+    digest = hashlib.sha1(query.encode("utf-8")).hexdigest()[:16]
+    path = Path(directory) / f"query-{digest}.json"
+    path.write_text(
+        json.dumps({ 'query': query, 'response': response }, indent=1), encoding="utf-8"
+    )
+    return path
+
+def save_viaf_recording(directory: Path, viaf_id: str, body: bytes) -> Path:
+    """ Records a VIAF cluster's RDF/XML """
+    path = Path(directory) / f"viaf-{viaf_id}.json"
+    recording = { 'viaf_id': viaf_id, 'body': body.decode("utf-8") }
+    path.write_text(json.dumps(recording, indent=1), encoding="utf-8")
+    return path
+
+class ReplayHttpClient:
+    """ An http_client that answers Wikidata queries with recorded responses instead
+        of going over the network
+    """
+
+    def __init__(self, recordings: dict):
+        self.recordings = recordings
+        self.requests_sent = 0
+
+    def get(self, url: str, params: dict = None, **_) -> RecordedResponse:
+        """ Returns the recorded response for the query in params """
+        query = (params or {}).get('query')
+        if query not in self.recordings:
+            raise MissingRecordingException(f"No recorded response for {url} {query!r}")
+
+        self.requests_sent += 1
+        return RecordedResponse(self.recordings[query])
+
+class AsyncReplayHttpClient:
+    """ The async_http_client counterpart of ReplayHttpClient """
+
+    def __init__(self, client: ReplayHttpClient):
+        self.client = client
+
+    async def get(self, url: str, params: dict = None, **_) -> RecordedResponse:
+        """ Returns the recorded response for the query in params """
+        return self.client.get(url, params)
+
+@contextmanager
+def replay_wikidata(recordings: dict = None):
+    """ Answers every Wikidata query made inside the block, sync or async, with
+        recorded responses
+    """
+    client = ReplayHttpClient(load_recordings() if recordings is None else recordings)
+    original_clients = (wikidata_parser.http_client, wikidata_parser.async_http_client)
+    wikidata_parser.http_client = client
+    wikidata_parser.async_http_client = AsyncReplayHttpClient(client)
+    try:
+        yield client
+    finally:
+        wikidata_parser.http_client, wikidata_parser.async_http_client = original_clients
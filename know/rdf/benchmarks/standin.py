@@ -0,0 +1,164 @@
+import json
+import math
+import time
+import random
+import threading
+from functools import partial
+from pathlib import Path
+from typing import Callable
+from urllib.parse import urlsplit, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from rdf.parser.http_client import http_client
+from rdf.parser.wikidata_parser import WIKIDATA_ENDPOINT
+from rdf.parser.viaf_resolver import VIAF_URI_BASE
+from rdf.benchmarks.replay import (
+    RECORDING_DIRECTORY, load_recordings, load_viaf_recordings, save_query_recording,
+    save_viaf_recording
+)
+
+SPARQL_PATH = "/sparql"
+VIAF_PATH = "/viaf/"
+
+class InvalidLatencyException(Exception):
+    """ Raised when a latency distribution can't be parsed """
+
+def parse_latency(spec: str) -> Callable[[random.Random], float]:
+    """ Parses a latency distribution, returning a function that samples it in seconds:
+        - none
+        - fixed:SECONDS, e.g. fixed:0.2
+        - uniform:LOW,HIGH, e.g. uniform:0.05,0.5
+        - lognormal:MEDIAN,SIGMA, e.g. lognormal:0.3,0.8, which has the long tail that
+          Wikidata's latencies have
+    """
+    name, _, arguments = (spec or "none").partition(":")
+    try:
+        values = [float(value) for value in arguments.split(",")] if arguments else []
+    except ValueError as err:
+        raise InvalidLatencyException(f"Invalid latency {spec!r}") from err
+
+    if name == "none" and not values:
+        return lambda _: 0
+    if name == "fixed" and len(values) == 1:
+        return lambda _: values[0]
+    if name == "uniform" and len(values) == 2:
+        return lambda generator: generator.uniform(*values)
+    if name == "lognormal" and len(values) == 2 and values[0] > 0:
+        mu = math.log(values[0])
+        return lambda generator: generator.lognormvariate(mu, values[1])
+
+    raise InvalidLatencyException(f"Invalid latency {spec!r}")
+
+class StandinServer(ThreadingHTTPServer): # pylint: disable=too-many-instance-attributes
+    """ A local stand-in for the Wikidata SPARQL endpoint and VIAF, which answers with
+        recorded responses after a sampled latency, and fails a share of requests with
+        error_status. With `record` on, queries and clusters that haven't been recorded
+        are fetched from the real endpoints and recorded to recording_directory.
+
+        Point the WIKIDATA_ENDPOINT and VIAF_ENDPOINT settings at its /sparql and /viaf/
+    """
+    daemon_threads = True
+
+    # pylint: disable-next=too-many-arguments
+    def __init__(self, address: tuple, recording_directory: Path = RECORDING_DIRECTORY,
+                 *, latency: str = "none", error_rate: float = 0, error_status: int = 503,
+                 record: bool = False, seed: int = None):
+        super().__init__(address, StandinRequestHandler)
+        self.recording_directory = Path(recording_directory)
+        self.recordings = load_recordings(self.recording_directory)
+        self.viaf_recordings = load_viaf_recordings(self.recording_directory)
+        self.sample_latency = parse_latency(latency)
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.record = record
+        self._random = random.Random(seed)
+        self._lock = threading.Lock() # Random isn't thread safe, nor is recording
+        self.outcomes = { 'served': 0, 'failed': 0, 'missing': 0 }
+
+    def draw(self) -> tuple:
+        """ Returns how long to wait before responding, and whether to fail """
+        with self._lock:
+            delay = self.sample_latency(self._random)
+            fail = self._random.random() < self.error_rate
+
+        return delay, fail
+
+    def count(self, outcome: str):
+        """ Counts a request as served, failed or missing """
+        with self._lock:
+            self.outcomes[outcome] += 1
+
+    def get_sparql(self, query: str):
+        """ Returns the recorded (encoded) response to the query, recording it first if
+            recording is on. Returns None if there's no recording
+        """
+        if query not in self.recordings and self.record:
+            params = { 'format': 'json', 'query': query }
+            response = http_client.get(WIKIDATA_ENDPOINT, params)
+            if response.status_code == 200:
+                with self._lock:
+                    directory = self.recording_directory
+                    save_query_recording(directory, query, response.json())
+                    self.recordings[query] = response.content
+
+        return self.recordings.get(query)
+
+    def get_viaf(self, viaf_id: str):
+        """ Like get_sparql, but for a VIAF cluster's RDF/XML """
+        if viaf_id not in self.viaf_recordings and self.record:
+            response = http_client.get(
+                f"{VIAF_URI_BASE}{viaf_id}/", headers={ 'Accept': 'application/rdf+xml' }
+            )
+            if response.status_code == 200:
+                with self._lock:
+                    directory = self.recording_directory
+                    save_viaf_recording(directory, viaf_id, response.content)
+                    self.viaf_recordings[viaf_id] = response.content
+
+        return self.viaf_recordings.get(viaf_id)
+
+class StandinRequestHandler(BaseHTTPRequestHandler):
+    """ Serves GET /sparql?query=... and GET /viaf/<cluster ID>/ """
+    server: StandinServer
+    protocol_version = "HTTP/1.1" # Keep-alive, like the real endpoints
+
+    def do_GET(self): # pylint: disable=invalid-name
+        """ Answers with the recorded response """
+        url = urlsplit(self.path)
+        if url.path.rstrip("/") == SPARQL_PATH:
+            query = parse_qs(url.query).get('query', [""])[0]
+            content_type = "application/sparql-results+json"
+            get_body = partial(self.server.get_sparql, query)
+        elif url.path.startswith(VIAF_PATH):
+            viaf_id = url.path[len(VIAF_PATH):].strip("/")
+            content_type = "application/rdf+xml"
+            get_body = partial(self.server.get_viaf, viaf_id)
+        else:
+            self._respond(404, b"Not found", "text/plain")
+            return
+
+        delay, fail = self.server.draw()
+        time.sleep(delay)
+        if fail:
+            self.server.count('failed')
+            self._respond(self.server.error_status, b"Injected error", "text/plain")
+            return
+
+        body = get_body()
+        if body is None:
+            self.server.count('missing')
+            message = json.dumps({ 'error': "Nothing recorded for this request" })
+            self._respond(404, message.encode("utf-8"), "application/json")
+            return
+
+        self.server.count('served')
+        self._respond(200, body, content_type)
+
+    def _respond(self, status: int, body: bytes, content_type: str):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args): # pylint: disable=redefined-builtin
+        """ Requests aren't logged, as there are thousands of them in a load test """
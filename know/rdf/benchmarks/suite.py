@@ -0,0 +1,399 @@
+import gc
+import json
+import time
+import platform
+import itertools
+from statistics import median
+from typing import Callable, Iterable
+from wsgiref.util import setup_testing_defaults
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIHandler
+from rest_framework.renderers import JSONRenderer
+from rdf.renderers import FastJSONRenderer
+from rdf.benchmarks.replay import RECORDING_DIRECTORY, replay_wikidata
+from rdf.parser.panel_cache import panel_cache
+from rdf.parser.summarizer import Summarizer
+from rdf.parser.format_output import (
+    format_query, format_date_string, merge_property_rows
+)
+from rdf.parser.sparql_reader import read_sparql, read_sparql_values
+from rdf.parser.wikidata_parser import WikidataParser, get_entity_type_from_labels
+from rdf.parser.wikidata_formatter import (
+    format_landmark, format_country, format_book, format_person
+)
+
+DEFAULT_MIN_TIME = 0.05 # Seconds each sample should take, so timer overhead is noise
+DEFAULT_REPEAT = 7
+DEFAULT_THRESHOLD = 0.25 # How much slower than the baseline counts as a regression
+ENTITY_URIS = {
+    "person": "https://www.wikidata.org/wiki/Q23",
+    "country": "https://www.wikidata.org/wiki/Q142",
+    "book": "https://www.wikidata.org/wiki/Q8337",
+    "landmark": "https://www.wikidata.org/wiki/Q243",
+}
+
+# Benchmark name -> function that sets it up and returns the function to time
+BENCHMARKS = {}
+
+def benchmark(name: str):
+    """ Registers a benchmark. The decorated function does any setup, and returns the
+        function that's timed
+    """
+    def register(setup: Callable[[], Callable[[], object]]):
+        BENCHMARKS[name] = setup
+        return setup
+
+    return register
+
+def _load_response(name: str) -> dict:
+    recording = json.loads((RECORDING_DIRECTORY / f"{name}.json").read_text("utf-8"))
+    return recording['response']
+
+def _literal(value: str) -> dict:
+    return { "xml:lang": "en", "type": "literal", "value": value }
+
+def _date(value: str) -> dict:
+    return {
+        "datatype": "http://www.w3.org/2001/XMLSchema#dateTime",
+        "type": "literal",
+        "value": value,
+    }
+
+def _entity(column: str, entity_id: str, label: str) -> dict:
+    return {
+        column: { "type": "uri", "value": f"http://www.wikidata.org/entity/{entity_id}" },
+        f"{column}Label": _literal(label),
+    }
+
+def _explode(row: dict, **columns: list) -> dict:
+    """ Returns a response with a row for every combination of the columns' cells, like
+        Wikidata returns for entities with many values for several OPTIONALs (which the
+        queries used to have)
+    """
+    rows = []
+    for cells in itertools.product(*columns.values()):
+        exploded = dict(row)
+        for cell in cells:
+            exploded.update(cell)
+        rows.append(exploded)
+
+    return { "results": { "bindings": rows } }
+
+def _union(row: dict, **columns: list) -> dict:
+    """ Returns the response the queries return for the same values as _explode does:
+        a row for the name and description, one for each of the row's other columns,
+        and one for each of the columns' cells
+    """
+    exploded_columns = { column for cells in columns.values() for cell in cells
+                         for column in cell }
+    rows = [{ column: cell for column, cell in row.items()
+              if column in ("name", "description") }]
+    rows.extend(
+        { column: cell } for column, cell in row.items()
+        if column not in exploded_columns and column not in rows[0]
+    )
+    rows.extend(cell for cells in columns.values() for cell in cells)
+    return { "results": { "bindings": rows } }
+
+def _first_row(name: str) -> dict:
+    """ Returns a row with the first value of each of the recorded response's columns """
+    return merge_property_rows(_load_response(name)['results']['bindings'])[0]
+
+def _person_values() -> tuple:
+    # 2 birth dates x 2 death dates x 3 spouses x 3 nationalities x 20 occupations
+    return _first_row("get_person-Q23"), {
+        "birth": [{ "birthDate": _date(f"17{year}-02-22T00:00:00Z") }
+                  for year in (31, 32)],
+        "death": [{ "deathDate": _date(f"1799-12-{day}T00:00:00Z") } for day in (13, 14)],
+        "spouse": [_entity("spouse", f"Q{100 + i}", f"Spouse {i}") for i in range(3)],
+        "nationality": [_entity("nationality", f"Q{200 + i}", f"Country {i}")
+                        for i in range(3)],
+        "occupation": [{ "occupationLabel": _literal(f"Occupation {i}") }
+                       for i in range(20)],
+    }
+
+def _country_values() -> tuple:
+    # 4 populations x 3 areas x 4 heads of government x 2 heads of state x 5 capitals
+    return _first_row("get_country-Q142"), {
+        "population": [{ "population": _literal(str(60000000 + i)) } for i in range(4)],
+        "area": [{ "areaKmSquared": _literal(str(550000 + i)) } for i in range(3)],
+        "head_of_gov": [_entity("headOfGov", f"Q{300 + i}", f"Head {i}")
+                        for i in range(4)],
+        "head_of_state": [_entity("headOfState", f"Q{400 + i}", f"State {i}")
+                          for i in range(2)],
+        "capital": [{ "capitalLabel": _literal(f"Capital {i}") } for i in range(5)],
+    }
+
+def _exploded_person() -> dict:
+    row, columns = _person_values()
+    return _explode(row, **columns)
+
+def _union_person() -> dict:
+    row, columns = _person_values()
+    return _union(row, **columns)
+
+def _exploded_country() -> dict:
+    row, columns = _country_values()
+    return _explode(row, **columns)
+
+def _union_country() -> dict:
+    row, columns = _country_values()
+    return _union(row, **columns)
+
+@benchmark("format/landmark-small")
+def _format_landmark_small():
+    response = _load_response("get_landmark-Q243")
+    return lambda: format_landmark(response)
+
+@benchmark("format/person-medium")
+def _format_person_medium():
+    response = _load_response("get_person-Q23")
+    return lambda: format_person(response)
+
+@benchmark("format/book-medium")
+def _format_book_medium():
+    response = _load_response("get_book-Q8337")
+    return lambda: format_book(response)
+
+@benchmark("format/person-exploded")
+def _format_person_exploded():
+    response = _exploded_person()
+    return lambda: format_person(response)
+
+@benchmark("format/country-exploded")
+def _format_country_exploded():
+    response = _exploded_country()
+    return lambda: format_country(response)
+
+@benchmark("format/person-union")
+def _format_person_union():
+    response = _union_person()
+    return lambda: format_person(response)
+
+@benchmark("format/country-union")
+def _format_country_union():
+    response = _union_country()
+    return lambda: format_country(response)
+
+def _decode_format(response: dict, formatter: Callable[[dict], dict]):
+    """ Decoding the response as well as formatting it, which is where the size of the
+        response shows up
+    """
+    body = json.dumps(response).encode("utf-8")
+    return lambda: formatter(json.loads(body))
+
+benchmark("decode_format/person-exploded")(
+    lambda: _decode_format(_exploded_person(), format_person)
+)
+benchmark("decode_format/person-union")(
+    lambda: _decode_format(_union_person(), format_person)
+)
+benchmark("decode_format/country-exploded")(
+    lambda: _decode_format(_exploded_country(), format_country)
+)
+benchmark("decode_format/country-union")(
+    lambda: _decode_format(_union_country(), format_country)
+)
+
+@benchmark("render/person-exploded-json")
+def _render_person_exploded_json():
+    panel = format_person(_exploded_person())
+    return lambda: JSONRenderer().render(panel)
+
+@benchmark("render/person-exploded-fast")
+def _render_person_exploded_fast():
+    panel = format_person(_exploded_person())
+    return lambda: FastJSONRenderer().render(panel)
+
+@benchmark("format_query/person-medium")
+def _format_query_person_medium():
+    response = _load_response("get_person-Q23")
+    translations = { "birthDate": "Born", "occupationLabel": "Occupation",
+                     "spouseLabel": "Spouse" }
+    links = { "spouseLabel": "spouse" }
+    def special_format(val: str, key: str) -> str:
+        return format_date_string(val) if key == "birthDate" else val
+
+    return lambda: format_query(response, translations, links, special_format)
+
+def _dates() -> list:
+    return [
+        f"{year:04d}-{month:02d}-{day:02d}T00:00:00Z"
+        for year, month, day in zip(range(1500, 1700), itertools.cycle(range(1, 13)),
+                                    itertools.cycle(range(1, 29)))
+    ]
+
+@benchmark("format_date_string/cached")
+def _format_date_string_cached():
+    dates = _dates()
+    return lambda: [format_date_string(date) for date in dates]
+
+@benchmark("format_date_string/uncached")
+def _format_date_string_uncached():
+    dates = _dates()
+    parse_date = format_date_string.__wrapped__
+    return lambda: [parse_date(date) for date in dates]
+
+@benchmark("read_sparql/get_person")
+def _read_sparql_person():
+    return lambda: read_sparql("get_person.sparql", "Q23")
+
+@benchmark("read_sparql_values/get_people-50")
+def _read_sparql_values_people():
+    entity_ids = [f"Q{i}" for i in range(1, 51)]
+    return lambda: read_sparql_values("get_people.sparql", entity_ids)
+
+@benchmark("get_entity_type/labels")
+def _get_entity_type_labels():
+    bindings = [
+        _load_response(f"get_instance-{entity_id}")['results']['bindings']
+        for entity_id in ("Q23", "Q142", "Q8337", "Q243")
+    ]
+    return lambda: [get_entity_type_from_labels(labels) for labels in bindings]
+
+@benchmark("get_entity_type/replayed")
+def _get_entity_type_replayed():
+    return lambda: WikidataParser(ENTITY_URIS["country"]).get_entity_type()
+
+def _summarize_cold(uri: str):
+    def summarize():
+        panel_cache.clear()
+        return Summarizer(uri).summarize()
+
+    return summarize
+
+for _entity_type, _uri in ENTITY_URIS.items():
+    benchmark(f"summarize/{_entity_type}-cold")(lambda uri=_uri: _summarize_cold(uri))
+
+@benchmark("summarize/person-cached")
+def _summarize_cached():
+    panel_cache.clear()
+    Summarizer(ENTITY_URIS["person"]).summarize()
+    return lambda: Summarizer(ENTITY_URIS["person"]).summarize()
+
+def _allowed_host() -> str:
+    hosts = [host for host in settings.ALLOWED_HOSTS if "*" not in host]
+    return hosts[0] if hosts else "localhost" # Which DEBUG allows too
+
+@benchmark("request/panel-cached")
+def _request_cached():
+    """ A cached panel through the whole WSGI handler, i.e. the middleware, routing and
+        view, which is what the settings (e.g. settings_production.py) change
+    """
+    handler = WSGIHandler()
+    environ = {
+        "PATH_INFO": "/", "QUERY_STRING": f"uri={ENTITY_URIS['person']}",
+        "HTTP_HOST": _allowed_host(), "HTTP_ACCEPT": "*/*",
+    }
+    setup_testing_defaults(environ)
+    def request():
+        response = handler(dict(environ), lambda status, headers: None)
+        return b"".join(response)
+
+    panel_cache.clear()
+    request()
+    return request
+
+def measure(function: Callable[[], object], min_time: float = DEFAULT_MIN_TIME,
+            repeat: int = DEFAULT_REPEAT) -> dict:
+    """ Times the function like timeit does: it's called in a loop that's made long
+        enough to take min_time, with the garbage collector off, and the loop is
+        timed repeat times. Returns the per call times in microseconds
+    """
+    def time_loop(loops: int) -> float:
+        started = time.perf_counter()
+        for _ in range(loops):
+            function()
+        return time.perf_counter() - started
+
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        loops = 1
+        while time_loop(loops) < min_time:
+            loops *= 2
+        samples = [time_loop(loops) / loops * 1e6 for _ in range(repeat)]
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+    return {
+        "median_us": round(median(samples), 3),
+        "min_us": round(min(samples), 3),
+        "loops": loops,
+        "repeat": repeat,
+    }
+
+def _calibration_workload():
+    """ Plain dict, string and list work that none of our changes affect, timed with
+        every run to tell how fast the machine was
+    """
+    words = { str(number): number for number in range(200) }
+    return sorted(words, key=lambda word: (len(word), words[word]))
+
+def run_benchmarks(names: Iterable[str] = None, min_time: float = DEFAULT_MIN_TIME,
+                   repeat: int = DEFAULT_REPEAT) -> dict:
+    """ Runs the benchmarks (all of them by default) against the recorded Wikidata
+        responses, and returns the results in the format of the baseline file
+    """
+    results = {}
+    calibration = measure(_calibration_workload, min_time, repeat)['min_us']
+    with replay_wikidata():
+        for name in names or BENCHMARKS:
+            results[name] = measure(BENCHMARKS[name](), min_time, repeat)
+        panel_cache.clear()
+    # And again, in case the machine got faster or slower while they were running
+    calibration = min(
+        calibration, measure(_calibration_workload, min_time, repeat)['min_us']
+    )
+
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "calibration_us": calibration,
+        },
+        "benchmarks": results,
+    }
+
+def compare_results(baseline: dict, current: dict,
+                    threshold: float = DEFAULT_THRESHOLD) -> list:
+    """ Compares the fastest times of the benchmarks in both results, as they're the
+        least affected by whatever else the machine was doing. The baseline times are
+        scaled by how much faster or slower the calibration workload ran, so results
+        from a different machine (or a throttled one) can still be compared.
+
+        Returns a list of (name, baseline µs, current µs, ratio, regressed) for each
+        benchmark in both, where regressed means it's more than threshold (e.g. 0.2 for
+        20%) slower
+    """
+    speed = 1
+    baseline_calibration = baseline['meta'].get('calibration_us')
+    current_calibration = current['meta'].get('calibration_us')
+    if baseline_calibration and current_calibration:
+        speed = current_calibration / baseline_calibration
+
+    comparison = []
+    for name, result in current['benchmarks'].items():
+        if name not in baseline['benchmarks']:
+            continue
+
+        baseline_time = baseline['benchmarks'][name]['min_us'] * speed
+        ratio = result['min_us'] / baseline_time if baseline_time else 1
+        comparison.append(
+            (name, baseline_time, result['min_us'], ratio, ratio > 1 + threshold)
+        )
+
+    return comparison
+
+def comparison_report(comparison: list) -> str:
+    """ Formats the output of compare_results as a table """
+    lines = [f"{'benchmark':<36}{'baseline':>12}{'current':>12}{'change':>9}"]
+    for name, baseline_time, current_time, ratio, regressed in comparison:
+        lines.append(
+            f"{name:<36}{baseline_time:>10.1f}µs{current_time:>10.1f}µs"
+            f"{ratio - 1:>+9.0%}{'  REGRESSION' if regressed else ''}"
+        )
+
+    return "\n".join(lines)
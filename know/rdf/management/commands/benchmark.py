@@ -0,0 +1,58 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from rdf.benchmarks.suite import (
+    BENCHMARKS, DEFAULT_MIN_TIME, DEFAULT_REPEAT, DEFAULT_THRESHOLD, run_benchmarks,
+    compare_results, comparison_report
+)
+
+class Command(BaseCommand):
+    """ Runs the benchmarks in rdf/benchmarks/suite.py against recorded Wikidata
+        responses, so no network is needed.
+        Execute it like python manage.py benchmark --output results.json
+        or python manage.py benchmark --compare rdf/benchmarks/baseline.json
+    """
+
+    def add_arguments(self, parser):
+        """ Adds arguments to the command """
+        parser.add_argument(
+            '--output', '-o', type=str, help="write the results to this JSON file"
+        )
+        parser.add_argument(
+            '--compare', '-c', type=str, help="baseline JSON file to compare against"
+        )
+        parser.add_argument(
+            '--threshold', '-t', type=float, default=DEFAULT_THRESHOLD,
+            help="how much slower than the baseline is a regression, e.g. 0.2 for 20%%"
+        )
+        parser.add_argument(
+            '--filter', '-k', type=str, default="",
+            help="only run the benchmarks whose names contain this"
+        )
+        parser.add_argument('--min-time', type=float, default=DEFAULT_MIN_TIME)
+        parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT)
+
+    def handle(self, *_, **options):
+        """ Run the benchmarks """
+        names = [name for name in BENCHMARKS if options['filter'] in name]
+        if not names:
+            raise CommandError(f"no benchmarks match {options['filter']!r}")
+
+        results = run_benchmarks(names, options['min_time'], options['repeat'])
+        for name, result in results['benchmarks'].items():
+            print(f"{name:<36}{result['min_us']:>10.1f}µs "
+                  f"(median {result['median_us']:.1f}µs, {result['loops']} loops)")
+
+        if options['output']:
+            with open(options['output'], "w", encoding="utf-8") as output:
+                json.dump(results, output, indent=2)
+                output.write("\n")
+
+        if options['compare']:
+            with open(options['compare'], encoding="utf-8") as baseline_file:
+                baseline = json.load(baseline_file)
+
+            comparison = compare_results(baseline, results, options['threshold'])
+            print(comparison_report(comparison))
+            regressions = [name for name, *_, regressed in comparison if regressed]
+            if regressions:
+                raise CommandError(f"{len(regressions)} benchmarks regressed")
@@ -0,0 +1,33 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from rdf.parser.viaf_crosswalk import build_crosswalk, SORT_CHUNK_SIZE
+
+class Command(BaseCommand):
+    """ Builds the VIAF crosswalk index (see rdf/parser/viaf_crosswalk.py) from VIAF's
+        cluster links file, e.g. viaf-20240101-links.txt.gz from
+        https://viaf.org/viaf/data/
+        Execute it like python manage.py build_viaf_crosswalk viaf-20240101-links.txt.gz
+    """
+
+    def add_arguments(self, parser):
+        """ Adds arguments to the command """
+        parser.add_argument('links', type=str, help="path to the VIAF cluster links file")
+        parser.add_argument(
+            '--output', '-o', type=str, help="where to write it (VIAF_CROSSWALK_PATH)"
+        )
+        parser.add_argument(
+            '--chunk-size', '-c', type=int, default=SORT_CHUNK_SIZE,
+            help="how many links are sorted in memory at a time"
+        )
+
+    def handle(self, *_, **options):
+        """ Build the index """
+        output = options['output'] or getattr(settings, 'VIAF_CROSSWALK_PATH', None)
+        if not output:
+            raise CommandError("please pass --output or set VIAF_CROSSWALK_PATH")
+
+        started = time.monotonic()
+        count = build_crosswalk(options['links'], str(output), options['chunk_size'])
+        elapsed = time.monotonic() - started
+        print(f"Wrote {count} VIAF clusters to {output} in {elapsed:.1f}s")
@@ -0,0 +1,34 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from rdf.benchmarks.suite import DEFAULT_THRESHOLD, compare_results, comparison_report
+
+class Command(BaseCommand):
+    """ Compares two results files written by the benchmark command, and fails if any
+        benchmark got slower by more than the threshold.
+        Execute it like
+        python manage.py compare_benchmarks rdf/benchmarks/baseline.json results.json
+    """
+
+    def add_arguments(self, parser):
+        """ Adds arguments to the command """
+        parser.add_argument('baseline', type=str, help="the results to compare against")
+        parser.add_argument('current', type=str, help="the new results")
+        parser.add_argument(
+            '--threshold', '-t', type=float, default=DEFAULT_THRESHOLD,
+            help="how much slower than the baseline is a regression, e.g. 0.2 for 20%%"
+        )
+
+    def handle(self, *_, **options):
+        """ Compare the results """
+        with open(options['baseline'], encoding="utf-8") as baseline_file:
+            baseline = json.load(baseline_file)
+        with open(options['current'], encoding="utf-8") as current_file:
+            current = json.load(current_file)
+
+        comparison = compare_results(baseline, current, options['threshold'])
+        print(comparison_report(comparison))
+        regressions = [name for name, *_, regressed in comparison if regressed]
+        if regressions:
+            raise CommandError(
+                f"{len(regressions)} benchmarks regressed: {', '.join(regressions)}"
+            )
@@ -0,0 +1,117 @@
+import os
+import time
+from collections import deque
+from itertools import islice
+from multiprocessing import Pool
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from rdf.parser.panel_store import PanelStore
+from rdf.parser.wikidata_dump import (
+    iter_dump_lines, extract_lines, extract_labels, get_line_entity_id, get_linked_ids
+)
+
+PROGRESS_INTERVAL = 10 # Seconds between progress reports
+
+def _batches(lines, batch_size: int):
+    """ Groups the lines into lists of batch_size """
+    while True:
+        batch = list(islice(lines, batch_size))
+        if not batch:
+            return
+        yield batch
+
+class Command(BaseCommand):
+    """ Builds the local panel store (see rdf/parser/panel_store.py) from a Wikidata
+        JSON dump, e.g. latest-all.json.gz from
+        https://dumps.wikimedia.org/wikidatawiki/entities/
+        Execute it like python manage.py ingest_wikidata_dump latest-all.json.gz
+
+        The dump is decompressed and read one line at a time, and batches of lines are
+        decoded by a pool of worker processes. Only a few batches are in flight at once,
+        so memory use stays the same no matter how big the dump is (apart from the IDs
+        of the linked entities).
+
+        It's read twice: first for the entities we make panels for, and then for the
+        labels of just the entities they link to, which are a small share of the dump.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.workers = 1
+        self.batch_size = 1000
+
+    def add_arguments(self, parser):
+        """ Adds arguments to the command """
+        parser.add_argument('dump', type=str, help="path to a .json.gz or .json.bz2 dump")
+        parser.add_argument(
+            '--store', '-s', type=str, help="where to write the store (PANEL_STORE_PATH)"
+        )
+        parser.add_argument(
+            '--workers', '-w', type=int, default=os.cpu_count(),
+            help="how many processes decode the dump"
+        )
+        parser.add_argument(
+            '--batch-size', '-b', type=int, default=1000,
+            help="how many entities each worker decodes at a time"
+        )
+
+    def handle(self, *_, **options):
+        """ Ingest the dump """
+        store_path = options['store'] or getattr(settings, 'PANEL_STORE_PATH', None)
+        if not store_path:
+            raise CommandError("please pass --store or set PANEL_STORE_PATH")
+
+        store = PanelStore(store_path)
+        store.create_tables()
+        self.workers = max(1, options['workers'])
+        self.batch_size = options['batch_size']
+        linked_ids = set()
+
+        def add_entities(extracted: list):
+            store.add_entities(extracted)
+            for _, __, ___, fields in extracted:
+                linked_ids.update(get_linked_ids(fields))
+
+        with Pool(self.workers) as pool:
+            lines = iter_dump_lines(options['dump'])
+            self._ingest(pool, lines, extract_lines, add_entities, "entities")
+
+            lines = (
+                line for line in iter_dump_lines(options['dump'])
+                if get_line_entity_id(line) in linked_ids
+            )
+            self._ingest(pool, lines, extract_labels, store.add_labels, "labels")
+
+        print(f"The store at {store_path} has {store.count()} panels")
+
+    def _ingest(self, pool: Pool, lines, extract, add, name: str):
+        """ Extracts batches of the lines in the pool, adding what's extracted from each
+            to the store in the order they were read
+        """
+        started = time.monotonic()
+        last_report = started
+        ingested = 0
+        pending = deque()
+        for batch in _batches(lines, self.batch_size):
+            pending.append(pool.apply_async(extract, (batch,)))
+            # Wait on the oldest batch, so the dump isn't read faster than it's
+            # written and batches don't pile up in memory
+            if len(pending) >= self.workers * 2:
+                extracted = pending.popleft().get()
+                add(extracted)
+                ingested += len(extracted)
+
+            if time.monotonic() - last_report >= PROGRESS_INTERVAL:
+                last_report = time.monotonic()
+                self._report(ingested, last_report - started, name)
+
+        while pending:
+            extracted = pending.popleft().get()
+            add(extracted)
+            ingested += len(extracted)
+
+        self._report(ingested, time.monotonic() - started, name)
+
+    def _report(self, ingested: int, elapsed: float, name: str):
+        rate = ingested / elapsed if elapsed else 0
+        print(f"Ingested {ingested} {name} in {elapsed:.1f}s ({rate:.0f} {name}/sec)")
@@ -0,0 +1,59 @@
+from django.core.management.base import BaseCommand, CommandError
+from rdf.benchmarks.load import LoadDriver, zipf_workload
+from rdf.benchmarks.replay import recorded_entity_ids
+
+WIKIDATA_URI_BASE = "https://www.wikidata.org/wiki/"
+
+class Command(BaseCommand):
+    """ Load tests a running server's panel route (get_knowledge_panel_data) with a
+        Zipfian workload of Wikidata entities, and reports the throughput and latency
+        percentiles. Run it against a server whose WIKIDATA_ENDPOINT is the stand-in
+        from `python manage.py sparql_standin`, so results are reproducible.
+        Execute it like python manage.py load_test --url http://localhost:8000/ -n 2000
+    """
+
+    def add_arguments(self, parser):
+        """ Adds arguments to the command """
+        parser.add_argument('--url', '-u', type=str, default="http://localhost:8000/")
+        parser.add_argument('--requests', '-n', type=int, default=1000)
+        parser.add_argument('--concurrency', '-c', type=int, default=8)
+        parser.add_argument(
+            '--entities', type=str,
+            help="comma separated QIDs, most popular first (by default the recorded ones)"
+        )
+        parser.add_argument(
+            '--entities-file', type=str,
+            help="file with a QID on each line, most popular first"
+        )
+        parser.add_argument(
+            '--zipf', '-s', type=float, default=1.1,
+            help="exponent of the Zipf distribution"
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--timeout', type=float, default=30)
+
+    def handle(self, *_, **options):
+        """ Run the load test """
+        if options['entities_file']:
+            with open(options['entities_file'], encoding="utf-8") as entities_file:
+                entity_ids = [line.strip() for line in entities_file if line.strip()]
+        elif options['entities']:
+            entity_ids = [entity.strip() for entity in options['entities'].split(",")]
+        else:
+            entity_ids = recorded_entity_ids()
+
+        if not entity_ids:
+            raise CommandError("no entities to request")
+
+        workload = zipf_workload(
+            entity_ids, options['requests'], options['zipf'], options['seed']
+        )
+        driver = LoadDriver(options['url'], options['concurrency'], options['timeout'])
+        results = driver.run([WIKIDATA_URI_BASE + entity_id for entity_id in workload])
+
+        print(f"{results['requests']} requests in {results['seconds']:.2f}s "
+              f"({results['throughput']:.1f} requests/sec, "
+              f"{options['concurrency']} concurrent)")
+        print(f"Latency: p50 {results['p50_ms']:.1f}ms, p95 {results['p95_ms']:.1f}ms, "
+              f"p99 {results['p99_ms']:.1f}ms, max {results['max_ms']:.1f}ms")
+        print(f"Statuses: {results['statuses']}")
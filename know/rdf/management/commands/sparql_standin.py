@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand, CommandError
+from rdf.benchmarks.replay import RECORDING_DIRECTORY
+from rdf.benchmarks.standin import StandinServer, InvalidLatencyException
+
+class Command(BaseCommand):
+    """ Runs a local stand-in for the Wikidata SPARQL endpoint and VIAF, which answers
+        with the responses recorded in rdf/benchmarks/recordings (see
+        rdf/benchmarks/standin.py). Point WIKIDATA_ENDPOINT at
+        http://localhost:8001/sparql and VIAF_ENDPOINT at http://localhost:8001/viaf/
+        to use it.
+        Execute it like python manage.py sparql_standin --latency lognormal:0.3,0.8
+    """
+
+    def add_arguments(self, parser):
+        """ Adds arguments to the command """
+        parser.add_argument('--host', type=str, default="127.0.0.1")
+        parser.add_argument('--port', '-p', type=int, default=8001)
+        parser.add_argument(
+            '--recordings', '-r', type=str, default=str(RECORDING_DIRECTORY),
+            help="directory of recorded responses"
+        )
+        parser.add_argument(
+            '--latency', '-l', type=str, default="none",
+            help="none, fixed:SECONDS, uniform:LOW,HIGH or lognormal:MEDIAN,SIGMA"
+        )
+        parser.add_argument(
+            '--error-rate', '-e', type=float, default=0,
+            help="share of requests that fail, e.g. 0.05"
+        )
+        parser.add_argument('--error-status', type=int, default=503)
+        parser.add_argument(
+            '--record', action='store_true',
+            help="fetch and record anything that hasn't been recorded yet"
+        )
+        parser.add_argument('--seed', type=int, help="seed for latencies and errors")
+
+    def handle(self, *_, **options):
+        """ Serve until interrupted """
+        try:
+            server = StandinServer(
+                (options['host'], options['port']), options['recordings'],
+                latency=options['latency'], error_rate=options['error_rate'],
+                error_status=options['error_status'], record=options['record'],
+                seed=options['seed'],
+            )
+        except InvalidLatencyException as err:
+            raise CommandError(str(err)) from err
+
+        host, port = server.server_address[:2]
+        print(f"Replaying {len(server.recordings)} queries and "
+              f"{len(server.viaf_recordings)} VIAF clusters on http://{host}:{port}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            print(f"Requests: {server.outcomes}")
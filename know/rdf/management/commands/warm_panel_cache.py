@@ -0,0 +1,116 @@
+import os
+import sys
+import time
+from functools import partial
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand, CommandError
+from rdf.parser.summarizer import Summarizer
+from rdf.parser.http_client import http_client
+from rdf.parser.panel_cache import panel_cache, panel_refresher
+from rdf.parser.cache_warmer import CacheWarmer, WarmCheckpoint, read_warm_targets
+
+PROGRESS_INTERVAL = 5 # Seconds between progress reports
+
+def request_panel(url: str, uri: str) -> bool:
+    """ Warms the panel in the cache of the server at url """
+    return http_client.get(url, { 'uri': uri }).status_code == 200
+
+def summarize(uri: str) -> bool:
+    """ Warms the panel in this process' panel cache """
+    return Summarizer(uri).summarize() is not None
+
+class Command(BaseCommand):
+    """ Warms the panel cache with the entities in a file, e.g. after a deploy or a
+        cache flush, so the first users of popular entities don't wait on Wikidata.
+        The file can have a URI or Wikidata ID on each line, or be an access log, in
+        which case the most requested entities are warmed first.
+        Execute it like python manage.py warm_panel_cache access.log --top 1000
+
+        Panels are summarized in this process, which only helps if PANEL_CACHE_ALIAS is
+        a shared cache (e.g. memcached). Pass --url to warm a running server instead.
+        Warmed entities are appended to the --checkpoint file, so if the warm is
+        interrupted, running the same command again carries on where it stopped.
+    """
+
+    def add_arguments(self, parser):
+        """ Adds arguments to the command """
+        parser.add_argument(
+            'source', type=str,
+            help="file of URIs or QIDs, or an access log (- for stdin)"
+        )
+        parser.add_argument(
+            '--url', '-u', type=str,
+            help="warm the server at this URL through its panel route, e.g. "
+                 "http://localhost:8000/"
+        )
+        parser.add_argument('--concurrency', '-c', type=int, default=4)
+        parser.add_argument(
+            '--rate', '-r', type=float, default=5,
+            help="most entities started a second (0 for no limit)"
+        )
+        parser.add_argument('--top', '-n', type=int, help="only the N most requested")
+        parser.add_argument(
+            '--checkpoint', type=str,
+            help="where to record warmed entities (SOURCE.warmed by default)"
+        )
+        parser.add_argument(
+            '--restart', action='store_true', help="forget the checkpoint and start over"
+        )
+
+    def handle(self, *_, **options):
+        """ Warm the cache """
+        source = options['source']
+        if source == "-":
+            uris = read_warm_targets(sys.stdin)
+        elif os.path.exists(source):
+            with open(source, encoding="utf-8", errors="replace") as source_file:
+                uris = read_warm_targets(source_file)
+        else:
+            raise CommandError(f"{source} doesn't exist")
+
+        if options['top']:
+            uris = uris[:options['top']]
+
+        checkpoint_path = options['checkpoint']
+        if not checkpoint_path and source != "-":
+            checkpoint_path = source + ".warmed"
+        if options['restart'] and checkpoint_path and os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+
+        if options['url']:
+            warm = partial(request_panel, options['url'])
+        else:
+            if isinstance(panel_cache.backend, LocMemCache):
+                print("Warning: PANEL_CACHE_ALIAS is an in-process cache, so these "
+                      "panels are only cached until this command exits. Pass --url to "
+                      "warm a running server")
+            warm = summarize
+
+        last_report = time.monotonic()
+        def report(stats: dict):
+            nonlocal last_report
+            if time.monotonic() - last_report >= PROGRESS_INTERVAL:
+                last_report = time.monotonic()
+                self._report(stats)
+
+        checkpoint = WarmCheckpoint(checkpoint_path)
+        warmer = CacheWarmer(
+            warm, options['concurrency'], options['rate'], checkpoint, report
+        )
+        try:
+            stats = warmer.run(uris)
+        except KeyboardInterrupt:
+            self._report(warmer.stats())
+            raise CommandError("Interrupted, run the command again to resume") from None
+
+        panel_refresher.wait()
+        self._report(stats)
+        if stats['failed']:
+            print(f"{stats['failed']} entities couldn't be warmed, run the command again "
+                  f"to retry them")
+
+    def _report(self, stats: dict):
+        finished = stats['skipped'] + stats['warmed'] + stats['failed']
+        print(f"{finished}/{stats['total']} entities: {stats['warmed']} warmed, "
+              f"{stats['failed']} failed, {stats['skipped']} already warmed "
+              f"({stats['throughput']:.1f} entities/sec over {stats['seconds']:.1f}s)")
@@ -19,10 +19,18 @@ class AbstractParser(ABC):
     def parse(self) -> dict:
         """Calls other parse functions depending on the entity type"""
 
+    @abstractmethod
+    async def aparse(self) -> dict:
+        """ Async version of parse, for use in async views """
+
     @abstractmethod
     def get_entity_type(self) -> str:
         """ Retrieves the entity type."""
 
+    @abstractmethod
+    async def aget_entity_type(self) -> str:
+        """ Async version of get_entity_type """
+
     @abstractmethod
     def parse_person(self) -> dict:
         """ Parse a person """
@@ -38,3 +46,19 @@ class AbstractParser(ABC):
     @abstractmethod
     def parse_landmark(self) -> dict:
         """ Parse a landmark """
+
+    @abstractmethod
+    async def aparse_person(self) -> dict:
+        """ Async version of parse_person """
+
+    @abstractmethod
+    async def aparse_book(self) -> dict:
+        """ Async version of parse_book """
+
+    @abstractmethod
+    async def aparse_country(self) -> dict:
+        """ Async version of parse_country """
+
+    @abstractmethod
+    async def aparse_landmark(self) -> dict:
+        """ Async version of parse_landmark """
@@ -0,0 +1,223 @@
+import os
+import re
+import time
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Callable, Iterable, List, Union
+from urllib.parse import urlsplit, parse_qs
+from rdf.parser.panel_cache import canonical_entity_key, viaf_alias_key
+
+WIKIDATA_URI_BASE = "https://www.wikidata.org/wiki/"
+BARE_ENTITY_ID = re.compile(r'^Q[0-9]+$')
+# The request and status of a line in the common/combined log format, which is what
+# gunicorn, nginx and Django's runserver write, e.g. "GET /?uri=... HTTP/1.1" 200 512
+ACCESS_LOG_REQUEST = re.compile(r'"(?:GET|HEAD) (\S+)[^"]*" (\d{3})')
+FAILURES_BEFORE_PAUSE = 5 # Failures in a row that mean upstream is struggling
+FAILURE_PAUSE = 30 # Seconds to stop warming for, like the Wikidata circuit breaker
+
+def parse_warm_target(line: str) -> Union[str, None]:
+    """ Returns the URI to warm from a line of a URI list or an access log:
+        - a URI, e.g. https://www.wikidata.org/wiki/Q23 or http://viaf.org/viaf/31432428
+        - a Wikidata ID, e.g. Q23
+        - an access log line for the panel route, e.g. "GET /?uri=<URI> HTTP/1.1" 200
+        Returns None for blank lines, comments, and requests that weren't for a panel or
+        didn't succeed
+    """
+    line = line.strip()
+    if not line or line.startswith("#"):
+        return None
+
+    if BARE_ENTITY_ID.match(line):
+        return WIKIDATA_URI_BASE + line
+
+    match = ACCESS_LOG_REQUEST.search(line)
+    if match:
+        path, status = match.groups()
+        uris = parse_qs(urlsplit(path).query).get('uri')
+        return uris[0] if uris and status.startswith("2") else None
+
+    return line if "://" in line else None
+
+def warm_key(uri: str) -> str:
+    """ Returns the key the URI's entity is tracked under, so that different URIs for
+        the same entity are only warmed once
+    """
+    if 'wikidata' in uri:
+        return canonical_entity_key(uri) or uri
+    if 'viaf' in uri:
+        return viaf_alias_key(uri) or uri
+
+    return uri
+
+def read_warm_targets(lines: Iterable[str]) -> List[str]:
+    """ Returns the URIs to warm from the lines of a URI list or access log, one per
+        entity, with the most requested first (and otherwise in the order they appear)
+    """
+    counts = Counter()
+    uris = {} # Key -> the first URI seen for it
+    for line in lines:
+        uri = parse_warm_target(line)
+        if uri:
+            key = warm_key(uri)
+            counts[key] += 1
+            uris.setdefault(key, uri)
+
+    # Counter.most_common keeps insertion order for equal counts
+    return [uris[key] for key, _ in counts.most_common()]
+
+class RateLimiter:
+    """ Lets at most `rate` calls through a second, with bursts of up to `burst`.
+        It can be shared between threads, which then wait their turn
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """ Waits until a call is allowed """
+        if not self.rate:
+            return
+
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens < 1:
+                time.sleep((1 - self.tokens) / self.rate)
+                self.updated = time.monotonic()
+                self.tokens = 1
+
+            self.tokens -= 1
+
+class WarmCheckpoint:
+    """ The keys of the entities that have been warmed, appended to a file as each one
+        is, so an interrupted warm can carry on where it stopped
+    """
+
+    def __init__(self, path: Union[str, None]):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = None
+
+    def load(self) -> set:
+        """ Returns the keys already warmed """
+        if not self.path or not os.path.exists(self.path):
+            return set()
+
+        with open(self.path, encoding="utf-8") as checkpoint_file:
+            return { line.strip() for line in checkpoint_file if line.strip() }
+
+    def add(self, key: str):
+        """ Records that the entity was warmed """
+        if not self.path:
+            return
+
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, "a", encoding="utf-8") # pylint: disable=consider-using-with
+            self._file.write(key + "\n")
+            self._file.flush()
+
+    def close(self):
+        """ Closes the file """
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+class CacheWarmer: # pylint: disable=too-many-instance-attributes
+    """ Warms panels with `concurrency` threads, starting at most `rate` a second.
+        `warm` is called with each URI and returns whether its panel was warmed.
+
+        If FAILURES_BEFORE_PAUSE warms fail in a row, no more are started for
+        FAILURE_PAUSE seconds, so a struggling or rate limiting upstream isn't pushed
+        harder by the warm. Warmed entities are recorded in the checkpoint and skipped
+        next time, and failed ones are retried.
+    """
+
+    # pylint: disable-next=too-many-arguments
+    def __init__(self, warm: Callable[[str], bool], concurrency: int = 4,
+                 rate: float = 5, checkpoint: WarmCheckpoint = None,
+                 on_progress: Callable[[dict], None] = None):
+        self.warm = warm
+        self.concurrency = concurrency
+        self.limiter = RateLimiter(rate, burst=concurrency)
+        self.checkpoint = checkpoint or WarmCheckpoint(None)
+        self.on_progress = on_progress
+        self.failures_in_a_row = 0
+        self.progress = { 'total': 0, 'skipped': 0, 'warmed': 0, 'failed': 0 }
+        self.started = time.monotonic()
+
+    def _warm(self, uri: str) -> bool:
+        try:
+            return bool(self.warm(uri))
+        except Exception as err: # pylint: disable=broad-except
+            print(f"Couldn't warm {uri} ({err})")
+            return False
+
+    def _finish(self, key: str, warmed: bool):
+        if warmed:
+            self.checkpoint.add(key)
+            self.progress['warmed'] += 1
+            self.failures_in_a_row = 0
+        else:
+            self.progress['failed'] += 1
+            self.failures_in_a_row += 1
+
+        if self.on_progress:
+            self.on_progress(self.stats())
+
+    def stats(self) -> dict:
+        """ Returns how many entities there are, were skipped, warmed and failed, and
+            how many were warmed a second
+        """
+        elapsed = time.monotonic() - self.started
+        return {
+            **self.progress,
+            'seconds': elapsed,
+            'throughput': self.progress['warmed'] / elapsed if elapsed else 0,
+        }
+
+    def run(self, uris: List[str]) -> dict:
+        """ Warms the URIs' panels, skipping the ones in the checkpoint, and returns
+            the stats. If it's interrupted, the warms in progress are finished (and
+            checkpointed) before the interrupt is raised again
+        """
+        done = self.checkpoint.load()
+        targets = [(warm_key(uri), uri) for uri in uris]
+        self.progress['total'] = len(targets)
+        self.started = time.monotonic()
+
+        pending = {} # Future -> key
+        with ThreadPoolExecutor(self.concurrency) as executor:
+            try:
+                for key, uri in targets:
+                    if key in done:
+                        self.progress['skipped'] += 1
+                        continue
+
+                    # Only a few warms are queued at once, so an interrupt stops soon
+                    while len(pending) >= self.concurrency:
+                        finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in finished:
+                            self._finish(pending.pop(future), future.result())
+
+                    if self.failures_in_a_row >= FAILURES_BEFORE_PAUSE:
+                        print(f"{self.failures_in_a_row} warms failed in a row, "
+                              f"pausing for {FAILURE_PAUSE}s")
+                        time.sleep(FAILURE_PAUSE)
+                        self.failures_in_a_row = 0
+
+                    self.limiter.acquire()
+                    pending[executor.submit(self._warm, uri)] = key
+            finally:
+                for future in wait(pending).done:
+                    self._finish(pending[future], future.result())
+                self.checkpoint.close()
+
+        return self.stats()
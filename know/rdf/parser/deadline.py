@@ -0,0 +1,134 @@
+import time
+import asyncio
+import contextvars
+from contextlib import contextmanager
+from typing import AsyncIterator, Awaitable, Iterator, Union
+from django.conf import settings
+
+DEFAULT_PANEL_DEADLINE = 10 # Seconds a panel request has to be answered in
+DEFAULT_PARTIAL_RESERVE = 1 # Seconds kept back to fetch a partial panel in
+
+class DeadlineExceeded(Exception):
+    """ Raised when the request's deadline has passed, so there's no time left to wait
+        on upstream
+    """
+
+class Deadline:
+    """ The time by which everything done for a request has to be finished """
+
+    def __init__(self, expires: float):
+        self.expires = expires
+
+    def remaining(self) -> float:
+        """ Returns how many seconds are left, which is 0 once it's passed """
+        return max(self.expires - time.monotonic(), 0)
+
+    def expired(self) -> bool:
+        """ Returns whether the deadline has passed """
+        return time.monotonic() >= self.expires
+
+_current_deadline = contextvars.ContextVar('request_deadline', default=None)
+
+def get_panel_deadline() -> Union[float, None]:
+    """ Returns how many seconds a panel request has, from the PANEL_DEADLINE setting.
+        None means it has as long as it takes
+    """
+    return getattr(settings, 'PANEL_DEADLINE', DEFAULT_PANEL_DEADLINE)
+
+def get_partial_reserve() -> float:
+    """ Returns how many seconds of a panel request's deadline are kept back to fetch a
+        partial panel in, if the full one can't be fetched in time
+    """
+    return getattr(settings, 'PANEL_PARTIAL_RESERVE', DEFAULT_PARTIAL_RESERVE)
+
+def get_deadline() -> Union[Deadline, None]:
+    """ Returns the deadline of the request being handled, if it has one """
+    return _current_deadline.get()
+
+@contextmanager
+def request_deadline(seconds: Union[float, None]):
+    """ Everything in the block has to be finished within seconds (or as long as it
+        takes, if it's None). It's a context variable, so it follows the request through
+        the summarizer, parser and HTTP client, including across awaits
+    """
+    deadline = Deadline(time.monotonic() + seconds) if seconds is not None else None
+    token = _current_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current_deadline.reset(token)
+
+@contextmanager
+def reserve_time(seconds: float):
+    """ Everything in the block has to be finished seconds before the request's
+        deadline, so they're left for whatever comes after it
+    """
+    deadline = get_deadline()
+    if deadline is None:
+        yield None
+        return
+
+    token = _current_deadline.set(Deadline(deadline.expires - seconds))
+    try:
+        yield _current_deadline.get()
+    finally:
+        _current_deadline.reset(token)
+
+def deadline_after(seconds: float) -> float:
+    """ Returns the monotonic time seconds from now, or the request's deadline if
+        that's sooner
+    """
+    expires = time.monotonic() + seconds
+    deadline = get_deadline()
+    return min(expires, deadline.expires) if deadline else expires
+
+def deadline_expired() -> bool:
+    """ Returns whether the request has a deadline and it's passed """
+    deadline = get_deadline()
+    return deadline is not None and deadline.expired()
+
+def check_deadline(stage: str):
+    """ Raises DeadlineExceeded if the request's deadline has passed """
+    if deadline_expired():
+        raise DeadlineExceeded(f"No time left for {stage}")
+
+def bound_timeout(timeout: float) -> float:
+    """ Returns timeout, or the time left before the request's deadline if that's
+        shorter. Raises DeadlineExceeded if there's no time left
+    """
+    deadline = get_deadline()
+    if deadline is None:
+        return timeout
+
+    remaining = deadline.remaining()
+    if remaining <= 0:
+        raise DeadlineExceeded("No time left to make the request")
+
+    return min(timeout, remaining)
+
+def until_deadline(chunks: Iterator[bytes]) -> Iterator[bytes]:
+    """ Yields the chunks of a streamed response, raising DeadlineExceeded if the
+        request's deadline passes before it's been read
+    """
+    for chunk in chunks:
+        check_deadline("reading the response")
+        yield chunk
+
+async def auntil_deadline(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """ Async version of until_deadline """
+    async for chunk in chunks:
+        check_deadline("reading the response")
+        yield chunk
+
+async def within_deadline(awaitable: Awaitable):
+    """ Awaits awaitable, cancelling it and raising DeadlineExceeded if it's not done
+        by the request's deadline
+    """
+    deadline = get_deadline()
+    if deadline is None:
+        return await awaitable
+
+    try:
+        return await asyncio.wait_for(awaitable, deadline.remaining())
+    except asyncio.TimeoutError as err:
+        raise DeadlineExceeded("The request's deadline passed") from err
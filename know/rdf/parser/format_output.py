@@ -1,6 +1,10 @@
+import re
+from datetime import date
+from functools import lru_cache
 from typing import Union, List
 from collections import defaultdict
 from dateutil.parser import parse
+from rdf.parser.telemetry import timed
 
 def format_output(
     title: str, subtitle: str, description: Union[str, None], entries: List[dict]
@@ -22,21 +26,71 @@ def format_output(
 
     return data
 
-def format_date_string(date_str: str) -> str:
+def _detect_date_format() -> str:
+    """ Windows and unix do non-leading zero dates differently, so find out once which
+        one this platform supports
+    """
+    unix_date_format = "%B %-d, %Y"
+    win_date_format = "%B %#d, %Y"
+    try:
+        date(2000, 1, 1).strftime(unix_date_format)
+        return unix_date_format
+    except ValueError:
+        return win_date_format
+
+DATE_FORMAT = _detect_date_format()
+MONTH_FORMAT = "%B %Y"
+DATE_CACHE_SIZE = 65536 # Plenty for the distinct dates that show up in panels
+# How precise Wikidata says a time is, see https://www.wikidata.org/wiki/Help:Dates
+YEAR_PRECISION = 9
+MONTH_PRECISION = 10
+# A canonical xsd:dateTime like the query service returns, e.g. 1732-02-22T00:00:00Z
+# or -0069-01-01T00:00:00Z. Dump times have a + and 00 months and days
+WIKIDATA_TIME = re.compile(r"([+-]?)(\d{1,16})-(\d\d)-(\d\d)T\d\d:\d\d:\d\d(?:\.\d+)?"
+                           r"(?:Z|[+-]\d\d:?\d\d)?")
+
+def _format_wikidata_time(date_str: str, precision: int) -> Union[str, None]:
+    """ Formats a Wikidata time without a general purpose date parser, or returns None
+        if it isn't one
+    """
+    match = WIKIDATA_TIME.fullmatch(date_str)
+    if not match:
+        return None
+
+    sign, year, month, day = match.groups()
+    if sign == '-':
+        return f"{int(year)} BCE"
+
+    month, day = int(month), int(day)
+    # Less precise times have 00 months or days, or they're 01 with a lower precision
+    if not month or (precision is not None and precision <= YEAR_PRECISION):
+        return str(int(year))
+    if int(year) > 9999: # Too far off for datetime, and only years are that far off
+        return None
+
+    if not day or (precision is not None and precision <= MONTH_PRECISION):
+        return date(int(year), month, 1).strftime(MONTH_FORMAT)
+    return date(int(year), month, day).strftime(DATE_FORMAT)
+
+@lru_cache(maxsize=DATE_CACHE_SIZE)
+def format_date_string(date_str: str, precision: int = None) -> str:
     """ Converts a date string like 2019-09-01T07:58:30.996+0200 into
-        September 1, 2019
+        September 1, 2019. `precision` is Wikidata's precision of the time, e.g. 9
+        for a year, if it's known.
+
+        Wikidata times are formatted straight from the string, and only anything else
+        goes through dateutil. The same dates come up over and over (exploded rows,
+        popular birth dates), so results are memoized.
     """
+    formatted = _format_wikidata_time(date_str, precision)
+    if formatted is not None:
+        return formatted
+
     parsed_date = parse(date_str)
     if date_str[0] == '-':
         return f"{parsed_date.year} BCE"
 
-    # Windows and unix do non-leading zero dates differently, so handle both of them
-    win_date_format = "%B %#d, %Y"
-    unix_date_format = "%B %-d, %Y"
-    try:
-        return parsed_date.strftime(unix_date_format)
-    except ValueError:
-        return parsed_date.strftime(win_date_format)
+    return parsed_date.strftime(DATE_FORMAT)
 
 def _get_value_or_none(data: dict, key: str) -> str:
     """ Returns the value for the given key if it exists. If it doesn't, returns None """
@@ -46,15 +100,211 @@ def _get_value_or_none(data: dict, key: str) -> str:
 
     return None
 
-def _detected_duplicate(val: str, pretty_key: str, entries: dict) -> bool:
-    """ Checks if there is already an entry with this key and value in entries """
-    if pretty_key in entries:
-        # Skip if we've already entered this value
-        for existing_entry in entries[pretty_key]:
-            if existing_entry["value"] == val:
-                return True
+def split_response_by_entity(response: dict, entity_column: str = "entity") -> dict:
+    """ Splits a response for several entities (e.g. from a query using
+        VALUES ?entity { ... }) into one response per entity, keyed by the entity's URI,
+        so each can be passed to format_query on its own.
+    """
+    bindings = defaultdict(list)
+    for entry in response['results']['bindings']:
+        entity = _get_value_or_none(entry, entity_column)
+        if entity:
+            bindings[entity].append(entry)
+
+    return {
+        entity: { 'results': { 'bindings': entries } }
+        for entity, entries in bindings.items()
+    }
+
+# Columns in every row of a UNION query's response, which say whose row it is
+ENTITY_COLUMNS = { "entity", "entityType" }
+
+def merge_property_rows(rows: list) -> list:
+    """ The queries have a UNION branch for each property, so each row only has one
+        value of one property (plus the name and description, which get their own row).
+        This puts them back together like independent OPTIONALs would, but without a
+        row for every combination of values: row i has the i-th value of every column,
+        and columns with only one value (like the name) are in every row. Links stay
+        with their labels, as they're bound in the same rows.
+
+        Any other rows, i.e. where a column (other than ENTITY_COLUMNS) is bound with
+        different columns in different rows, are returned as they are. So are exploded
+        rows, which all have the same columns.
+    """
+    if not rows:
+        return rows
+
+    keys = rows[0].keys()
+    if all(map(keys.__eq__, map(dict.keys, rows))): # Quicker than a generator
+        return rows
+
+    columns = {} # column -> its cells, in the order they're bound
+    branches = {} # column -> the columns it's bound with
+    for row in rows:
+        branch = row.keys()
+        for column, cell in row.items():
+            if column not in columns:
+                columns[column] = [cell]
+                branches[column] = branch
+            elif column in ENTITY_COLUMNS: # The same in every row
+                continue
+            elif branches[column] != branch:
+                return rows
+            else:
+                columns[column].append(cell)
+
+    single = { column: cells[0] for column, cells in columns.items() if len(cells) == 1 }
+    merged = [dict(single) for _ in range(max(map(len, columns.values())))]
+    for column, cells in columns.items():
+        if len(cells) > 1:
+            for row, cell in zip(merged, cells):
+                row[column] = cell
+
+    return merged
+
+def _make_entry(val: str, rows: list, row_index: int, link_column: str) -> dict:
+    """ Returns the entry for val, with the link from its row if it has one """
+    link_cell = rows[row_index].get(link_column) if link_column else None
+    link = link_cell.get('value') if link_cell else None
+    if link: # if there's a link, add it
+        return { "value": val, "link": link }
+
+    return { "value": val }
+
+class FormatPlan:
+    """ A compiled description of how to format one entity type's query response, so
+        the work of setting it up is done once instead of on every response.
+
+        Columns that share a pretty key are formatted together, and each group of
+        columns goes through the rows on its own, deduplicating with a set. Entries
+        come out in the same order as if the rows were formatted one at a time.
+    """
 
-    return False
+    def __init__(self, groups: list):
+        # [(pretty key, [(position, column, link column, converter)])], where position
+        # is the column's place in the translations
+        self.groups = groups
+
+    def _first_occurrences(self, rows: list, columns: list) -> list:
+        """ Returns (position, value, row) for the row each distinct value of each
+            column first appears in, in the order they first appear, so exploded rows
+            only have each value formatted once
+        """
+        occurrences = {}
+        for row_index, row in enumerate(rows):
+            for position, column, _, __ in columns:
+                cell = row.get(column)
+                raw = cell.get('value') if cell else None
+                if raw and (position, raw) not in occurrences:
+                    occurrences[(position, raw)] = row_index
+
+        return [
+            (position, raw, row_index)
+            for (position, raw), row_index in occurrences.items()
+        ]
+
+    # pylint: disable-next=too-many-locals
+    def _format_column(self, rows: list, column: tuple) -> tuple:
+        """ _format_group for a pretty key with only one column, which most have. The
+            rows are only looked up with comprehensions and dict.fromkeys, which is
+            much quicker for exploded responses with thousands of rows
+        """
+        position, column_name, link_column, converter = column
+        values = [cell.get('value') if (cell := row.get(column_name)) else None
+                  for row in rows]
+
+        # Which row each value is first in is only needed to look up its link, so
+        # without links only the first entry's row is looked up. Going backwards, each
+        # value ends up with the first row it's in
+        first_rows = None
+        if link_column:
+            first_rows = dict(zip(reversed(values), range(len(values) - 1, -1, -1)))
+
+        entries = []
+        seen = set()
+        first = None
+        for raw in dict.fromkeys(values): # Each distinct value, in order
+            val = converter(raw) if raw and converter else raw
+            if not val or val in seen: # Skip empty values and duplicates
+                continue
+            seen.add(val)
+
+            if first_rows is not None:
+                row_index = first_rows[raw]
+            else:
+                row_index = values.index(raw) if first is None else None
+            entries.append(_make_entry(val, rows, row_index, link_column))
+
+            if first is None:
+                first = (row_index, position)
+
+        return entries, first
+
+    def _format_group(self, rows: list, columns: list) -> tuple:
+        """ Returns the entries for one pretty key, and where the first one came from
+            as (row, position) so the pretty keys can be put back in order
+        """
+        if len(columns) == 1:
+            return self._format_column(rows, columns[0])
+
+        by_position = { column[0]: column for column in columns }
+        entries = []
+        seen = set()
+        first = None
+        for position, raw, row_index in self._first_occurrences(rows, columns):
+            _, __, link_column, converter = by_position[position]
+            val = converter(raw) if converter else raw
+            if not val or val in seen: # Skip empty values and duplicates
+                continue
+            seen.add(val)
+
+            entries.append(_make_entry(val, rows, row_index, link_column))
+
+            if first is None:
+                first = (row_index, position)
+
+        return entries, first
+
+    def format(self, response: dict) -> dict:
+        """ Formats the response into the output expected by the frontend """
+        with timed("format"):
+            return self._format(merge_property_rows(response['results']['bindings']))
+
+    def _format(self, rows: list) -> dict:
+        # The title and subtitle come from the last row, like they always have
+        name = _get_value_or_none(rows[-1], "name") if rows else None
+        subtitle = _get_value_or_none(rows[-1], "description") if rows else None
+
+        found = []
+        for pretty_key, columns in self.groups:
+            entries, first = self._format_group(rows, columns)
+            if entries:
+                found.append((first, pretty_key, entries))
+
+        found.sort(key=lambda group: group[0])
+        return format_output(
+            name, subtitle, None,
+            { pretty_key: entries for _, pretty_key, entries in found },
+        )
+
+def compile_format_plan(
+    entries_translations: dict, entries_links: dict, converters: dict = None,
+) -> FormatPlan:
+    """ Compiles a FormatPlan. `entries_translations` maps each column to the
+        human-readable name of its entries, `entries_links` maps a label column to the
+        entity id column it links to (e.g. "headOfGovLabel": "headOfGov"), and
+        `converters` maps a column to a function that formats its values, e.g. dates
+        into a human-readable format. Converters are only called with values that are
+        there.
+    """
+    converters = converters or {}
+    groups = {}
+    for position, (column, pretty_key) in enumerate(entries_translations.items()):
+        groups.setdefault(pretty_key, []).append(
+            (position, column, entries_links.get(column), converters.get(column))
+        )
+
+    return FormatPlan(list(groups.items()))
 
 def format_query(
     response: dict, entries_translations: dict, entries_links: dict,
@@ -71,40 +321,16 @@ def format_query(
         `special_format` is a function that is called once a value is retrieved form a
         column and allows the function caller to optionally format the value, e.g. if one
         wanted to format a date into a human-readable format.
-    """
-
-    data = response['results']['bindings']
-    # Defaultdict makes it so we don't have to create a new list for each key -
-    # if the key doesn't exist when we try to insert into it, it automatically makes
-    # an empty one for us
-    entries = defaultdict(list)
-
-    for entry in data:
-        name = _get_value_or_none(entry, "name")
-        subtitle = _get_value_or_none(entry, "description")
-
-        for key, pretty_key in entries_translations.items():
-            val = _get_value_or_none(entry, key)
 
-            if special_format: # If there's a special_format function provided
-                val = special_format(val, key)
-
-            if not val: # guard statement
-                continue
-
-            # First, check if there's a link corresponding for this value
-            link_col_name = entries_links.get(key)
-            link = None
-            if link_col_name:
-                link = _get_value_or_none(entry, link_col_name)
-
-            if _detected_duplicate(val, pretty_key, entries): # Skip duplicates
-                continue
-
-            if link: # if there's a link, add it
-                entries[pretty_key].append({ "value": val, "link": link })
-            else:
-                # If we can't, just enter the value
-                entries[pretty_key].append({ "value": val })
+        This compiles a new plan on every call, so formatters that are called often
+        should use compile_format_plan once instead.
+    """
+    converters = {}
+    if special_format: # If there's a special_format function provided
+        converters = {
+            key: (lambda val, key=key: special_format(val, key))
+            for key in entries_translations
+        }
 
-    return format_output(name, subtitle, None, dict(entries))
+    plan = compile_format_plan(entries_translations, entries_links, converters)
+    return plan.format(response)
@@ -0,0 +1,280 @@
+import os
+import time
+import asyncio
+import threading
+import contextvars
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Any, Awaitable, Callable, Union
+from django.conf import settings
+from rdf.parser.resilience import RetryBudget
+
+LATENCY_WINDOW = 200 # How many recent latencies the hedge delay is worked out from
+MIN_SAMPLES = 20 # Latencies needed before hedging, so the delay isn't a guess
+HEDGE_BURST = 5 # Hedges that can be sent in a row before the ratio limits them
+DEFAULT_PERCENTILE = 95
+DEFAULT_MIN_DELAY = 0.05 # Seconds, so fast queries aren't hedged on jitter alone
+DEFAULT_RATIO = 0.05 # At most one hedge for every 20 queries
+DEFAULT_MAX_IN_FLIGHT = 4
+DEFAULT_REQUEST_THREADS = 4 # gunicorn's threads per worker if GUNICORN_THREADS isn't set
+
+class LatencyWindow:
+    """ The latencies of the most recent requests, to tell how slow is unusually slow """
+
+    def __init__(self, size: int):
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=size)
+
+    def record(self, seconds: float):
+        """ Adds a request's latency, forgetting the oldest one if the window is full """
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def percentile(self, percent: float) -> Union[float, None]:
+        """ Returns the nearest-rank percentile of the latencies, or None if there
+            aren't MIN_SAMPLES of them yet
+        """
+        with self._lock:
+            if len(self._latencies) < MIN_SAMPLES:
+                return None
+            latencies = sorted(self._latencies)
+
+        rank = max(1, -(-len(latencies) * percent // 100)) # Rounded up
+        return latencies[int(rank) - 1]
+
+def get_workers() -> int:
+    """ Returns how many threads hedged requests are sent from (WIKIDATA_HEDGE_WORKERS).
+        By default there's one for each thread that can be waiting on a request at once
+        (gunicorn's, and the panel refresh and prefetch ones) and one for each hedge
+    """
+    workers = getattr(settings, 'WIKIDATA_HEDGE_WORKERS', None)
+    if workers is not None:
+        return workers
+
+    return (
+        int(os.environ.get('GUNICORN_THREADS', DEFAULT_REQUEST_THREADS))
+        + getattr(settings, 'PANEL_REFRESH_WORKERS', 2)
+        + getattr(settings, 'PANEL_PREFETCH_WORKERS', 2)
+        + getattr(settings, 'WIKIDATA_HEDGE_MAX_IN_FLIGHT', DEFAULT_MAX_IN_FLIGHT)
+    )
+
+class SparqlHedger: # pylint: disable=too-many-instance-attributes
+    """ Hedges requests to Wikidata, whose latency has a long tail: if a request hasn't
+        been answered after WIKIDATA_HEDGE_PERCENTILE of recent requests were, the same
+        request is sent again, and whichever answers first is used.
+
+        It's off unless the WIKIDATA_HEDGE setting is on. To keep the extra load small,
+        at most WIKIDATA_HEDGE_RATIO of requests are hedged (like the retry budget), and
+        at most WIKIDATA_HEDGE_MAX_IN_FLIGHT hedges are in flight at once. So when
+        Wikidata is slow for everyone, hedging stops rather than doubling the load.
+
+        Async losers are cancelled. Sync requests can't be interrupted, so both are sent
+        from a pool of threads, and the loser is left to finish in the background with
+        its response dropped. The pool keeps a thread for each hedge that can be in
+        flight, and once the rest are busy, requests are sent from the calling thread
+        without hedging rather than waiting for one.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._executor = None
+        self._budget = None
+        self._pid = None
+        self.latencies = LatencyWindow(LATENCY_WINDOW)
+        self.in_flight = 0
+        self.primaries = 0
+        self._max_primaries = 0
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.denied = 0
+        self.saved_seconds = 0.0
+
+    @staticmethod
+    def enabled() -> bool:
+        """ Whether requests are hedged (the WIKIDATA_HEDGE setting) """
+        return getattr(settings, 'WIKIDATA_HEDGE', False)
+
+    def _start_request(self):
+        """ Counts a request, and deposits its share of the hedge budget """
+        # Threads don't survive a fork, so make a new pool in each worker process
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                workers = get_workers()
+                self._executor = ThreadPoolExecutor(
+                    max_workers=workers, thread_name_prefix='sparql-hedge'
+                )
+                self._max_primaries = workers - getattr(
+                    settings, 'WIKIDATA_HEDGE_MAX_IN_FLIGHT', DEFAULT_MAX_IN_FLIGHT
+                )
+                self._budget = RetryBudget(
+                    getattr(settings, 'WIKIDATA_HEDGE_RATIO', DEFAULT_RATIO), HEDGE_BURST
+                )
+                self._pid = os.getpid()
+                self.in_flight = 0
+                self.primaries = 0
+
+            self.requests += 1
+            self._budget.record_request()
+
+    def get_delay(self) -> Union[float, None]:
+        """ Returns how long to wait for an answer before hedging, or None if there
+            aren't enough recent latencies to tell yet
+        """
+        percent = getattr(settings, 'WIKIDATA_HEDGE_PERCENTILE', DEFAULT_PERCENTILE)
+        delay = self.latencies.percentile(percent)
+        if delay is None:
+            return None
+
+        min_delay = getattr(settings, 'WIKIDATA_HEDGE_MIN_DELAY', DEFAULT_MIN_DELAY)
+        return max(delay, min_delay)
+
+    def _try_hedge(self) -> bool:
+        """ Returns whether a hedge can be sent, counting it if it can """
+        max_in_flight = getattr(
+            settings, 'WIKIDATA_HEDGE_MAX_IN_FLIGHT', DEFAULT_MAX_IN_FLIGHT
+        )
+        with self._lock:
+            if self.in_flight >= max_in_flight or not self._budget.try_retry():
+                self.denied += 1
+                return False
+
+            self.in_flight += 1
+            self.hedges += 1
+            return True
+
+    def _hedge_done(self, *_):
+        with self._lock:
+            self.in_flight -= 1
+
+    def _try_primary(self) -> bool:
+        """ Returns whether there's a thread free to send a primary request from,
+            claiming it if there is
+        """
+        with self._lock:
+            if self.primaries >= self._max_primaries:
+                return False
+
+            self.primaries += 1
+            return True
+
+    def _primary_done(self, *_):
+        with self._lock:
+            self.primaries -= 1
+
+    def _record_win(self, started: float, hedged_at: float):
+        """ Counts a hedge win, and the latency it saved. The primary hadn't answered by
+            the time the hedge did, so it was slower than the hedge by at least how much
+            later the hedge was sent, which is what's counted
+        """
+        with self._lock:
+            self.hedge_wins += 1
+            self.saved_seconds += hedged_at - started
+
+    def _send(self, request: Callable[[], Any]) -> Any:
+        started = time.monotonic()
+        response = request()
+        self.latencies.record(time.monotonic() - started)
+        return response
+
+    async def _asend(self, request: Callable[[], Awaitable[Any]]) -> Any:
+        started = time.monotonic()
+        response = await request()
+        self.latencies.record(time.monotonic() - started)
+        return response
+
+    def _submit(self, request: Callable[[], Any]) -> Future:
+        # The request runs on another thread, with this one's deadline and timing
+        return self._executor.submit(contextvars.copy_context().run, self._send, request)
+
+    def get(self, request: Callable[[], Any]) -> Any:
+        """ Returns request(), hedging it if it's slow. If the first to finish raised,
+            the other is waited on, and if both raised the last error is raised
+        """
+        if not self.enabled():
+            return request()
+
+        self._start_request()
+        delay = self.get_delay()
+        if delay is None or not self._try_primary():
+            return self._send(request)
+
+        started = time.monotonic()
+        primary = self._submit(request)
+        primary.add_done_callback(self._primary_done)
+        if wait([primary], delay).done or not self._try_hedge():
+            return primary.result()
+
+        hedged_at = time.monotonic()
+        hedge = self._submit(request)
+        hedge.add_done_callback(self._hedge_done)
+        pending, error = { primary, hedge }, None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    error = future.exception()
+                    continue
+
+                if future is hedge and pending:
+                    self._record_win(started, hedged_at)
+                return future.result()
+
+        raise error
+
+    async def aget(self, request: Callable[[], Awaitable[Any]]) -> Any:
+        """ Async version of get, which cancels the loser """
+        if not self.enabled():
+            return await request()
+
+        self._start_request()
+        delay = self.get_delay()
+        if delay is None:
+            return await self._asend(request)
+
+        started = time.monotonic()
+        primary = asyncio.ensure_future(self._asend(request))
+        tasks = [primary]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if done or not self._try_hedge():
+                return await primary
+
+            hedged_at = time.monotonic()
+            hedge = asyncio.ensure_future(self._asend(request))
+            hedge.add_done_callback(self._hedge_done)
+            tasks.append(hedge)
+            pending, error = set(tasks), None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        error = task.exception()
+                        continue
+
+                    if task is hedge and pending:
+                        self._record_win(started, hedged_at)
+                    return task.result()
+
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def metrics(self) -> dict:
+        """ Returns how many requests there were, how many were hedged (and the share
+            that was), how many hedges won or were denied by the caps, how many seconds
+            the hedges saved, and the current hedge delay
+        """
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'hedges': self.hedges,
+                'hedge_rate': self.hedges / self.requests if self.requests else 0.0,
+                'hedge_wins': self.hedge_wins,
+                'hedges_denied': self.denied,
+                'saved_seconds': self.saved_seconds,
+                'delay_seconds': self.get_delay() or 0.0,
+            }
+
+sparql_hedger = SparqlHedger()
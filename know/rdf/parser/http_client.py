@@ -0,0 +1,279 @@
+import os
+import asyncio
+import threading
+import weakref
+from contextlib import contextmanager, asynccontextmanager
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from django.conf import settings
+from rdf.parser.deadline import (
+    bound_timeout, until_deadline, auntil_deadline, within_deadline
+)
+
+USER_AGENT = "KNOW-backend/1.0 (https://github.com/statkinson7/CSCE-482-KNOW-backend)"
+DEFAULT_SETTINGS = {
+    'POOL_CONNECTIONS': 4, # How many hosts to keep a connection pool for
+    'POOL_MAXSIZE': 20, # How many keep-alive connections to keep per host
+    'CONNECT_TIMEOUT': 3.05,
+    'READ_TIMEOUT': 30,
+    'HTTP2': False,
+}
+HEADERS = { 'User-Agent': USER_AGENT, 'Accept-Encoding': 'gzip, deflate' }
+STREAM_CHUNK_SIZE = 16 * 1024
+
+class _ConnectionCounter:
+    """ Counts the connections opened by the pools, so we can tell how often
+        requests are reusing a kept-alive connection instead of opening a new one
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.opened = 0
+
+    def increment(self):
+        """ Records that a new connection was opened """
+        with self._lock:
+            self.opened += 1
+
+_connection_counter = _ConnectionCounter()
+
+class _CountingHTTPConnectionPool(HTTPConnectionPool):
+    def _new_conn(self):
+        _connection_counter.increment()
+        return super()._new_conn()
+
+class _CountingHTTPSConnectionPool(HTTPSConnectionPool):
+    def _new_conn(self):
+        _connection_counter.increment()
+        return super()._new_conn()
+
+class _PooledAdapter(HTTPAdapter):
+    """ HTTPAdapter whose connection pools count the connections they open """
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _CountingHTTPConnectionPool,
+            'https': _CountingHTTPSConnectionPool,
+        }
+
+def get_client_settings() -> dict:
+    """ Returns the HTTP_CLIENT setting, with defaults for anything not configured """
+    return { **DEFAULT_SETTINGS, **getattr(settings, 'HTTP_CLIENT', {}) }
+
+def _get_httpx_limits(client_settings: dict) -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=client_settings['POOL_MAXSIZE'],
+        max_keepalive_connections=client_settings['POOL_MAXSIZE'],
+    )
+
+def _get_timeouts(client_settings: dict) -> tuple:
+    """ Returns the connect and read timeouts, cut short if the request's deadline is
+        sooner. Raises DeadlineExceeded if it's already passed
+    """
+    return (
+        bound_timeout(client_settings['CONNECT_TIMEOUT']),
+        bound_timeout(client_settings['READ_TIMEOUT']),
+    )
+
+def _get_httpx_timeout(client_settings: dict) -> httpx.Timeout:
+    connect, read = _get_timeouts(client_settings)
+    return httpx.Timeout(read, connect=connect)
+
+class HttpClient:
+    """ A per-process HTTP client shared by everything that talks to Wikidata or VIAF,
+        so that connections are kept alive and reused between requests instead of
+        paying for DNS, TCP and TLS setup every time.
+
+        Uses a pooled requests.Session, or an httpx.Client when HTTP/2 is enabled with
+        the HTTP_CLIENT setting. Either way responses are requested gzip/deflate encoded.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._client = None
+        self._pid = None
+        self.requests_sent = 0
+
+    def _create_client(self):
+        client_settings = get_client_settings()
+
+        if client_settings['HTTP2']:
+            return httpx.Client(
+                http2=True, limits=_get_httpx_limits(client_settings), headers=HEADERS,
+                follow_redirects=True,
+            )
+
+        session = requests.Session()
+        session.headers.update(HEADERS)
+        adapter = _PooledAdapter(
+            pool_connections=client_settings['POOL_CONNECTIONS'],
+            pool_maxsize=client_settings['POOL_MAXSIZE'],
+        )
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    @property
+    def client(self):
+        """ The underlying requests.Session or httpx.Client for this process.
+            It's recreated after a fork, since sockets can't be shared between workers
+        """
+        with self._lock:
+            if self._client is None or self._pid != os.getpid():
+                self._client = self._create_client()
+                self._pid = os.getpid()
+
+            return self._client
+
+    def get(self, url: str, params: dict = None, headers: dict = None,
+            raise_for_status: bool = False):
+        """ Makes a GET request using the pooled connections.
+            If raise_for_status is True, a requests.HTTPError is raised for 4xx and 5xx
+            responses, whichever client is being used. Its timeouts are cut short by
+            the request's deadline, if it has one (see rdf/parser/deadline.py)
+        """
+        client_settings = get_client_settings()
+        client = self.client
+
+        timeout = _get_timeouts(client_settings)
+        if isinstance(client, httpx.Client):
+            timeout = _get_httpx_timeout(client_settings)
+
+        response = client.get(url, params=params, headers=headers, timeout=timeout)
+
+        with self._lock:
+            self.requests_sent += 1
+
+        if raise_for_status and response.status_code >= 400:
+            raise requests.HTTPError(
+                f"{response.status_code} error for url: {url}", response=response
+            )
+
+        return response
+
+    @contextmanager
+    def stream(self, url: str, headers: dict = None, raise_for_status: bool = False):
+        """ Like get, but yields an iterator over the (decompressed) body as it arrives
+            rather than downloading all of it first, so the caller can stop reading
+            early. The response is closed when the block exits.
+        """
+        client_settings = get_client_settings()
+        client = self.client
+
+        timeout = _get_timeouts(client_settings)
+        if isinstance(client, httpx.Client):
+            timeout = _get_httpx_timeout(client_settings)
+            request = client.stream('GET', url, headers=headers, timeout=timeout)
+        else:
+            request = client.get(url, headers=headers, timeout=timeout, stream=True)
+
+        with request as response:
+            with self._lock:
+                self.requests_sent += 1
+
+            if raise_for_status and response.status_code >= 400:
+                raise requests.HTTPError(
+                    f"{response.status_code} error for url: {url}", response=response
+                )
+
+            if isinstance(response, httpx.Response):
+                yield until_deadline(response.iter_bytes(STREAM_CHUNK_SIZE))
+            else:
+                yield until_deadline(response.iter_content(STREAM_CHUNK_SIZE))
+
+    def metrics(self) -> dict:
+        """ Returns how many requests were sent and how many connections were opened
+            for them. connections_opened is None when using httpx, which doesn't
+            expose it.
+        """
+        using_httpx = isinstance(self._client, httpx.Client)
+        with self._lock:
+            requests_sent = self.requests_sent
+
+        if using_httpx:
+            return { 'requests': requests_sent, 'connections_opened': None }
+
+        opened = _connection_counter.opened
+        return {
+            'requests': requests_sent,
+            'connections_opened': opened,
+            'connections_reused': max(requests_sent - opened, 0),
+        }
+
+    def close(self):
+        """ Closes every pooled connection """
+        with self._lock:
+            if self._client is not None:
+                self._client.close()
+            self._client = None
+
+class AsyncHttpClient:
+    """ The async counterpart of HttpClient, used by the async views so that waiting
+        on Wikidata or VIAF doesn't tie up a worker. It's built on httpx.AsyncClient,
+        which can only be used from the event loop it was created in, so one is kept
+        per event loop.
+    """
+
+    def __init__(self):
+        self._clients = weakref.WeakKeyDictionary()
+        self.requests_sent = 0
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """ The httpx.AsyncClient for the running event loop """
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None:
+            client_settings = get_client_settings()
+            client = httpx.AsyncClient(
+                http2=client_settings['HTTP2'], limits=_get_httpx_limits(client_settings),
+                headers=HEADERS, follow_redirects=True,
+            )
+            self._clients[loop] = client
+
+        return client
+
+    async def get(self, url: str, params: dict = None, headers: dict = None,
+                  raise_for_status: bool = False):
+        """ Async version of HttpClient.get, which is also cancelled once the
+            request's deadline passes
+        """
+        timeout = _get_httpx_timeout(get_client_settings())
+        response = await within_deadline(
+            self.client.get(url, params=params, headers=headers, timeout=timeout)
+        )
+        self.requests_sent += 1 # Only ever touched from the event loop's thread
+
+        if raise_for_status and response.status_code >= 400:
+            raise requests.HTTPError(
+                f"{response.status_code} error for url: {url}", response=response
+            )
+
+        return response
+
+    @asynccontextmanager
+    async def stream(self, url: str, headers: dict = None,
+                     raise_for_status: bool = False):
+        """ Async version of HttpClient.stream """
+        timeout = _get_httpx_timeout(get_client_settings())
+        async with self.client.stream(
+            'GET', url, headers=headers, timeout=timeout
+        ) as response:
+            self.requests_sent += 1
+
+            if raise_for_status and response.status_code >= 400:
+                raise requests.HTTPError(
+                    f"{response.status_code} error for url: {url}", response=response
+                )
+
+            yield auntil_deadline(response.aiter_bytes(STREAM_CHUNK_SIZE))
+
+    async def aclose(self):
+        """ Closes the client for the running event loop """
+        client = self._clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
+
+http_client = HttpClient()
+async_http_client = AsyncHttpClient()
@@ -0,0 +1,293 @@
+import os
+import re
+import time
+import hashlib
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Callable, Tuple, Union
+import orjson
+from django.conf import settings
+from django.core.cache import caches
+from rdf.parser.abstract_parser import EntityType
+from rdf.parser.telemetry import timed
+
+WIKIDATA_ID_PATTERN = re.compile('Q[0-9]+')
+VIAF_ID_PATTERN = re.compile('[0-9]+')
+DEFAULT_CACHE_ALIAS = 'panels'
+DEFAULT_TTL = 60 * 60 # Used when an entity type has no TTL configured
+DEFAULT_STALE_TTL = 60 * 60 * 24 # How long past its TTL a panel can be served stale
+FILL_LOCK_TTL = 30 # Seconds, so a crashed process can't hold a fill lock forever
+FILL_POLL_INTERVAL = 0.05 # Seconds between checks for another process' panel
+# What browsers and CDNs are told they can cache a panel for, when there's no
+# PANEL_CACHE_CONTROL setting for its entity type
+DEFAULT_CACHE_CONTROL = { 'max-age': 60 * 5, 'stale-while-revalidate': 60 * 60 }
+JSON_CONTENT_TYPE = "application/json"
+# Line and paragraph separators are valid in JSON strings but not JavaScript ones
+JAVASCRIPT_ESCAPES = ((b"\xe2\x80\xa8", b"\\u2028"), (b"\xe2\x80\xa9", b"\\u2029"))
+
+def canonical_entity_key(uri: str) -> Union[str, None]:
+    """ Maps a Wikidata URI to the key its panel is cached under, so that
+        https://www.wikidata.org/wiki/Q23 and http://www.wikidata.org/entity/Q23 both
+        become 'wikidata:Q23'. Returns None if there's no Wikidata ID in the URI.
+    """
+    match = WIKIDATA_ID_PATTERN.search(uri)
+    if not match:
+        return None
+
+    return f"wikidata:{match.group(0)}"
+
+def viaf_alias_key(uri: str) -> Union[str, None]:
+    """ Maps a VIAF URI to the key its resolved Wikidata URI is cached under,
+        e.g. http://viaf.org/viaf/75121530/ becomes 'viaf:75121530'
+    """
+    match = VIAF_ID_PATTERN.search(uri)
+    if not match:
+        return None
+
+    return f"viaf:{match.group(0)}"
+
+def encode_json(data, default: Callable = None) -> bytes:
+    """ Encodes data as compact UTF-8 JSON with orjson, which is several times quicker
+        than json.dumps. It's the same JSON that DRF's JSONRenderer writes, including
+        escaping U+2028 and U+2029 so it's also valid JavaScript. default is called with
+        any object orjson can't encode, and returns something it can
+    """
+    body = orjson.dumps(data, default=default)
+    if b"\xe2\x80" in body: # Quicker than replacing when there's nothing to replace
+        for character, escaped in JAVASCRIPT_ESCAPES:
+            body = body.replace(character, escaped)
+
+    return body
+
+def panel_etag(panel: dict) -> str:
+    """ Returns a strong ETag for the panel, which is a hash of its JSON with the keys
+        sorted, so it only changes when the panel's content does
+    """
+    canonical = orjson.dumps(panel, option=orjson.OPT_SORT_KEYS)
+    return f'"{hashlib.sha256(canonical).hexdigest()[:32]}"'
+
+def get_cache_control(entity_type: Union[EntityType, None], stale: bool = False) -> str:
+    """ Returns the Cache-Control header for a panel of the entity type, from the
+        PANEL_CACHE_CONTROL setting, e.g.
+        { 'PERSON': { 'max-age': 3600, 'stale-while-revalidate': 86400 } }.
+        A stale panel is being refreshed, so it's sent with a max-age of 0
+    """
+    directives = getattr(settings, 'PANEL_CACHE_CONTROL', {})
+    name = entity_type.name if entity_type else 'DEFAULT'
+    directives = directives.get(name, directives.get('DEFAULT', DEFAULT_CACHE_CONTROL))
+    if stale:
+        directives = { **directives, 'max-age': 0 }
+
+    return ", ".join(
+        ["public"] + [f"{directive}={value}" for directive, value in directives.items()]
+    )
+
+class PanelCache:
+    """ Caches formatted knowledge panels in one of the Django cache backends.
+
+        The backend is chosen with the PANEL_CACHE_ALIAS setting (an in-process LRU
+        LocMemCache by default, see CACHES in settings.py), which also bounds its size
+        with MAX_ENTRIES. How long a panel is fresh for depends on its entity type, and
+        is configured with the PANEL_CACHE_TTLS setting, e.g. { 'PERSON': 86400 }.
+
+        Once a panel is past its TTL it's stale, but is still kept for another
+        PANEL_CACHE_STALE_TTL seconds so it can be served while it's refreshed (or if
+        refreshing it fails).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+
+    @property
+    def backend(self):
+        """ The Django cache backend panels are stored in """
+        return caches[getattr(settings, 'PANEL_CACHE_ALIAS', DEFAULT_CACHE_ALIAS)]
+
+    def get_ttl(self, entity_type: EntityType) -> int:
+        """ Returns how many seconds a panel of the given entity type should be kept """
+        ttls = getattr(settings, 'PANEL_CACHE_TTLS', {})
+        if entity_type is None:
+            return ttls.get('DEFAULT', DEFAULT_TTL)
+
+        return ttls.get(entity_type.name, ttls.get('DEFAULT', DEFAULT_TTL))
+
+    def get_stale_ttl(self) -> int:
+        """ Returns how many seconds past its TTL a panel can still be served """
+        return getattr(settings, 'PANEL_CACHE_STALE_TTL', DEFAULT_STALE_TTL)
+
+    def peek(self, key: str) -> Tuple[Union[dict, None], bool]:
+        """ Returns the cache entry for the key (or None if it isn't cached), and
+            whether it's stale, without counting it as a hit or miss. The entry is a dict
+            of the 'panel', its 'etag', the name of its 'entity_type', and its encoded
+            'body' and 'content_type', so it can be sent without encoding it again
+        """
+        entry = self.backend.get(key)
+        if entry is None:
+            return None, False
+
+        if 'body' not in entry: # Cached by an older version, e.g. in memcached
+            entry['etag'] = panel_etag(entry['panel'])
+            entry['body'] = encode_json(entry['panel'])
+            entry['content_type'] = JSON_CONTENT_TYPE
+
+        return entry, time.time() >= entry['fresh_until']
+
+    def get_cached(self, key: str) -> Tuple[Union[dict, None], bool]:
+        """ Like peek, but counts the hit or miss """
+        entry, stale = self.peek(key)
+
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+            elif stale:
+                self.stale_hits += 1
+            else:
+                self.hits += 1
+
+        return entry, stale
+
+    def get_entry(self, key: str) -> Tuple[Union[dict, None], bool]:
+        """ Returns the cached panel for the key (or None if it isn't cached), and
+            whether it's stale and should be refreshed
+        """
+        entry, stale = self.get_cached(key)
+        return (entry['panel'] if entry else None), stale
+
+    def get(self, key: str) -> Union[dict, None]:
+        """ Returns the cached panel for the key, or None if it isn't cached """
+        return self.get_entry(key)[0]
+
+    def set(self, key: str, panel: dict, entity_type: EntityType = None) -> dict:
+        """ Caches the panel under the key for its entity type's TTL, plus the time it
+            can be served stale for. Returns the cache entry (see peek)
+        """
+        ttl = self.get_ttl(entity_type)
+        with timed("serialize"):
+            body = encode_json(panel)
+        entry = {
+            'panel': panel,
+            'fresh_until': time.time() + ttl,
+            'etag': panel_etag(panel),
+            'entity_type': entity_type.name if entity_type else None,
+            'body': body,
+            'content_type': JSON_CONTENT_TYPE,
+        }
+        self.backend.set(key, entry, ttl + self.get_stale_ttl())
+        return entry
+
+    def acquire_fill_lock(self, key: str) -> bool:
+        """ Tries to become the only process filling the key, using the backend's
+            atomic add. Returns False if another process already is
+        """
+        return self.backend.add(f"fill-lock:{key}", os.getpid(), FILL_LOCK_TTL)
+
+    def release_fill_lock(self, key: str):
+        """ Lets other processes fill the key again """
+        self.backend.delete(f"fill-lock:{key}")
+
+    def _is_being_filled(self, key: str) -> bool:
+        return self.backend.get(f"fill-lock:{key}") is not None
+
+    def wait_for_fill(self, key: str, timeout: float) -> Union[dict, None]:
+        """ Waits up to timeout seconds for another process to cache the key's panel.
+            Returns None if it didn't, or if it gave up on filling it
+        """
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            entry = self.peek(key)[0]
+            if entry is not None or not self._is_being_filled(key):
+                return entry['panel'] if entry else None
+            time.sleep(FILL_POLL_INTERVAL)
+
+        return None
+
+    async def await_fill(self, key: str, timeout: float) -> Union[dict, None]:
+        """ Async version of wait_for_fill """
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            entry = self.peek(key)[0]
+            if entry is not None or not self._is_being_filled(key):
+                return entry['panel'] if entry else None
+            await asyncio.sleep(FILL_POLL_INTERVAL)
+
+        return None
+
+    def stats(self) -> dict:
+        """ Returns the hit/miss counters for this process """
+        with self._lock:
+            total = self.hits + self.misses
+            total += self.stale_hits
+            return {
+                'hits': self.hits,
+                'stale_hits': self.stale_hits,
+                'misses': self.misses,
+                'hit_ratio': (self.hits + self.stale_hits) / total if total else 0.0,
+            }
+
+    def clear(self):
+        """ Empties the cache and resets the counters """
+        self.backend.clear()
+        with self._lock:
+            self.hits = 0
+            self.stale_hits = 0
+            self.misses = 0
+
+class BackgroundRefresher:
+    """ Refreshes stale panels on background threads, so the request that found the
+        panel stale doesn't have to wait. Each key is only refreshed once at a time.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+        self._in_flight = {}
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        # Threads don't survive a fork, so make a new pool in each worker process
+        if self._executor is None or self._pid != os.getpid():
+            workers = getattr(settings, 'PANEL_REFRESH_WORKERS', 2)
+            self._executor = ThreadPoolExecutor(
+                max_workers=workers, thread_name_prefix='panel-refresh'
+            )
+            self._pid = os.getpid()
+            self._in_flight = {}
+
+        return self._executor
+
+    def submit(self, key: str, function: Callable[[], None]) -> bool:
+        """ Runs function in the background, unless the key is already being
+            refreshed. Returns whether it was submitted
+        """
+        with self._lock:
+            executor = self._get_executor()
+            if key in self._in_flight:
+                return False
+
+            future = executor.submit(self._run, key, function)
+            self._in_flight[key] = future
+            return True
+
+    def _run(self, key: str, function: Callable[[], None]):
+        try:
+            function()
+        except Exception as err: # pylint: disable=broad-except
+            # The stale panel is still cached, so the next request will try again
+            print(f"Refreshing {key} failed: {err}")
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+
+    def wait(self, timeout: float = None):
+        """ Waits for every refresh that's in flight to finish """
+        with self._lock:
+            futures = list(self._in_flight.values())
+
+        wait(futures, timeout)
+
+panel_cache = PanelCache()
+panel_refresher = BackgroundRefresher()
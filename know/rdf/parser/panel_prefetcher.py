@@ -0,0 +1,127 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Callable, List
+from django.conf import settings
+from rdf.parser.cache_warmer import RateLimiter
+from rdf.parser.panel_cache import panel_cache, canonical_entity_key
+
+DEFAULT_MAX_LINKS = 5 # Linked entities prefetched per panel
+DEFAULT_QUEUE_SIZE = 100 # Prefetches waiting or running at once, per process
+DEFAULT_RATE = 2 # Prefetches started a second, per process
+DEFAULT_WORKERS = 2
+
+def linked_uris(panel: dict) -> List[str]:
+    """ Returns the URIs of the entities the panel's entries link to (e.g. a person's
+        spouse, or a book's author), in the order they appear, without duplicates
+    """
+    uris = []
+    for values in (panel or {}).get('entries', {}).values():
+        for value in values:
+            link = value.get('link') if isinstance(value, dict) else None
+            if link and link not in uris:
+                uris.append(link)
+
+    return uris
+
+class PanelPrefetcher:
+    """ Warms the panel cache for the entities a panel links to on background threads,
+        so following one of its links doesn't have to wait on Wikidata.
+
+        It's off unless the PANEL_PREFETCH setting is on. At most
+        PANEL_PREFETCH_MAX_LINKS links are prefetched per panel, and at most
+        PANEL_PREFETCH_QUEUE prefetches wait at once (more are dropped rather than
+        queued, since prefetching is only a guess). They're started at up to
+        PANEL_PREFETCH_RATE a second, so prefetching can't crowd out requests users are
+        waiting on. Each entity is only prefetched once at a time, and not at all if
+        its panel is already cached.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._executor = None
+        self._limiter = None
+        self._pid = None
+        self._in_flight = {}
+        self.counts = { 'submitted': 0, 'prefetched': 0, 'cached': 0, 'dropped': 0,
+                        'failed': 0 }
+
+    @staticmethod
+    def enabled() -> bool:
+        """ Whether linked entities are prefetched (the PANEL_PREFETCH setting) """
+        return getattr(settings, 'PANEL_PREFETCH', False)
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        # Threads don't survive a fork, so make a new pool in each worker process
+        if self._executor is None or self._pid != os.getpid():
+            workers = getattr(settings, 'PANEL_PREFETCH_WORKERS', DEFAULT_WORKERS)
+            self._executor = ThreadPoolExecutor(
+                max_workers=workers, thread_name_prefix='panel-prefetch'
+            )
+            self._limiter = RateLimiter(
+                getattr(settings, 'PANEL_PREFETCH_RATE', DEFAULT_RATE), burst=workers
+            )
+            self._pid = os.getpid()
+            self._in_flight = {}
+
+        return self._executor
+
+    def prefetch(self, panel: dict, fetch: Callable[[str, str], None]) -> int:
+        """ Calls fetch with the URI and cache key of each entity the panel links to, in
+            the background, if PANEL_PREFETCH is on. Returns how many were submitted
+        """
+        if not panel or not self.enabled():
+            return 0
+
+        max_links = getattr(settings, 'PANEL_PREFETCH_MAX_LINKS', DEFAULT_MAX_LINKS)
+        queue_size = getattr(settings, 'PANEL_PREFETCH_QUEUE', DEFAULT_QUEUE_SIZE)
+        submitted = 0
+        with self._lock:
+            executor = self._get_executor()
+            for uri in linked_uris(panel)[:max_links]:
+                key = canonical_entity_key(uri)
+                if not key or key in self._in_flight:
+                    continue
+                if len(self._in_flight) >= queue_size:
+                    self.counts['dropped'] += 1
+                    continue
+
+                self._in_flight[key] = executor.submit(self._run, uri, key, fetch)
+                self.counts['submitted'] += 1
+                submitted += 1
+
+        return submitted
+
+    def _run(self, uri: str, key: str, fetch: Callable[[str, str], None]):
+        outcome = 'cached'
+        try:
+            # Checked here rather than when it's submitted, so the request that
+            # produced the panel doesn't wait on the cache
+            if panel_cache.peek(key)[0] is None:
+                self._limiter.acquire()
+                fetch(uri, key)
+                outcome = 'prefetched'
+        except Exception as err: # pylint: disable=broad-except
+            outcome = 'failed'
+            print(f"Prefetching {key} failed: {err}")
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+                self.counts[outcome] += 1
+
+    def wait(self, timeout: float = None):
+        """ Waits for every prefetch that's in flight to finish """
+        with self._lock:
+            futures = list(self._in_flight.values())
+
+        wait(futures, timeout)
+
+    def stats(self) -> dict:
+        """ Returns how many prefetches were submitted, prefetched, found already
+            cached, dropped because the queue was full, or failed, and how many are in
+            flight, in this process
+        """
+        with self._lock:
+            return { **self.counts, 'in_flight': len(self._in_flight) }
+
+panel_prefetcher = PanelPrefetcher()
@@ -0,0 +1,177 @@
+import os
+import json
+import sqlite3
+import threading
+import time
+from typing import Union
+from django.conf import settings
+from rdf.parser.abstract_parser import EntityType
+from rdf.parser.wikidata_parser import ENTITY_FORMATTERS
+from rdf.parser.wikidata_dump import ENTITY_URI_PREFIX
+
+# SQLite only allows so many parameters in one query
+LABEL_LOOKUP_CHUNK = 500
+STAT_INTERVAL = 5 # Seconds between checks for whether the store's file exists
+
+class PanelStore:
+    """ A local SQLite store of the fields of every entity we make panels for, built
+        from a Wikidata JSON dump with `python manage.py ingest_wikidata_dump`, so
+        panels can be made without querying Wikidata.
+
+        Fields are stored the way the .sparql files select them, and the labels of the
+        entities they link to are stored separately and joined in when they're read,
+        so the panels are formatted exactly like ones from Wikidata. Both tables are
+        keyed by entity ID.
+
+        The store's path is the PANEL_STORE_PATH setting, unless one is passed in. It's
+        only used once that file exists, which is checked every STAT_INTERVAL seconds.
+    """
+
+    def __init__(self, path: str = None):
+        self._path = path
+        self._local = threading.local() # SQLite connections can't be shared by threads
+        self._checked = (None, 0.0, False) # The path, when it was checked, if it existed
+
+    @property
+    def path(self) -> Union[str, None]:
+        """ Where the store's SQLite file is """
+        if self._path is not None:
+            return str(self._path)
+
+        path = getattr(settings, 'PANEL_STORE_PATH', None)
+        return str(path) if path else None
+
+    @property
+    def enabled(self) -> bool:
+        """ Whether the store has been built and can be read from """
+        path = self.path
+        checked_path, checked_at, exists = self._checked
+        if path != checked_path or time.monotonic() - checked_at >= STAT_INTERVAL:
+            exists = path is not None and os.path.exists(path)
+            self._checked = (path, time.monotonic(), exists)
+
+        return exists
+
+    def _connect(self) -> sqlite3.Connection:
+        # Reconnect if the path changed, or in a new process after a fork
+        connection_key = (self.path, os.getpid())
+        if getattr(self._local, 'key', None) != connection_key:
+            self._local.connection = sqlite3.connect(self.path)
+            self._local.key = connection_key
+
+        return self._local.connection
+
+    def create_tables(self):
+        """ Creates the store's tables if they don't exist yet """
+        connection = self._connect()
+        # WAL lets panels be read from the store while it's being ingested into
+        connection.execute("PRAGMA journal_mode = WAL")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS entities ("
+            " id TEXT PRIMARY KEY, entity_type TEXT NOT NULL, fields TEXT NOT NULL"
+            ") WITHOUT ROWID"
+        )
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS labels (id TEXT PRIMARY KEY, label TEXT NOT NULL)"
+            " WITHOUT ROWID"
+        )
+        connection.commit()
+
+    def add_entities(self, extracted: list):
+        """ Writes a batch from wikidata_dump.extract_lines in one transaction """
+        entities = [
+            (entity_id, entity_type, json.dumps(fields))
+            for entity_id, _, entity_type, fields in extracted
+        ]
+
+        connection = self._connect()
+        with connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO entities VALUES (?, ?, ?)", entities
+            )
+
+    def add_labels(self, labels: list):
+        """ Writes a batch from wikidata_dump.extract_labels in one transaction """
+        connection = self._connect()
+        with connection:
+            connection.executemany("INSERT OR REPLACE INTO labels VALUES (?, ?)", labels)
+
+    def get_fields(self, entity_id: str) -> Union[tuple, None]:
+        """ Returns the (EntityType, fields) stored for the entity, or None """
+        row = self._connect().execute(
+            "SELECT entity_type, fields FROM entities WHERE id = ?", (entity_id,)
+        ).fetchone()
+        if row is None:
+            return None
+
+        return EntityType[row[0]], json.loads(row[1])
+
+    def get_labels(self, entity_ids: list) -> dict:
+        """ Returns a dict of entity ID to English label, for those that have one """
+        labels = {}
+        connection = self._connect()
+        for start in range(0, len(entity_ids), LABEL_LOOKUP_CHUNK):
+            chunk = entity_ids[start:start + LABEL_LOOKUP_CHUNK]
+            placeholders = ", ".join("?" * len(chunk))
+            rows = connection.execute(
+                f"SELECT id, label FROM labels WHERE id IN ({placeholders})", chunk
+            )
+            labels.update(rows)
+
+        return labels
+
+    def get_panel(self, entity_id: str) -> Union[tuple, None]:
+        """ Returns the (EntityType, panel) for the entity, or None if it isn't stored """
+        if not self.enabled:
+            return None
+
+        stored = self.get_fields(entity_id)
+        if stored is None:
+            return None
+
+        entity_type, fields = stored
+        response = { 'results': { 'bindings': self._to_bindings(fields) } }
+        return entity_type, ENTITY_FORMATTERS[entity_type](response)
+
+    def _to_bindings(self, fields: dict) -> list:
+        """ Turns stored fields back into rows like the query service returns, with a
+            <column>Label for every linked entity. Each column's values are spread over
+            the rows in order, which formats the same as the query service's rows
+            without needing every combination of them.
+        """
+        columns = {
+            column: values for column, values in fields.items()
+            if column not in ("name", "description")
+        }
+
+        linked_ids = sorted({
+            value[len(ENTITY_URI_PREFIX):]
+            for values in columns.values() for value in values
+            if value.startswith(ENTITY_URI_PREFIX)
+        })
+        labels = self.get_labels(linked_ids)
+        for column, values in list(columns.items()):
+            if any(value.startswith(ENTITY_URI_PREFIX) for value in values):
+                # Like the label service, fall back to the ID if there's no label
+                ids = [value[len(ENTITY_URI_PREFIX):] for value in values]
+                columns[f"{column}Label"] = [labels.get(id_, id_) for id_ in ids]
+
+        rows = max([1] + [len(values) for values in columns.values()])
+        bindings = []
+        for index in range(rows):
+            row = {
+                column: { 'value': fields[column] }
+                for column in ("name", "description") if fields.get(column)
+            }
+            for column, values in columns.items():
+                if index < len(values):
+                    row[column] = { 'value': values[index] }
+            bindings.append(row)
+
+        return bindings
+
+    def count(self) -> int:
+        """ Returns how many entities are stored """
+        return self._connect().execute("SELECT COUNT(*) FROM entities").fetchone()[0]
+
+panel_store = PanelStore()
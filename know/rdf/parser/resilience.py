@@ -0,0 +1,139 @@
+import time
+import random
+import threading
+from enum import Enum
+from typing import Union
+
+class BreakerState(Enum):
+    """ The states a CircuitBreaker can be in """
+    CLOSED = 0 # Requests go through as normal
+    OPEN = 1 # Requests fail fast without being made
+    HALF_OPEN = 2 # A few probe requests go through to see if upstream recovered
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """ Returns how long to wait before the given retry (starting from 0), using
+        exponential backoff with full jitter so retries from different requests don't
+        all hit upstream at the same time
+    """
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+class RetryBudget:
+    """ Limits retries to a fraction of the requests made, so that during an outage
+        retries don't multiply the load on upstream.
+
+        Every request deposits `ratio` tokens (up to `max_tokens`), and every retry
+        withdraws one. When there are no tokens left, requests aren't retried.
+    """
+
+    def __init__(self, ratio: float, max_tokens: float):
+        self._lock = threading.Lock()
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.tokens = max_tokens
+        self.retries = 0
+        self.denied = 0
+
+    def record_request(self):
+        """ Deposits tokens for a new (non-retry) request """
+        with self._lock:
+            self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def try_retry(self) -> bool:
+        """ Withdraws a token for a retry. Returns False if the budget is spent """
+        with self._lock:
+            if self.tokens < 1:
+                self.denied += 1
+                return False
+
+            self.tokens -= 1
+            self.retries += 1
+            return True
+
+class CircuitBreaker: # pylint: disable=too-many-instance-attributes
+    """ Stops requests to upstream after `failure_threshold` consecutive failures, so
+        that during an outage requests fail fast instead of waiting on it.
+
+        After `reset_timeout` seconds it lets `half_open_probes` requests through: if
+        they succeed it closes again, and if any of them fail it opens again.
+
+        Every change of state starts a new generation, and a request's outcome only
+        counts if it was let through in the current one. So a request that was already
+        in flight when the breaker opened can't close it before the probe does.
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float,
+                 half_open_probes: int = 1):
+        self._lock = threading.Lock()
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_probes = half_open_probes
+        self.state = BreakerState.CLOSED
+        self.generation = 0
+        self.failures = 0 # Consecutive failures
+        self.opened_at = 0.0
+        self.probes_in_flight = 0
+        self.short_circuited = 0 # How many requests failed fast while open
+
+    def _set_state(self, state: BreakerState):
+        self.state = state
+        self.generation += 1
+        self.probes_in_flight = 0
+
+    def allow_request(self) -> Union[int, None]:
+        """ Returns the generation the request is let through in, to pass to
+            record_success, record_failure or record_abandoned once it's done, or None
+            if the request shouldn't be made
+        """
+        with self._lock:
+            if self.state == BreakerState.OPEN:
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    self.short_circuited += 1
+                    return None
+
+                self._set_state(BreakerState.HALF_OPEN)
+
+            if self.state == BreakerState.HALF_OPEN:
+                if self.probes_in_flight >= self.half_open_probes:
+                    self.short_circuited += 1
+                    return None
+
+                self.probes_in_flight += 1
+
+            return self.generation
+
+    def record_success(self, generation: int):
+        """ Records that a request succeeded, closing the breaker if it was a probe """
+        with self._lock:
+            if generation != self.generation:
+                return
+
+            if self.state == BreakerState.HALF_OPEN:
+                self._set_state(BreakerState.CLOSED)
+            self.failures = 0
+
+    def record_abandoned(self, generation: int):
+        """ Records that a request was given up on before upstream answered, e.g.
+            because its deadline passed, which doesn't say whether upstream is healthy.
+            It only frees up its half-open probe
+        """
+        with self._lock:
+            if generation == self.generation and self.state == BreakerState.HALF_OPEN:
+                self.probes_in_flight = max(self.probes_in_flight - 1, 0)
+
+    def record_failure(self, generation: int):
+        """ Records that a request failed, opening the breaker if there were too many """
+        with self._lock:
+            if generation != self.generation:
+                return
+
+            self.failures += 1
+            tripped = self.failures >= self.failure_threshold
+            if self.state == BreakerState.HALF_OPEN or tripped:
+                self._set_state(BreakerState.OPEN)
+                self.opened_at = time.monotonic()
+
+    def reset(self):
+        """ Closes the breaker and forgets the failures, e.g. between tests """
+        with self._lock:
+            self._set_state(BreakerState.CLOSED)
+            self.failures = 0
@@ -0,0 +1,104 @@
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Hashable
+from rdf.parser.deadline import DeadlineExceeded, get_deadline, within_deadline
+
+class _Call:
+    """ An in-flight call that other callers with the same key can wait on """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+def _share_all(_: Any) -> bool:
+    return True
+
+class SingleFlight:
+    """ Coalesces concurrent calls that have the same key, so that only one of them
+        does the work while the rest wait for it and get its result, or its error.
+
+        Calls are only coalesced while one is in flight: once it finishes, the next
+        call with that key does the work again (so results should be cached elsewhere).
+
+        Waiting is bounded by the waiter's own deadline, not the leader's. If the
+        leader ran out of its time (DeadlineExceeded), or its result isn't one `share`
+        says waiters can use, a waiter does the work itself instead, in its own time.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._async_calls = {}
+        self.coalesced = 0 # How many calls waited on another instead of doing the work
+
+    def do(self, key: Hashable, function: Callable[[], Any],
+           share: Callable[[Any], bool] = _share_all) -> Any:
+        """ Calls function, unless there's already a call in flight for the key, in
+            which case it waits for that call and returns its result (or raises its
+            error) instead. Raises DeadlineExceeded if the request's deadline passes
+            while waiting
+        """
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                leader = call is None
+                if leader:
+                    call = _Call()
+                    self._calls[key] = call
+                else:
+                    self.coalesced += 1
+
+            if leader:
+                break
+
+            deadline = get_deadline()
+            if not call.done.wait(deadline.remaining() if deadline else None):
+                raise DeadlineExceeded("No time left to wait for the call in flight")
+            if isinstance(call.error, DeadlineExceeded):
+                continue # It ran out of its time, which isn't this caller's
+            if call.error is not None:
+                raise call.error
+            if share(call.result):
+                return call.result
+
+        try:
+            call.result = function()
+            return call.result
+        except Exception as err:
+            call.error = err
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    async def ado(self, key: Hashable, function: Callable[[], Awaitable[Any]],
+                  share: Callable[[Any], bool] = _share_all) -> Any:
+        """ Async version of do. Calls are only coalesced with others running in the
+            same event loop.
+        """
+        loop_key = (id(asyncio.get_running_loop()), key)
+        while True:
+            task = self._async_calls.get(loop_key)
+            if task is None:
+                break
+
+            self.coalesced += 1
+            # Waiting with asyncio.wait means a waiter being cancelled or running out of
+            # time doesn't cancel the call for everyone
+            await within_deadline(asyncio.wait({ task }))
+            if task.cancelled() or isinstance(task.exception(), DeadlineExceeded):
+                continue
+            if share(task.result()):
+                return task.result()
+
+        task = asyncio.ensure_future(function())
+        self._async_calls[loop_key] = task
+        task.add_done_callback(lambda _: self._async_calls.pop(loop_key, None))
+        return await asyncio.shield(task)
+
+    def in_flight(self) -> int:
+        """ Returns how many keys currently have a call in flight """
+        with self._lock:
+            return len(self._calls) + len(self._async_calls)
@@ -1,16 +1,70 @@
-import sys
-import os
+import re
+from pathlib import Path
+
+QUERY_DIRECTORY = Path(__file__).resolve().parent.parent / "queries" / "wikidata"
+PLACEHOLDER = "$0"
+ENTITY_ID_PATTERN = re.compile('Q[0-9]+')
+
+class InvalidEntityIdException(Exception):
+    """ Raised when a query is bound to something that isn't a Wikidata ID """
+
+class SparqlTemplate:
+    """ A query that's been split around its $0 placeholders, so binding an entity ID
+        to it is a single join
+    """
+
+    def __init__(self, query_string: str):
+        # Drop the comment lines, as they're only there for whoever reads the file
+        lines = query_string.splitlines(keepends=True)
+        self.parts = "".join(line for line in lines if "#" not in line).split(PLACEHOLDER)
+
+    def bind(self, value: str) -> str:
+        """ Returns the query with every $0 replaced with value """
+        return value.join(self.parts)
+
+class SparqlTemplateRegistry:
+    """ Holds every query template by file name, so they're only read from disk once """
+
+    def __init__(self):
+        self._templates = {}
+
+    def register(self, name: str, query_string: str):
+        """ Adds a template, replacing any existing one with the same name """
+        self._templates[name] = SparqlTemplate(query_string)
+
+    def load_directory(self, directory: Path):
+        """ Registers every .sparql file in the directory under its file name """
+        for path in sorted(directory.glob("*.sparql")):
+            self.register(path.name, path.read_text(encoding="utf-8"))
+
+    def get(self, name: str) -> SparqlTemplate:
+        """ Returns the template registered under the name """
+        return self._templates[name]
+
+registry = SparqlTemplateRegistry()
+registry.load_directory(QUERY_DIRECTORY)
+
+def _validate_entity_id(entity_id: str):
+    if not isinstance(entity_id, str) or not ENTITY_ID_PATTERN.fullmatch(entity_id):
+        raise InvalidEntityIdException(f"Invalid Wikidata ID: {entity_id!r}")
+
+def register_sparql(name: str, query_string: str):
+    """ Registers a query so it can be used with read_sparql, like the .sparql files in
+        rdf/queries/wikidata. $0 marks where the entity ID goes.
+    """
+    registry.register(name, query_string)
 
 def read_sparql(query_file: str, entity_id: str) -> str:
     """ Reads the .sparql file and replaces $0 with the given entity ID"""
-    relative_path = sys.path[0]
-    path_name = os.path.join(relative_path, "rdf", "queries", "wikidata", query_file)
-    query_string = ""
-    query_input = open(path_name, "r")
-    for line in query_input:
-        if line.find("#") == -1:
-            if line.find("$0") != -1:
-                query_string += line.replace("$0", entity_id)
-            else:
-                query_string += line
-    return query_string
+    _validate_entity_id(entity_id)
+    return registry.get(query_file).bind(entity_id)
+
+def read_sparql_values(query_file: str, entity_ids: list) -> str:
+    """ Like read_sparql, but replaces $0 with a list of entities for a VALUES block,
+        e.g. wd:Q23 wd:Q142
+    """
+    for entity_id in entity_ids:
+        _validate_entity_id(entity_id)
+
+    values = " ".join(f"wd:{entity_id}" for entity_id in entity_ids)
+    return registry.get(query_file).bind(values)
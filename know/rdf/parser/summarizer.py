@@ -1,28 +1,337 @@
-import re
-import rdflib
-from rdflib import Namespace
-from rdf.parser.wikidata_parser import WikidataParser
+from typing import Union
+import requests
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from rdf.parser.wikidata_parser import WikidataParser, parse_entities
+from rdf.parser.http_client import http_client, async_http_client
+from rdf.parser.single_flight import SingleFlight
+from rdf.parser.panel_store import panel_store
+from rdf.parser.panel_prefetcher import panel_prefetcher
+from rdf.parser.wikidata_dump import ENTITY_URI_PREFIX
+from rdf.parser.viaf_resolver import (
+    viaf_links, find_wikidata_link, afind_wikidata_link, get_viaf_cluster_uri
+)
+from rdf.parser.viaf_crosswalk import viaf_crosswalk
+from rdf.parser.telemetry import timed, record_cache_status
+from rdf.parser.deadline import (
+    DeadlineExceeded, request_deadline, get_panel_deadline, get_deadline,
+    get_partial_reserve
+)
+from rdf.parser.abstract_parser import EntityType
+from rdf.parser.panel_cache import (
+    panel_cache, panel_refresher, canonical_entity_key, panel_etag, WIKIDATA_ID_PATTERN,
+    VIAF_ID_PATTERN
+)
+# Coalesces concurrent summarize calls for the same entity in this process
+panel_flight = SingleFlight()
+
+def _cross_process_single_flight() -> bool:
+    return getattr(settings, 'PANEL_SINGLE_FLIGHT_CROSS_PROCESS', False)
+
+def _get_single_flight_wait() -> float:
+    """ How long to wait on another process' panel, which is never past the request's
+        deadline
+    """
+    wait = getattr(settings, 'PANEL_SINGLE_FLIGHT_WAIT', 10)
+    deadline = get_deadline()
+    return min(wait, deadline.remaining()) if deadline else wait
+
+def _can_share_panel(panel: dict) -> bool:
+    """ Whether a request can use the panel another request parsed. A partial panel
+        means that request ran out of time, so it's only used if this one doesn't have
+        time for the full panel either
+    """
+    if not panel or not panel.get('partial'):
+        return True
+
+    deadline = get_deadline()
+    return deadline is not None and deadline.remaining() <= get_partial_reserve()
+
+def _get_cache_status(entry: dict, stale: bool) -> str:
+    if entry is None:
+        return "miss"
+
+    return "stale" if stale else "hit"
+
 class NoWikidataException(Exception):
     """ Exception raised when Summarizer.get_wikidata_uri can't find a wikidata URI.
     """
-class Summarizer:
+class Summarizer: # pylint: disable=too-many-instance-attributes
     """ Returns summarizing information for any source """
 
     def __init__(self, uri: str):
         self.uri = uri
+        # The ETag and entity type of the summarized panel, and whether it was stale,
+        # for the panel route's ETag and Cache-Control headers. If it was cached, body
+        # and content_type are its encoded response, so it can be sent as is
+        self.etag = None
+        self.entity_type = None
+        self.stale = False
+        self.partial = False # Whether it only has a title and subtitle, see parse_partial
+        self.body = None
+        self.content_type = None
+        self.cached_entry = None # The entry of the panel this summarizer last cached
 
     def summarize(self):
         """ Checks which resource uri came from.
             Depending on the source creates appropriate parser and parses.
+            Panels are served from the panel cache when possible, and are keyed by
+            their Wikidata ID so every URI for the same entity shares one entry.
         """
         if self.valid_wikidata():
-            wiki_parser = WikidataParser(self.uri)
-            return wiki_parser.parse()
-        if self.valid_viaf():
-            wikidata_uri = self.get_wikidata_uri()
-            wiki_parser = WikidataParser(wikidata_uri)
-            return wiki_parser.parse()
-        return None
+            wikidata_uri = self.uri
+        elif self.valid_viaf():
+            wikidata_uri = self.resolve_viaf()
+        else:
+            return None
+
+        key = canonical_entity_key(wikidata_uri)
+        if not key:
+            return self._remember_entry(self._parse(wikidata_uri, key), key)
+
+        entry, stale = panel_cache.get_cached(key)
+        record_cache_status(_get_cache_status(entry, stale))
+        if entry is not None:
+            if stale: # Serve it now, and refresh it for the next request
+                self.refresh_panel(wikidata_uri, key)
+            return self._remember_entry(entry['panel'], key, entry, stale)
+
+        # Concurrent requests for the same entity share one parse
+        panel = panel_flight.do(
+            key, lambda: self._parse_coalesced(wikidata_uri, key), _can_share_panel
+        )
+        self.prefetch_linked(panel)
+        return self._remember_entry(panel, key)
+
+    @staticmethod
+    def summarize_many(uris: list) -> dict:
+        """ Summarizes many URIs at once, returning a dict of each URI to its panel
+            (or None if it couldn't be summarized). Panels that aren't cached are
+            parsed together with parse_entities, so the number of Wikidata queries
+            depends on how many entity types there are rather than how many URIs.
+            A URI that fails (e.g. its VIAF cluster can't be fetched) is None, but
+            DeadlineExceeded is raised once the request's deadline has passed.
+        """
+        panels = {}
+        missing = {} # URI -> Wikidata ID, for the URIs whose panels aren't cached
+        for uri in uris:
+            try:
+                panels[uri], entity_id = Summarizer(uri).find_batch_panel()
+            except DeadlineExceeded:
+                raise
+            except Exception as err: # pylint: disable=broad-except
+                print(f"Couldn't summarize {uri} ({err})")
+                panels[uri], entity_id = None, None
+
+            if entity_id:
+                missing[uri] = entity_id
+
+        parsed = parse_entities(sorted(set(missing.values())))
+        for entity_id, (entity_type, panel) in parsed.items():
+            if panel:
+                panel_cache.set(canonical_entity_key(entity_id), panel, entity_type)
+
+        for uri, entity_id in missing.items():
+            panels[uri] = parsed[entity_id][1] if entity_id in parsed else None
+
+        return panels
+
+    def find_batch_panel(self) -> tuple:
+        """ Returns the panel from the cache or the panel store and None, or None and
+            the Wikidata ID to parse if neither has it (or None and None if the URI
+            has no Wikidata entity)
+        """
+        try:
+            if self.valid_wikidata():
+                wikidata_uri = self.uri
+            elif self.valid_viaf():
+                wikidata_uri = self.resolve_viaf()
+            else:
+                wikidata_uri = ''
+        except (NoWikidataException, requests.RequestException):
+            wikidata_uri = ''
+
+        key = canonical_entity_key(wikidata_uri)
+        if not key:
+            return None, None
+
+        panel, stale = panel_cache.get_entry(key)
+        if stale:
+            self.refresh_panel(wikidata_uri, key)
+        if panel is None:
+            panel = self.read_panel_store(wikidata_uri, key)
+        if panel is None:
+            return None, WIKIDATA_ID_PATTERN.search(wikidata_uri).group(0)
+
+        return panel, None
+
+    async def asummarize(self):
+        """ Async version of summarize, which doesn't block while waiting on Wikidata
+            or VIAF. The panel cache is in-memory by default, so it's used directly.
+        """
+        if self.valid_wikidata():
+            wikidata_uri = self.uri
+        elif self.valid_viaf():
+            wikidata_uri = await self.aresolve_viaf()
+        else:
+            return None
+
+        key = canonical_entity_key(wikidata_uri)
+        if not key:
+            return self._remember_entry(await self._aparse(wikidata_uri, key), key)
+
+        entry, stale = panel_cache.get_cached(key)
+        record_cache_status(_get_cache_status(entry, stale))
+        if entry is not None:
+            if stale:
+                self.refresh_panel(wikidata_uri, key)
+            return self._remember_entry(entry['panel'], key, entry, stale)
+
+        panel = await panel_flight.ado(
+            key, lambda: self._aparse_coalesced(wikidata_uri, key), _can_share_panel
+        )
+        self.prefetch_linked(panel)
+        return self._remember_entry(panel, key)
+
+    # pylint: disable-next=too-many-arguments
+    def _remember_entry(self, panel: dict, key: str, entry: dict = None,
+                             stale: bool = False) -> dict:
+        """ Sets etag, entity_type, stale, body and content_type for the panel, from
+            its cache entry. Returns the panel
+        """
+        if panel is None:
+            return None
+
+        if entry is None and self.cached_entry and self.cached_entry['panel'] is panel:
+            entry = self.cached_entry # This summarizer just parsed and cached it
+        elif entry is None and key: # Another summarizer parsed it for us
+            entry = panel_cache.peek(key)[0]
+            if entry is not None and entry['panel'] != panel: # Refreshed since
+                entry = None
+
+        self.stale = stale
+        self.partial = panel.get('partial', False)
+        if entry is None: # e.g. it couldn't be cached
+            self.etag = panel_etag(panel)
+            return panel
+
+        self.etag = entry['etag']
+        entity_type = entry['entity_type']
+        self.entity_type = EntityType[entity_type] if entity_type else None
+        self.body = entry['body']
+        self.content_type = entry['content_type']
+        return panel
+
+    def refresh_panel(self, wikidata_uri: str, key: str):
+        """ Re-parses a stale panel in the background. If that fails, the stale panel
+            stays cached until its stale TTL runs out
+        """
+        panel_refresher.submit(key, lambda: self._parse(wikidata_uri, key))
+
+    @staticmethod
+    def prefetch_linked(panel: dict):
+        """ Caches the panels of the entities the panel links to in the background, if
+            PANEL_PREFETCH is on, so they're cached by the time they're clicked on
+        """
+        panel_prefetcher.prefetch(panel, lambda uri, key: Summarizer(uri).prefetch(key))
+
+    def prefetch(self, key: str):
+        """ Parses and caches the panel for prefetch_linked. A request for it while
+            it's being parsed shares the parse, so it has the same deadline as requests,
+            and its own links aren't prefetched
+        """
+        with request_deadline(get_panel_deadline()):
+            panel_flight.do(
+                key, lambda: self._parse_coalesced(self.uri, key), _can_share_panel
+            )
+
+    def read_panel_store(self, wikidata_uri: str, key: str) -> dict:
+        """ Returns the panel from the local panel store and caches it, or None if the
+            store isn't built or doesn't have the entity
+        """
+        match = WIKIDATA_ID_PATTERN.search(wikidata_uri)
+        stored = panel_store.get_panel(match.group(0)) if match else None
+        if stored is None:
+            return None
+
+        record_cache_status("store")
+        entity_type, panel = stored
+        if key:
+            self.cached_entry = panel_cache.set(key, panel, entity_type)
+
+        return panel
+
+    def _parse(self, wikidata_uri: str, key: str) -> dict:
+        """ Parses the panel and caches it. It's read from the local panel store if it
+            has it, and only parsed from Wikidata otherwise. Partial panels aren't
+            cached, so the next request tries for the full one again
+        """
+        panel = self.read_panel_store(wikidata_uri, key)
+        if panel is not None:
+            return panel
+
+        wiki_parser = WikidataParser(wikidata_uri)
+        panel = wiki_parser.parse()
+        if panel and key and not panel.get('partial'):
+            self.cached_entry = panel_cache.set(key, panel, wiki_parser.entity_type)
+
+        return panel
+
+    async def _aparse(self, wikidata_uri: str, key: str) -> dict:
+        """ Async version of _parse. Reading the panel store blocks on SQLite, so it's
+            read on another thread (if it's been built)
+        """
+        if panel_store.enabled:
+            read = sync_to_async(self.read_panel_store, thread_sensitive=False)
+            panel = await read(wikidata_uri, key)
+            if panel is not None:
+                return panel
+
+        wiki_parser = WikidataParser(wikidata_uri)
+        panel = await wiki_parser.aparse()
+        if panel and key and not panel.get('partial'):
+            self.cached_entry = panel_cache.set(key, panel, wiki_parser.entity_type)
+
+        return panel
+
+    def _parse_coalesced(self, wikidata_uri: str, key: str) -> dict:
+        """ Parses the panel, unless PANEL_SINGLE_FLIGHT_CROSS_PROCESS is on and another
+            process is already parsing it, in which case its panel is used instead
+        """
+        if not _cross_process_single_flight():
+            return self._parse(wikidata_uri, key)
+
+        if not panel_cache.acquire_fill_lock(key):
+            wait = _get_single_flight_wait()
+            panel = panel_cache.wait_for_fill(key, wait)
+            if panel is not None:
+                return panel
+
+            # The other process failed or is taking too long, so parse it ourselves
+            return self._parse(wikidata_uri, key)
+
+        try:
+            return self._parse(wikidata_uri, key)
+        finally:
+            panel_cache.release_fill_lock(key)
+
+    async def _aparse_coalesced(self, wikidata_uri: str, key: str) -> dict:
+        """ Async version of _parse_coalesced """
+        if not _cross_process_single_flight():
+            return await self._aparse(wikidata_uri, key)
+
+        if not panel_cache.acquire_fill_lock(key):
+            wait = _get_single_flight_wait()
+            panel = await panel_cache.await_fill(key, wait)
+            if panel is not None:
+                return panel
+
+            return await self._aparse(wikidata_uri, key)
+
+        try:
+            return await self._aparse(wikidata_uri, key)
+        finally:
+            panel_cache.release_fill_lock(key)
 
     def valid_wikidata(self):
         """ If the uri is a valid wikidata uri it returns True.
@@ -36,20 +345,99 @@ class Summarizer:
         """
         return 'viaf' in self.uri
 
+    def get_viaf_id(self) -> Union[str, None]:
+        """ Returns the VIAF cluster ID in the uri, or None if there isn't one """
+        match = VIAF_ID_PATTERN.search(self.uri)
+        return match.group(0) if match else None
+
+    def _get_cached_wikidata_uri(self, viaf_id: str) -> Union[str, None]:
+        """ Returns the Wikidata URI from the VIAF crosswalk index, or that the cluster
+            resolved to before, or None if neither has it. Raises NoWikidataException
+            if it's known not to have one
+        """
+        wikidata_id = viaf_crosswalk.lookup(viaf_id)
+        if wikidata_id:
+            return ENTITY_URI_PREFIX + wikidata_id
+
+        found, wikidata_id = viaf_links.get(viaf_id) if viaf_id else (False, None)
+        if not found:
+            return None
+
+        if wikidata_id is None:
+            raise NoWikidataException("Couldn't find associated wikidata URI!")
+
+        return ENTITY_URI_PREFIX + wikidata_id
+
+    def _remember_wikidata_uri(self, viaf_id: str, wikidata_uri: Union[str, None]):
+        """ Caches which Wikidata ID the cluster resolved to, or that it has none """
+        if not viaf_id:
+            return
+
+        match = WIKIDATA_ID_PATTERN.search(wikidata_uri) if wikidata_uri else None
+        viaf_links.set(viaf_id, match.group(0) if match else None)
+
+    def resolve_viaf(self):
+        """ Returns the Wikidata URI for this VIAF uri, using the cached result of a
+            previous get_wikidata_uri call if there is one (including when it found
+            nothing, in which case NoWikidataException is raised without fetching it).
+        """
+        viaf_id = self.get_viaf_id()
+        wikidata_uri = self._get_cached_wikidata_uri(viaf_id)
+        if wikidata_uri:
+            return wikidata_uri
+
+        try:
+            with timed("viaf"):
+                wikidata_uri = self.get_wikidata_uri()
+        except NoWikidataException:
+            self._remember_wikidata_uri(viaf_id, None)
+            raise
+
+        self._remember_wikidata_uri(viaf_id, wikidata_uri)
+        return wikidata_uri
+
+    async def aresolve_viaf(self):
+        """ Async version of resolve_viaf """
+        viaf_id = self.get_viaf_id()
+        wikidata_uri = self._get_cached_wikidata_uri(viaf_id)
+        if wikidata_uri:
+            return wikidata_uri
+
+        try:
+            with timed("viaf"):
+                wikidata_uri = await self.aget_wikidata_uri()
+        except NoWikidataException:
+            self._remember_wikidata_uri(viaf_id, None)
+            raise
+
+        self._remember_wikidata_uri(viaf_id, wikidata_uri)
+        return wikidata_uri
+
     def get_wikidata_uri(self):
-        """ Parse viaf rdf file and search for a wikidata
-            resource that is the 'sameAs' the given one.
+        """ Streams the VIAF rdf file and searches it for a wikidata resource that is
+            the 'sameAs' the given one, stopping as soon as it's found.
         """
-        graph = rdflib.Graph()
-        graph.parse(self.uri) #loads rdf triples in rdf data from uri into the graph
+        # Fetch through the shared client so the VIAF connection is kept alive
+        with http_client.stream(
+            get_viaf_cluster_uri(self.uri, self.get_viaf_id()),
+            headers={ 'Accept': 'application/rdf+xml' }, raise_for_status=True,
+        ) as chunks:
+            wikidata_uri = find_wikidata_link(chunks, self.get_viaf_id())
+
+        if not wikidata_uri:
+            raise NoWikidataException("Couldn't find associated wikidata URI!")
+
+        return wikidata_uri
 
-        viaf_uri_base = "http://viaf.org/viaf/"
-        entity_id = re.search('[0-9]+', self.uri).group(0)
-        viaf_entity = rdflib.URIRef(viaf_uri_base + entity_id)
+    async def aget_wikidata_uri(self):
+        """ Async version of get_wikidata_uri """
+        async with async_http_client.stream(
+            get_viaf_cluster_uri(self.uri, self.get_viaf_id()),
+            headers={ 'Accept': 'application/rdf+xml' }, raise_for_status=True,
+        ) as chunks:
+            wikidata_uri = await afind_wikidata_link(chunks, self.get_viaf_id())
 
-        schema = Namespace('http://schema.org/')
-        for _, __, obj in graph.triples((viaf_entity, schema.sameAs, None)):
-            if 'wikidata' in str(obj):
-                return str(obj)
+        if not wikidata_uri:
+            raise NoWikidataException("Couldn't find associated wikidata URI!")
 
-        raise NoWikidataException("Couldn't find associated wikidata URI!")
+        return wikidata_uri
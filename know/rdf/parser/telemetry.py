@@ -0,0 +1,211 @@
+import time
+import bisect
+import threading
+import contextvars
+from itertools import accumulate
+from typing import Union
+
+# Upper bounds of the histogram buckets, in seconds for timings
+TIME_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+ROW_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+INFINITY_LABEL = 'le="+Inf"'
+# The stats that only ever count up (until the process restarts), which are exported as
+# counters. The rest, like the cache's hit ratio or the breaker's state, are gauges
+COUNTERS = frozenset((
+    'hits', 'stale_hits', 'misses', # Panel cache
+    'submitted', 'prefetched', 'cached', 'dropped', 'failed', # Panel prefetcher
+    'requests', 'connections_opened', 'connections_reused', # HTTP client
+    'breaker_short_circuited', 'retries', 'retries_denied', # Wikidata resilience
+    'hedges', 'hedge_wins', 'hedges_denied', 'saved_seconds', # Wikidata hedging
+))
+
+class Histogram:
+    """ A Prometheus histogram, with a set of buckets for each combination of labels """
+
+    def __init__(self, name: str, description: str, label_names: tuple, buckets: tuple):
+        self.name = name
+        self.description = description
+        self.label_names = label_names
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        # Label values -> [count of the values that only fit in each bucket and up, sum]
+        # The last count is for the values that don't fit in any (+Inf)
+        self._series = {}
+
+    def observe(self, value: float, *label_values: str):
+        """ Records a value for the labels. This is on the request path, so only the
+            smallest bucket it fits in is counted, and the rest are added up in render
+        """
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0]
+
+            series[0][index] += 1
+            series[1] += value
+
+    def _labels(self, label_values: tuple, extra: str = "") -> str:
+        labels = [
+            f'{name}="{value}"' for name, value in zip(self.label_names, label_values)
+        ]
+        if extra:
+            labels.append(extra)
+
+        return "{" + ",".join(labels) + "}" if labels else ""
+
+    def render(self) -> list:
+        """ Returns the lines of the Prometheus text format for the histogram """
+        lines = [
+            f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"
+        ]
+        with self._lock:
+            series = sorted(
+                (label_values, list(counts), total)
+                for label_values, (counts, total) in self._series.items()
+            )
+
+        for label_values, counts, total in series:
+            cumulative_counts = list(accumulate(counts))
+            count = cumulative_counts[-1]
+            for bound, bucket_count in zip(self.buckets, cumulative_counts):
+                labels = self._labels(label_values, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{labels} {bucket_count}")
+            infinity_labels = self._labels(label_values, INFINITY_LABEL)
+            lines.append(f"{self.name}_bucket{infinity_labels} {count}")
+            lines.append(f"{self.name}_sum{self._labels(label_values)} {total}")
+            lines.append(f"{self.name}_count{self._labels(label_values)} {count}")
+
+        return lines
+
+    def clear(self):
+        """ Forgets everything that's been observed """
+        with self._lock:
+            self._series = {}
+
+phase_seconds = Histogram(
+    "know_phase_seconds", "Time spent in each phase of making a panel",
+    ("phase",), TIME_BUCKETS,
+)
+request_seconds = Histogram(
+    "know_request_seconds", "Time taken to respond to a request, by view and status",
+    ("view", "status"), TIME_BUCKETS,
+)
+sparql_rows = Histogram(
+    "know_sparql_rows", "Rows in each Wikidata SPARQL response", (), ROW_BUCKETS
+)
+sparql_retries = Histogram(
+    "know_sparql_retries", "Retries each Wikidata SPARQL query needed", (),
+    (0, 1, 2, 3, 4),
+)
+HISTOGRAMS = [phase_seconds, request_seconds, sparql_rows, sparql_retries]
+
+class RequestTiming:
+    """ Where the time of one request went, for its Server-Timing header """
+
+    def __init__(self):
+        self.phases = {} # Phase -> seconds, in the order they first happened
+        self.cache_status = None
+        self.retries = 0
+        self.rows = 0
+
+    def add(self, phase: str, seconds: float):
+        """ Adds time to a phase. A phase can happen more than once, e.g. two queries """
+        self.phases[phase] = self.phases.get(phase, 0) + seconds
+
+    def header(self) -> str:
+        """ Returns the value of the Server-Timing header """
+        metrics = [
+            f"{phase};dur={seconds * 1000:.1f}" for phase, seconds in self.phases.items()
+        ]
+        if self.cache_status:
+            metrics.append(f'cache;desc="{self.cache_status}"')
+        if self.rows:
+            metrics.append(f'sparql_rows;desc="{self.rows}"')
+        if self.retries:
+            metrics.append(f'sparql_retries;desc="{self.retries}"')
+
+        return ", ".join(metrics)
+
+_current_timing = contextvars.ContextVar('request_timing', default=None)
+
+def start_request() -> tuple:
+    """ Starts timing a request, returning the timing and a token for end_request """
+    timing = RequestTiming()
+    return timing, _current_timing.set(timing)
+
+def end_request(token: contextvars.Token):
+    """ Stops timing the request """
+    _current_timing.reset(token)
+
+def get_request_timing() -> Union[RequestTiming, None]:
+    """ Returns the timing of the request being handled, if there is one """
+    return _current_timing.get()
+
+class timed: # pylint: disable=invalid-name
+    """ Times the block, adding it to the request's Server-Timing (if it's in a
+        request) and to the phase histogram. It's a class rather than a
+        @contextmanager as it's used on every query and format, and this is quicker
+    """
+    __slots__ = ('phase', 'started')
+
+    def __init__(self, phase: str):
+        self.phase = phase
+        self.started = 0
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+
+    def __exit__(self, *_):
+        seconds = time.perf_counter() - self.started
+        phase_seconds.observe(seconds, self.phase)
+        timing = _current_timing.get()
+        if timing is not None:
+            timing.add(self.phase, seconds)
+
+def record_sparql_response(response: Union[dict, None], retries: int):
+    """ Records how many rows a SPARQL response had and how many retries it took """
+    sparql_retries.observe(retries)
+    rows = len(response['results']['bindings']) if response else 0
+    if response:
+        sparql_rows.observe(rows)
+
+    timing = _current_timing.get()
+    if timing is not None:
+        timing.retries += retries
+        timing.rows += rows
+
+def record_cache_status(status: str):
+    """ Records whether the request's panel was a cache hit, stale, or a miss """
+    timing = _current_timing.get()
+    if timing is not None:
+        timing.cache_status = status
+
+def _render_stats(prefix: str, stats: dict) -> list:
+    lines = []
+    for name, value in stats.items():
+        if isinstance(value, str): # e.g. the circuit breaker's state
+            lines.append(f"# TYPE {prefix}_{name} gauge")
+            lines.append(f'{prefix}_{name}{{{name}="{value}"}} 1')
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            if name in COUNTERS:
+                lines.append(f"# TYPE {prefix}_{name}_total counter")
+                lines.append(f"{prefix}_{name}_total {value}")
+            else:
+                lines.append(f"# TYPE {prefix}_{name} gauge")
+                lines.append(f"{prefix}_{name} {value}")
+
+    return lines
+
+def render_metrics(stats: dict) -> str:
+    """ Returns the histograms, and the stats (a dict of prefix to a dict of values,
+        e.g. { "know_panel_cache": panel_cache.stats() }) in the Prometheus text format.
+        The stats in COUNTERS are counters, and the rest are gauges
+    """
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines.extend(histogram.render())
+    for prefix, values in stats.items():
+        lines.extend(_render_stats(prefix, values))
+
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,231 @@
+import os
+import bz2
+import gzip
+import heapq
+import mmap
+import struct
+import tempfile
+import threading
+import time
+from typing import Iterable, Iterator, Union
+from django.conf import settings
+
+MAGIC = b"VIAFQID1"
+HEADER = struct.Struct(">8sQ") # Magic, then how many records there are
+# VIAF IDs can be longer than 64 bits, so they're stored as 128 bit big-endian
+# numbers, which sort the same as bytes as they do as numbers
+KEY_SIZE = 16
+MAX_VIAF_ID_DIGITS = 38 # The most that fit in KEY_SIZE bytes
+RECORD = struct.Struct(">16sQ") # VIAF ID, then the number of the QID
+WIKIDATA_SOURCE = "WKP|" # How the links file marks a Wikidata ID
+SORT_CHUNK_SIZE = 1000000 # Records sorted in memory at a time while building
+STAT_INTERVAL = 5 # Seconds between checks for a rebuilt (or removed) index file
+
+def _is_viaf_id(viaf_id: str) -> bool:
+    return viaf_id.isdigit() and len(viaf_id) <= MAX_VIAF_ID_DIGITS
+
+def _encode_viaf_id(viaf_id: str) -> bytes:
+    return int(viaf_id).to_bytes(KEY_SIZE, "big")
+
+def _open_links(path: str):
+    if str(path).endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8")
+    if str(path).endswith(".bz2"):
+        return bz2.open(path, "rt", encoding="utf-8")
+
+    return open(path, "rt", encoding="utf-8")
+
+def read_links(path: str) -> Iterator[bytes]:
+    """ Yields an encoded record for every Wikidata link in a VIAF cluster links file
+        (e.g. viaf-20240101-links.txt.gz), whose lines look like
+        http://viaf.org/viaf/75121530<tab>WKP|Q937
+    """
+    with _open_links(path) as links:
+        for line in links:
+            cluster, _, source_id = line.rstrip("\n").partition("\t")
+            if not source_id.startswith(WIKIDATA_SOURCE):
+                continue
+
+            viaf_id = cluster.rstrip("/").rsplit("/", 1)[-1]
+            entity_id = source_id[len(WIKIDATA_SOURCE):]
+            if not _is_viaf_id(viaf_id) or not entity_id[1:].isdigit():
+                continue
+
+            yield RECORD.pack(_encode_viaf_id(viaf_id), int(entity_id[1:]))
+
+def _sorted_runs(records: Iterable[bytes], directory: str,
+                 chunk_size: int) -> Iterator[str]:
+    """ Sorts the records chunk_size at a time, writing each sorted run to a file """
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) >= chunk_size:
+            yield _write_run(sorted(chunk), directory)
+            chunk = []
+
+    if chunk:
+        yield _write_run(sorted(chunk), directory)
+
+def _write_run(records: list, directory: str) -> str:
+    run_file, path = tempfile.mkstemp(dir=directory, suffix=".run")
+    with os.fdopen(run_file, "wb") as run:
+        run.write(b"".join(records))
+
+    return path
+
+def _read_run(path: str) -> Iterator[bytes]:
+    with open(path, "rb") as run:
+        while True:
+            record = run.read(RECORD.size)
+            if not record:
+                return
+            yield record
+
+def build_crosswalk(links_path: str, index_path: str,
+                    chunk_size: int = SORT_CHUNK_SIZE) -> int:
+    """ Builds the index from a VIAF cluster links file, returning how many clusters it
+        has. The links are sorted chunk_size at a time and then merged, so the file
+        doesn't have to fit in memory. Clusters with several Wikidata links keep the
+        lowest QID.
+    """
+    directory = os.path.dirname(os.path.abspath(index_path))
+    with tempfile.TemporaryDirectory(dir=directory) as run_directory:
+        runs = list(_sorted_runs(read_links(links_path), run_directory, chunk_size))
+
+        count = 0
+        partial_path = f"{index_path}.partial"
+        with open(partial_path, "wb") as index:
+            index.write(HEADER.pack(MAGIC, 0))
+            previous_key = None
+            for record in heapq.merge(*(_read_run(path) for path in runs)):
+                if record[:KEY_SIZE] == previous_key:
+                    continue
+
+                index.write(record)
+                previous_key = record[:KEY_SIZE]
+                count += 1
+
+            index.seek(0)
+            index.write(HEADER.pack(MAGIC, count))
+
+    # Swap it in whole, so workers never map a half written index
+    os.replace(partial_path, index_path)
+    return count
+
+def _get_file_id(path: Union[str, None]) -> Union[tuple, None]:
+    """ Returns what tells the index file apart from a rebuilt one (which is a new
+        file, as build_crosswalk swaps it in), or None if there isn't one
+    """
+    if path is None:
+        return None
+
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+
+    return stat.st_dev, stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+class InvalidCrosswalkException(Exception):
+    """ Raised when the index file isn't one build_crosswalk made """
+
+class ViafCrosswalk:
+    """ A sorted, fixed width index of VIAF cluster ID to Wikidata ID, built offline
+        with `python manage.py build_viaf_crosswalk` and searched with a binary search.
+
+        The file is memory mapped read only, so it isn't read into memory and every
+        worker process shares the same pages of the OS page cache. Its path is the
+        VIAF_CROSSWALK_PATH setting, and it's only used once that file exists. It's
+        checked every STAT_INTERVAL seconds, and mapped again once it's been rebuilt. A
+        file that isn't a whole index is ignored, so VIAF is fetched instead.
+    """
+
+    def __init__(self, path: str = None):
+        self._path = path
+        self._lock = threading.Lock()
+        self._checked = (None, 0.0) # The path, and when its file was last checked
+        self._file_id = None
+        self._index = None # The map and how many records it has, once there's a file
+
+    @property
+    def path(self) -> Union[str, None]:
+        """ Where the index file is """
+        if self._path is not None:
+            return str(self._path)
+
+        path = getattr(settings, 'VIAF_CROSSWALK_PATH', None)
+        return str(path) if path else None
+
+    def _get_index(self) -> Union[tuple, None]:
+        path = self.path
+        checked_path, checked_at = self._checked
+        if path == checked_path and time.monotonic() - checked_at < STAT_INTERVAL:
+            return self._index
+
+        with self._lock:
+            file_id = _get_file_id(path)
+            if file_id is None:
+                self._index = None
+            elif file_id != self._file_id:
+                # A lookup may still be searching the old map, so it's left for the
+                # garbage collector to close rather than closed here
+                try:
+                    self._index = self._map_index(path)
+                except (InvalidCrosswalkException, OSError) as err:
+                    # The index is optional, so VIAF is fetched instead until the
+                    # file is replaced
+                    print(f"Not using the VIAF crosswalk: {err}")
+                    self._index = None
+
+            self._file_id = file_id
+            self._checked = (path, time.monotonic())
+            return self._index
+
+    @staticmethod
+    def _map_index(path: str) -> tuple:
+        with open(path, "rb") as index:
+            # An empty file can't be mapped, and one shorter than the header has none
+            if os.fstat(index.fileno()).st_size < HEADER.size:
+                raise InvalidCrosswalkException(f"{path} isn't a VIAF crosswalk")
+
+            mapped = mmap.mmap(index.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, count = HEADER.unpack_from(mapped)
+        if magic != MAGIC:
+            mapped.close()
+            raise InvalidCrosswalkException(f"{path} isn't a VIAF crosswalk")
+        if HEADER.size + count * RECORD.size > len(mapped):
+            mapped.close()
+            raise InvalidCrosswalkException(f"{path} is missing some of its records")
+
+        return mapped, count
+
+    def lookup(self, viaf_id: str) -> Union[str, None]:
+        """ Returns the Wikidata ID (e.g. Q937) of the VIAF cluster, or None if it
+            isn't in the index
+        """
+        index = self._get_index()
+        if index is None or not viaf_id or not _is_viaf_id(viaf_id):
+            return None
+
+        mapped, count = index
+        key = _encode_viaf_id(viaf_id)
+        low, high = 0, count
+        while low < high:
+            middle = (low + high) // 2
+            offset = HEADER.size + middle * RECORD.size
+            middle_key = mapped[offset:offset + KEY_SIZE]
+            if middle_key < key:
+                low = middle + 1
+            elif middle_key > key:
+                high = middle
+            else:
+                return f"Q{RECORD.unpack_from(mapped, offset)[1]}"
+
+        return None
+
+    def __len__(self) -> int:
+        index = self._get_index()
+        return index[1] if index is not None else 0
+
+viaf_crosswalk = ViafCrosswalk()
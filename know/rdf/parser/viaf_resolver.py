@@ -0,0 +1,194 @@
+import os
+import time
+import sqlite3
+import threading
+from typing import AsyncIterable, Iterable, Tuple, Union
+from xml.etree.ElementTree import XMLPullParser
+from django.conf import settings
+from django.core.cache import caches
+
+VIAF_URI_BASE = "http://viaf.org/viaf/"
+RDF_NAMESPACE = "{http://www.w3.org/1999/02/22-rdf-syntax-ns#}"
+SAME_AS = "{http://schema.org/}sameAs"
+NO_LINK = "" # Cached for clusters that don't have a Wikidata link
+DEFAULT_NEGATIVE_TTL = 60 * 60 * 24 # Clusters do gain links, so check again daily
+LINK_TTL = 60 * 60 * 24 * 7 # VIAF -> QID links almost never change
+DEFAULT_LINK_CACHE_ALIAS = 'viaf_links'
+
+def get_viaf_cluster_uri(uri: str, viaf_id: str) -> str:
+    """ Returns where to fetch the VIAF cluster from, which is the URI itself unless the
+        VIAF_ENDPOINT setting points somewhere else, e.g. the stand-in server
+    """
+    endpoint = getattr(settings, 'VIAF_ENDPOINT', None)
+    return f"{endpoint.rstrip('/')}/{viaf_id}/" if endpoint else uri
+
+class _SameAsFinder:
+    """ Finds the cluster's schema:sameAs Wikidata link in VIAF's RDF/XML as it's fed
+        in, so reading can stop as soon as it's found rather than parsing it all.
+
+        The link is either the rdf:resource of the sameAs property, or the rdf:about of
+        the node inside it, and only counts if it's a property of the cluster itself.
+    """
+
+    def __init__(self, viaf_id: str):
+        self.viaf_uri = VIAF_URI_BASE + viaf_id
+        self._parser = XMLPullParser(events=("start", "end"))
+        self._open = [] # The elements that have started but not ended yet
+
+    def _subject(self, depth: int) -> Union[str, None]:
+        if len(self._open) < depth:
+            return None
+
+        return self._open[-depth].get(f"{RDF_NAMESPACE}about", "").rstrip("/")
+
+    def _get_link(self, element) -> Union[str, None]:
+        if element.tag == SAME_AS and self._subject(1) == self.viaf_uri:
+            link = element.get(f"{RDF_NAMESPACE}resource")
+        elif self._open and self._open[-1].tag == SAME_AS \
+                and self._subject(2) == self.viaf_uri:
+            link = element.get(f"{RDF_NAMESPACE}about")
+        else:
+            return None
+
+        return link if link and "wikidata" in link else None
+
+    def feed(self, chunk: bytes) -> Union[str, None]:
+        """ Parses the next chunk, returning the Wikidata link if it was in it """
+        self._parser.feed(chunk)
+        for event, element in self._parser.read_events():
+            if event == "end":
+                self._open.pop()
+                element.clear() # Only the open elements are needed
+                continue
+
+            link = self._get_link(element)
+            if link:
+                return link
+            self._open.append(element)
+
+        return None
+
+def find_wikidata_link(chunks: Iterable[bytes], viaf_id: str) -> Union[str, None]:
+    """ Returns the Wikidata URI the VIAF cluster's RDF/XML says it's the sameAs, or
+        None if there isn't one. Stops reading chunks as soon as it's found
+    """
+    finder = _SameAsFinder(viaf_id)
+    for chunk in chunks:
+        link = finder.feed(chunk)
+        if link:
+            return link
+
+    return None
+
+async def afind_wikidata_link(chunks: AsyncIterable[bytes],
+                              viaf_id: str) -> Union[str, None]:
+    """ Async version of find_wikidata_link """
+    finder = _SameAsFinder(viaf_id)
+    async for chunk in chunks:
+        link = finder.feed(chunk)
+        if link:
+            return link
+
+    return None
+
+class ViafLinkCache:
+    """ Remembers which Wikidata ID each VIAF cluster resolved to, including the
+        clusters that don't have one, so a VIAF URI only has to be fetched once.
+
+        Links are kept in the Django cache backend chosen with the VIAF_LINK_CACHE_ALIAS
+        setting, which is separate from the panel cache so they don't take the place of
+        panels, and also in a SQLite file at VIAF_CACHE_PATH if that's set, so they
+        survive restarts and are shared between processes. Clusters without a link are
+        only remembered for VIAF_NEGATIVE_TTL seconds.
+    """
+
+    def __init__(self):
+        self._local = threading.local() # SQLite connections can't be shared by threads
+
+    @property
+    def backend(self):
+        """ The Django cache backend links are kept in memory in """
+        return caches[
+            getattr(settings, 'VIAF_LINK_CACHE_ALIAS', DEFAULT_LINK_CACHE_ALIAS)
+        ]
+
+    @property
+    def path(self) -> Union[str, None]:
+        """ Where the SQLite file is, or None if links are only kept in memory """
+        path = getattr(settings, 'VIAF_CACHE_PATH', None)
+        return str(path) if path else None
+
+    def get_negative_ttl(self) -> int:
+        """ Returns how many seconds a cluster without a link is remembered for """
+        return getattr(settings, 'VIAF_NEGATIVE_TTL', DEFAULT_NEGATIVE_TTL)
+
+    def _connect(self) -> sqlite3.Connection:
+        # Reconnect if the path changed, or in a new process after a fork
+        connection_key = (self.path, os.getpid())
+        if getattr(self._local, 'key', None) != connection_key:
+            connection = sqlite3.connect(self.path)
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS viaf_links ("
+                " viaf_id TEXT PRIMARY KEY, wikidata_id TEXT, resolved_at REAL NOT NULL"
+                ") WITHOUT ROWID"
+            )
+            self._local.connection = connection
+            self._local.key = connection_key
+
+        return self._local.connection
+
+    def _read_file(self, viaf_id: str) -> Tuple[bool, Union[str, None]]:
+        row = self._connect().execute(
+            "SELECT wikidata_id, resolved_at FROM viaf_links WHERE viaf_id = ?",
+            (viaf_id,),
+        ).fetchone()
+        if row is None:
+            return False, None
+
+        wikidata_id, resolved_at = row
+        if wikidata_id is None and time.time() - resolved_at > self.get_negative_ttl():
+            return False, None # Time to check if it has a link yet
+
+        return True, wikidata_id
+
+    def get(self, viaf_id: str) -> Tuple[bool, Union[str, None]]:
+        """ Returns whether the cluster has been resolved, and the Wikidata ID it
+            resolved to (None if it has no link)
+        """
+        wikidata_id = self.backend.get(f"viaf:{viaf_id}")
+        if wikidata_id is not None:
+            return True, wikidata_id or None
+
+        if not self.path:
+            return False, None
+
+        found, wikidata_id = self._read_file(viaf_id)
+        if found: # Keep it in memory too, so the file isn't read every time
+            self._set_alias(viaf_id, wikidata_id)
+
+        return found, wikidata_id
+
+    def _set_alias(self, viaf_id: str, wikidata_id: Union[str, None]):
+        if wikidata_id:
+            self.backend.set(f"viaf:{viaf_id}", wikidata_id, LINK_TTL)
+        else:
+            self.backend.set(f"viaf:{viaf_id}", NO_LINK, self.get_negative_ttl())
+
+    def set(self, viaf_id: str, wikidata_id: Union[str, None]):
+        """ Remembers the Wikidata ID the cluster resolved to, or None if it has none """
+        self._set_alias(viaf_id, wikidata_id)
+        if not self.path:
+            return
+
+        connection = self._connect()
+        with connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO viaf_links VALUES (?, ?, ?)",
+                (viaf_id, wikidata_id, time.time()),
+            )
+
+    def clear(self):
+        """ Forgets the links kept in memory (but not the ones in the file) """
+        self.backend.clear()
+
+viaf_links = ViafLinkCache()
@@ -0,0 +1,202 @@
+import re
+import bz2
+import gzip
+import json
+from typing import Iterator, Union
+from rdf.parser.abstract_parser import EntityType
+from rdf.parser.wikidata_parser import (
+    PERSON_ENTITY_CLASSES, BOOK_ENTITY_CLASSES, COUNTRY_CLASSES, LANDMARK_CLASSES
+)
+
+ENTITY_URI_PREFIX = "http://www.wikidata.org/entity/"
+DUMP_OPENERS = {
+    ".gz": gzip.open,
+    ".bz2": bz2.open,
+}
+
+# The start of a line of the dump, which has the entity's ID
+LINE_ID_PATTERN = re.compile(r'\{(?:"type":\s*"\w+",\s*)?"id":\s*"(\w+)"')
+
+# Which entity type an entity is, by the ID of the class it's an instance of (P31)
+ENTITY_CLASSES = {
+    **{ class_id: EntityType.PERSON for class_id in PERSON_ENTITY_CLASSES },
+    **{ class_id: EntityType.BOOK for class_id in BOOK_ENTITY_CLASSES },
+    **{ class_id: EntityType.COUNTRY for class_id in COUNTRY_CLASSES },
+    **{ class_id: EntityType.LANDMARK for class_id in LANDMARK_CLASSES },
+}
+
+# The properties each entity type's .sparql file selects, by the column they're
+# selected as. Columns of items also get a <column>Label column when they're read back
+ENTITY_PROPERTIES = {
+    EntityType.PERSON: {
+        "birthDate": "P569",
+        "deathDate": "P570",
+        "spouse": "P26",
+        "nationality": "P27",
+        "occupation": "P106",
+    },
+    EntityType.BOOK: {
+        "author": "P50",
+        "genre": "P136",
+        "published": "P577",
+    },
+    EntityType.COUNTRY: {
+        "population": "P1082",
+        "continent": "P30",
+        "capital": "P36",
+        "areaKmSquared": "P2046",
+        "headOfGov": "P6",
+        "headOfState": "P35",
+    },
+    EntityType.LANDMARK: {
+        "territoryLocation": "P131",
+        "countryLocation": "P17",
+        "inception": "P571",
+        "coordinates": "P625",
+    },
+}
+
+class UnsupportedDumpException(Exception):
+    """ Raised when a dump isn't compressed in a way we can read """
+
+def open_dump(path: str):
+    """ Opens a gzip or bzip2 compressed Wikidata JSON dump as text """
+    for extension, opener in DUMP_OPENERS.items():
+        if str(path).endswith(extension):
+            return opener(path, "rt", encoding="utf-8")
+
+    raise UnsupportedDumpException(f"Expected a .gz or .bz2 dump, got {path}")
+
+def iter_dump_lines(path: str) -> Iterator[str]:
+    """ Yields the JSON of each entity in the dump, one at a time so the dump never has
+        to fit in memory. The dump is one big JSON array with an entity on each line,
+        so each line just needs its trailing comma removed.
+    """
+    with open_dump(path) as dump:
+        for line in dump:
+            line = line.strip().rstrip(",")
+            if line in ("[", "]", ""):
+                continue
+
+            yield line
+
+def get_line_entity_id(line: str) -> str:
+    """ Returns the ID of the entity on a line of the dump, which the dumps have at the
+        start of the line, so the rest of it doesn't have to be decoded
+    """
+    match = LINE_ID_PATTERN.match(line)
+    return match.group(1) if match else json.loads(line)["id"]
+
+def _english(values: dict) -> Union[str, None]:
+    value = values.get("en")
+    return value["value"] if value else None
+
+def _best_statements(statements: list) -> list:
+    """ Returns the statements the wdt: prefix would, i.e. the preferred ones if there
+        are any, otherwise the normal ones (deprecated ones never count)
+    """
+    preferred = [
+        statement for statement in statements if statement["rank"] == "preferred"
+    ]
+    if preferred:
+        return preferred
+
+    return [statement for statement in statements if statement["rank"] == "normal"]
+
+def _format_time(time: str) -> str:
+    """ Formats a dump time like +1732-02-22T00:00:00Z the way the query service does.
+        Times less precise than a day have 00 months/days, which become 01
+    """
+    sign, time = time[0], time[1:]
+    date, _, clock = time.partition("T")
+    year, month, day = date.split("-")
+    month = "01" if month == "00" else month
+    day = "01" if day == "00" else day
+    return f"{'-' if sign == '-' else ''}{year}-{month}-{day}T{clock}"
+
+# How the query service formats each type of value, e.g. items as their entity URI
+VALUE_FORMATTERS = {
+    "wikibase-entityid": lambda value: ENTITY_URI_PREFIX + value["id"],
+    "time": lambda value: _format_time(value["time"]),
+    "quantity": lambda value: value["amount"].lstrip("+"),
+    "globecoordinate": lambda value: f"Point({value['longitude']} {value['latitude']})",
+    "monolingualtext": lambda value: value["text"],
+}
+
+def _snak_value(snak: dict) -> Union[str, None]:
+    """ Returns a statement's value the way the query service would. Returns None for
+        unknown or missing values
+    """
+    if snak.get("snaktype") != "value":
+        return None
+
+    datavalue = snak["datavalue"]
+    return VALUE_FORMATTERS.get(datavalue["type"], str)(datavalue["value"])
+
+def get_dump_entity_type(entity: dict) -> Union[EntityType, None]:
+    """ Returns the entity type of a dump entity from its instance of (P31) statements,
+        or None if it isn't one we make panels for
+    """
+    for statement in _best_statements(entity.get("claims", {}).get("P31", [])):
+        value = _snak_value(statement["mainsnak"])
+        class_id = value[len(ENTITY_URI_PREFIX):] if value else None
+        if class_id in ENTITY_CLASSES:
+            return ENTITY_CLASSES[class_id]
+
+    return None
+
+def extract_entity(entity: dict) -> tuple:
+    """ Extracts what's needed from a dump entity, returning its
+        (ID, English label, entity type, fields) where fields maps each column its
+        .sparql file selects to a list of values. The entity type and fields are None
+        if it isn't an entity we make panels for.
+    """
+    entity_id = entity["id"]
+    label = _english(entity.get("labels", {}))
+    entity_type = get_dump_entity_type(entity)
+    if entity_type is None:
+        return entity_id, label, None, None
+
+    claims = entity.get("claims", {})
+    fields = { "name": label, "description": _english(entity.get("descriptions", {})) }
+    for column, property_id in ENTITY_PROPERTIES[entity_type].items():
+        values = []
+        for statement in _best_statements(claims.get(property_id, [])):
+            value = _snak_value(statement["mainsnak"])
+            if value is not None and value not in values:
+                values.append(value)
+
+        fields[column] = values
+
+    return entity_id, label, entity_type.name, fields
+
+def get_linked_ids(fields: dict) -> set:
+    """ Returns the IDs of the entities the fields link to, whose labels the panel
+        needs
+    """
+    return {
+        value[len(ENTITY_URI_PREFIX):]
+        for values in fields.values() if isinstance(values, list)
+        for value in values if value.startswith(ENTITY_URI_PREFIX)
+    }
+
+def extract_lines(lines: list) -> list:
+    """ Decodes and extracts a batch of dump lines, keeping the entities we make panels
+        for. Runs in the ingestion worker processes, so it returns plain tuples that
+        are cheap to send back
+    """
+    extracted = (extract_entity(json.loads(line)) for line in lines)
+    return [entity for entity in extracted if entity[2] is not None]
+
+def extract_labels(lines: list) -> list:
+    """ Decodes a batch of dump lines, returning the (ID, English label) of the
+        entities that have one
+    """
+    labels = []
+    for line in lines:
+        entity = json.loads(line)
+        label = _english(entity.get("labels", {}))
+        if label:
+            labels.append((entity["id"], label))
+
+    return labels
@@ -1,42 +1,90 @@
-from rdf.parser.format_output import format_query, format_date_string
+from rdf.parser.format_output import compile_format_plan, format_date_string
 
-def format_country(response: dict) -> dict:
-    """ Formats a country into the expected output format
-        - France: https://www.wikidata.org/wiki/Q142
-        - New Zealand: https://www.wikidata.org/wiki/Q664
-        - Ghana:https://www.wikidata.org/wiki/Q117
-    """
-    entries_translations = {
+def _format_population(val: str) -> str:
+    # Convert to float from string, then convert to int to shave off decimals, and make
+    # it a comma separated string
+    return f"{int(float(val)):,}"
+
+def _format_area(val: str) -> str:
+    return f"{_format_population(val)} km sq." # Add the units
+
+COUNTRY_PLAN = compile_format_plan(
+    entries_translations={
         "population": "Population",
         "continentLabel": "Continent",
         "capitalLabel": "Capital",
         "areaKmSquared": "Area",
         "headOfGovLabel": "Head of Government",
         "headOfStateLabel": "Head of State"
-    }
-
-    entries_links = {
+    },
+    entries_links={
         "headOfGovLabel": "headOfGov",
         "headOfStateLabel": "headOfState"
-    }
+    },
+    converters={
+        "population": _format_population,
+        "areaKmSquared": _format_area,
+    },
+)
 
-    def format_area_and_population(val: str, key: str) -> str:
-        if val:
-            if key in ("areaKmSquared", "population"):
-                # Convert to float from string, then convert to int to shave off decimals
-                val = int(float(val))
-                # Make it comma separated string
-                val = "{:,}".format(val)
+LANDMARK_PLAN = compile_format_plan(
+    entries_translations={
+        "territoryLocationLabel": "Territory",
+        "countryLocationLabel": "Country",
+        "inception": "Creation Date"
+    },
+    entries_links={
+        "countryLocationLabel": "countryLocation",
+    },
+    converters={
+        "inception": format_date_string,
+    },
+)
 
-            if key == "areaKmSquared": # If the key is the area, add the units
-                return f"{val} km sq."
+BOOK_PLAN = compile_format_plan(
+    entries_translations={
+        "authorLabel": "Author",
+        # "name": "Title",
+        "genreLabel": "Genre",
+        "published": "Published"
+    },
+    entries_links={
+        "authorLabel": "author"
+    },
+    converters={
+        "published": format_date_string,
+    },
+)
 
-        # for all other keys, leave them alone
-        return val
+PERSON_PLAN = compile_format_plan(
+    entries_translations={
+        # "name": "Name",
+        "birthDate": "Born",
+        "deathDate": "Died",
+        "occupationLabel": "Occupation",
+        "nationalityLabel": "Nationality",
+        "spouseLabel": "Spouse"
+    },
+    entries_links={
+        "nationalityLabel": "nationality",
+        "spouseLabel": "spouse"
+    },
+    converters={
+        "birthDate": format_date_string,
+        "deathDate": format_date_string,
+    },
+)
 
-    return format_query(
-        response, entries_translations, entries_links, format_area_and_population,
-    )
+# A panel without any entries, for when only the title and subtitle could be fetched
+PARTIAL_PLAN = compile_format_plan(entries_translations={}, entries_links={})
+
+def format_country(response: dict) -> dict:
+    """ Formats a country into the expected output format
+        - France: https://www.wikidata.org/wiki/Q142
+        - New Zealand: https://www.wikidata.org/wiki/Q664
+        - Ghana:https://www.wikidata.org/wiki/Q117
+    """
+    return COUNTRY_PLAN.format(response)
 
 def format_landmark(response: dict) -> dict:
     """ Formats a landmark into the expected output format
@@ -44,25 +92,7 @@ def format_landmark(response: dict) -> dict:
         - Taj Mahal: https://www.wikidata.org/wiki/Q9141
         - Statue of Liberty: https://www.wikidata.org/wiki/Q9202
     """
-    entries_translations = {
-        "territoryLocationLabel": "Territory",
-        "countryLocationLabel": "Country",
-        "inception": "Creation Date"
-    }
-
-    entries_links = {
-        "countryLocationLabel": "countryLocation",
-    }
-
-    def format_date(val: str, key: str) -> str:
-        # If the key is the inception date, format it into a date string
-        if val and key == "inception":
-            return format_date_string(val)
-
-        # For all other keys, leave them alone
-        return val
-
-    return format_query(response, entries_translations, entries_links, format_date)
+    return LANDMARK_PLAN.format(response)
 
 def format_book(response: dict) -> dict:
     """ Formats a book into the expected output format
@@ -71,46 +101,26 @@ def format_book(response: dict) -> dict:
         - A Tale of Two Cities: https://www.wikidata.org/wiki/Q308918
         - Hunger Games: https://www.wikidata.org/wiki/Q11678
     """
-    entries_translations = {
-        "authorLabel": "Author",
-        # "name": "Title",
-        "genreLabel": "Genre",
-        "published": "Published"
-    }
-    entries_links = {
-        "authorLabel": "author"
-    }
-    def format_date(val: str, key: str) -> str:
-        # If the key is the publication date, format it into a date string
-        if val and key == "published":
-            return format_date_string(val)
+    return BOOK_PLAN.format(response)
 
-        # For all other keys, leave them alone
-        return val
-    return format_query(response, entries_translations, entries_links, format_date)
 def format_person(response: dict) -> dict:
     """Format a person into the expected output format
         - George Washington: https://www.wikidata.org/wiki/Q23
         - William Blake: https://www.wikidata.org/wiki/Q41513
         - Albert Einstein: https://www.wikidata.org/wiki/Q937
     """
-    entries_translations = {
-        # "name": "Name",
-        "birthDate": "Born",
-        "deathDate": "Died",
-        "occupationLabel": "Occupation",
-        "nationalityLabel": "Nationality",
-        "spouseLabel": "Spouse"
-    }
-    entries_links = {
-        "nationalityLabel": "nationality",
-        "spouseLabel": "spouse"
-    }
-    def format_date(val: str, key: str) -> str:
-        # If the key is the birth or death date, format it into a date string
-        if val and key == "birthDate" or val and key == "deathDate":
-            return format_date_string(val)
+    return PERSON_PLAN.format(response)
+
+def format_partial(response: dict) -> dict:
+    """ Formats a get_label.sparql response into a panel with just a title and subtitle,
+        marked as partial. Returns None if the response failed or the entity has no label
+    """
+    if not response or not response['results']['bindings']:
+        return None
+
+    panel = PARTIAL_PLAN.format(response)
+    if panel['title'] is None:
+        return None
 
-        # For all other keys, leave them alone
-        return val
-    return format_query(response, entries_translations, entries_links, format_date)
+    panel['partial'] = True
+    return panel
@@ -1,17 +1,36 @@
 # pylint: disable=no-self-use
 import re
 import time
+import asyncio
+from collections import defaultdict
 from json.decoder import JSONDecodeError
+import httpx
 import requests
+from django.conf import settings
 from rdf.parser.abstract_parser import AbstractParser, EntityType
-from rdf.parser.sparql_reader import read_sparql
+from rdf.parser.sparql_reader import read_sparql, read_sparql_values
+from rdf.parser.http_client import http_client, async_http_client
+from rdf.parser.format_output import split_response_by_entity
+from rdf.parser.single_flight import SingleFlight
+from rdf.parser.resilience import RetryBudget, CircuitBreaker, backoff_delay
+from rdf.parser.telemetry import timed, record_sparql_response
+from rdf.parser.hedging import sparql_hedger
+from rdf.parser.deadline import (
+    DeadlineExceeded, deadline_after, deadline_expired, check_deadline,
+    reserve_time, get_partial_reserve
+)
 from rdf.parser.wikidata_formatter import (
-    format_landmark, format_country, format_book, format_person
+    format_landmark, format_country, format_book, format_person, format_partial
 )
 
 WIKIDATA_ENDPOINT = 'https://query.wikidata.org/sparql'
-RETRY_COUNT = 10 # How many retry attempts we'll make
-RETRY_DELAY = 0.1 # Wait a tenth of a second before retrying
+RETRY_COUNT = 5 # How many attempts we'll make at most
+RETRY_DELAY = 0.1 # The base of the exponential backoff between retries
+RETRY_MAX_DELAY = 2 # The longest we'll wait between two retries
+# How many seconds a query can take, including its retries. It's cut short by the
+# request's deadline (the PANEL_DEADLINE setting) if that's sooner
+QUERY_DEADLINE = 20
+RETRYABLE_STATUSES = (429, 500, 502, 503, 504)
 PERSON_ENTITY_TYPES = ["human"]
 BOOK_ENTITY_TYPES = [
     "literary work",
@@ -22,36 +41,294 @@ BOOK_ENTITY_TYPES = [
 ]
 COUNTRY_TYPES = ["country", "sovereign state"]
 LANDMARK_TYPES = ["landmark", "tourist attraction"]
+# The IDs of the classes above, for when there are no labels to go by (e.g. in dumps)
+PERSON_ENTITY_CLASSES = ["Q5"]
+BOOK_ENTITY_CLASSES = ["Q7725634", "Q1667921", "Q47461344", "Q277759", "Q5185279"]
+COUNTRY_CLASSES = ["Q6256", "Q3624078"]
+LANDMARK_CLASSES = ["Q2319498", "Q570116"]
+
+# Coalesces identical queries that are in flight at the same time
+query_flight = SingleFlight()
+# At most one retry for every 5 queries, with a burst of up to 10
+retry_budget = RetryBudget(ratio=0.2, max_tokens=10)
+# Fail fast for 30 seconds after 5 failures in a row
+wikidata_breaker = CircuitBreaker(failure_threshold=5, reset_timeout=30)
+
+class RetryableQueryError(Exception):
+    """ Raised when Wikidata failed in a way that's worth retrying, e.g. a 503 """
+
+    def __init__(self, message: str, retry_after: float = 0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+# Errors that mean upstream is struggling, as opposed to e.g. a malformed query
+RETRYABLE_ERRORS = (RetryableQueryError, requests.RequestException, httpx.TransportError)
+
+def get_wikidata_endpoint() -> str:
+    """ Returns where SPARQL queries are sent. It's the WIKIDATA_ENDPOINT setting if
+        that's set, e.g. to the stand-in server from `python manage.py sparql_standin`
+    """
+    return getattr(settings, 'WIKIDATA_ENDPOINT', None) or WIKIDATA_ENDPOINT
+
+def _read_response(response) -> dict:
+    """ Returns the JSON of a Wikidata response, or None if the query was rejected.
+        Raises RetryableQueryError if Wikidata failed in a way worth retrying
+    """
+    if response.status_code in RETRYABLE_STATUSES:
+        retry_after = response.headers.get('Retry-After', '')
+        raise RetryableQueryError(
+            f"status {response.status_code}",
+            float(retry_after) if retry_after.isdigit() else 0,
+        )
+
+    if response.status_code >= 400: # e.g. a malformed query, so retrying won't help
+        print(f"Wikidata rejected the query with status {response.status_code}")
+        return None
+
+    try:
+        return response.json()
+    except JSONDecodeError as err:
+        # Wikidata occasionally sends back an error page with a 200
+        raise RetryableQueryError("invalid JSON") from err
+
+def _get_retry_delay(attempt: int, deadline: float, err: Exception):
+    """ Returns how long to wait before retrying, or None if the query shouldn't be
+        retried because it's out of attempts, time, or retry budget
+    """
+    if attempt + 1 >= RETRY_COUNT:
+        return None
+
+    delay = max(
+        backoff_delay(attempt, RETRY_DELAY, RETRY_MAX_DELAY),
+        getattr(err, 'retry_after', 0),
+    )
+    if time.monotonic() + delay >= deadline:
+        return None
+
+    if not retry_budget.try_retry():
+        return None
+
+    return delay
+
+def _missed_deadline(attempt: int, err: Exception = None) -> DeadlineExceeded:
+    """ Records that the query was given up on because the request's deadline passed,
+        which isn't counted as a failure by the circuit breaker (see _settle_attempt),
+        and returns the error to raise
+    """
+    record_sparql_response(None, attempt)
+    return DeadlineExceeded(f"Wikidata didn't answer before the deadline ({err})")
+
+def _settle_attempt(generation: int, settled: bool):
+    """ Tells the circuit breaker an attempt was abandoned if it wasn't recorded as a
+        success or failure, e.g. because the deadline passed, the response couldn't be
+        read, or the request was cancelled. Otherwise a half-open probe would never be
+        freed, and the breaker would stay half open with every query failing fast
+    """
+    if not settled:
+        wikidata_breaker.record_abandoned(generation)
 
 def wikidata_sparql_query(query: str) -> dict:
     """ Makes a SPARQL query request to the Wikidata endpoint. Because it fails
-        occasionally, retry up to RETRY_COUNT times, while waiting RETRY_DELAY seconds
-        between retries.
+        occasionally, retry up to RETRY_COUNT times with a jittered exponential backoff,
+        as long as the retry budget and QUERY_DEADLINE allow it, and if WIKIDATA_HEDGE is
+        on, slow requests are hedged (see rdf/parser/hedging.py). Returns None if the
+        query failed, or straight away if the circuit breaker is open. Raises
+        DeadlineExceeded if the request's deadline passed before it was answered.
+        If the same query is already in flight, waits for its response instead.
+    """
+    return query_flight.do(query, lambda: _wikidata_sparql_query(query))
+
+def _wikidata_sparql_query(query: str) -> dict:
+    params = { 'format': 'json', 'query': query }
+    deadline = deadline_after(QUERY_DEADLINE)
+    retry_budget.record_request()
+
+    for attempt in range(0, RETRY_COUNT):
+        check_deadline("the Wikidata query")
+        generation = wikidata_breaker.allow_request()
+        if generation is None:
+            print("Wikidata circuit breaker is open, not querying")
+            return None
+
+        settled = False
+        try:
+            response = _read_response(sparql_hedger.get(
+                lambda: http_client.get(get_wikidata_endpoint(), params)
+            ))
+            wikidata_breaker.record_success(generation)
+            settled = True
+            record_sparql_response(response, attempt)
+            return response
+        except DeadlineExceeded as err:
+            raise _missed_deadline(attempt, err) from err
+        except RETRYABLE_ERRORS as err:
+            if deadline_expired(): # It timed out because the deadline was close
+                raise _missed_deadline(attempt, err) from err
+            wikidata_breaker.record_failure(generation)
+            settled = True
+            delay = _get_retry_delay(attempt, deadline, err)
+            if delay is None:
+                record_sparql_response(None, attempt)
+                break
+
+            print(f"Wikidata query failed ({err})! Retrying")
+            time.sleep(delay)
+        finally:
+            _settle_attempt(generation, settled)
+
+    # Couldn't get a response, so return None
+    return None
+
+async def wikidata_sparql_query_async(query: str) -> dict:
+    """ Async version of wikidata_sparql_query, which doesn't block the event loop
+        while waiting on Wikidata
     """
+    return await query_flight.ado(query, lambda: _wikidata_sparql_query_async(query))
+
+async def _wikidata_sparql_query_async(query: str) -> dict:
+    params = { 'format': 'json', 'query': query }
+    deadline = deadline_after(QUERY_DEADLINE)
+    retry_budget.record_request()
+
+    for attempt in range(0, RETRY_COUNT):
+        check_deadline("the Wikidata query")
+        generation = wikidata_breaker.allow_request()
+        if generation is None:
+            print("Wikidata circuit breaker is open, not querying")
+            return None
 
-    for _ in range(0, RETRY_COUNT):
+        settled = False
         try:
-            params = { 'format': 'json', 'query': query }
-            req = requests.get(WIKIDATA_ENDPOINT, params)
-            return req.json()
-        except JSONDecodeError:
-            # if the request fails, it will throw a JSONDecodeError.
-            # As such, catch it and wait RETRY_DELAY seconds before trying again
-            print("Wikidata query failed! Retrying")
-            # If we retry without waiting, it will fail nearly 100% of the time
-            time.sleep(RETRY_DELAY)
-
-    # Reached max amount of retries and still couldn't get a response, so return None
+            response = _read_response(await sparql_hedger.aget(
+                lambda: async_http_client.get(get_wikidata_endpoint(), params)
+            ))
+            wikidata_breaker.record_success(generation)
+            settled = True
+            record_sparql_response(response, attempt)
+            return response
+        except DeadlineExceeded as err:
+            raise _missed_deadline(attempt, err) from err
+        except RETRYABLE_ERRORS as err:
+            if deadline_expired():
+                raise _missed_deadline(attempt, err) from err
+            wikidata_breaker.record_failure(generation)
+            settled = True
+            delay = _get_retry_delay(attempt, deadline, err)
+            if delay is None:
+                record_sparql_response(None, attempt)
+                break
+
+            print(f"Wikidata query failed ({err})! Retrying")
+            await asyncio.sleep(delay)
+        finally:
+            _settle_attempt(generation, settled)
+
     return None
 
+def resilience_metrics() -> dict:
+    """ Returns the state of the circuit breaker and retry budget """
+    return {
+        'breaker_state': wikidata_breaker.state.name,
+        'breaker_consecutive_failures': wikidata_breaker.failures,
+        'breaker_short_circuited': wikidata_breaker.short_circuited,
+        'retries': retry_budget.retries,
+        'retries_denied': retry_budget.denied,
+        'retry_budget_tokens': retry_budget.tokens,
+    }
+
+ENTITY_QUERIES = {
+    EntityType.PERSON: "get_person.sparql",
+    EntityType.BOOK: "get_book.sparql",
+    EntityType.COUNTRY: "get_country.sparql",
+    EntityType.LANDMARK: "get_landmark.sparql",
+}
+
+# The same queries, but for any number of entities at once using VALUES ?entity
+BATCH_ENTITY_QUERIES = {
+    EntityType.PERSON: "get_people.sparql",
+    EntityType.BOOK: "get_books.sparql",
+    EntityType.COUNTRY: "get_countries.sparql",
+    EntityType.LANDMARK: "get_landmarks.sparql",
+}
+
+ENTITY_FORMATTERS = {
+    EntityType.PERSON: format_person,
+    EntityType.BOOK: format_book,
+    EntityType.COUNTRY: format_country,
+    EntityType.LANDMARK: format_landmark,
+}
+
 class UnsupportedEntityTypeException(Exception):
     """ Thrown by get_entity_type when there's an entity type it doesn't recognize """
 
+def get_entity_type_from_labels(bindings: list) -> EntityType:
+    """ Determines the entity type from the "instance of" label bindings.
+        Throws UnsupportedEntityTypeException if none of the labels are supported
+    """
+    for entry in bindings:
+        entity_type = entry['label']['value']
+
+        if entity_type in PERSON_ENTITY_TYPES:
+            return EntityType.PERSON
+        if entity_type in BOOK_ENTITY_TYPES:
+            return EntityType.BOOK
+        if entity_type in COUNTRY_TYPES:
+            return EntityType.COUNTRY
+        if entity_type in LANDMARK_TYPES:
+            return EntityType.LANDMARK
+
+    raise UnsupportedEntityTypeException("Unsupported entity type")
+
+def _entity_id_from_uri(entity_uri: str) -> str:
+    return entity_uri.rsplit('/', 1)[-1]
+
+def parse_entities(entity_ids: list) -> dict:
+    """ Parses many entities at once. Rather than two queries per entity, it makes one
+        query to classify all of them and then one query per entity type, so the number
+        of queries doesn't grow with the number of entities.
+
+        Returns a dict of entity ID to a (EntityType, panel) tuple, which only contains
+        the entities that could be parsed.
+    """
+    if not entity_ids:
+        return {}
+
+    query = read_sparql_values("get_instances.sparql", entity_ids)
+    with timed("entity_type"):
+        response = wikidata_sparql_query(query)
+    if not response: # Response failed, so nothing could be parsed
+        return {}
+
+    # Group the entities by their type, so each type's fields are fetched in one query
+    entity_ids_by_type = defaultdict(list)
+    for entity_uri, labels in split_response_by_entity(response).items():
+        try:
+            entity_type = get_entity_type_from_labels(labels['results']['bindings'])
+        except UnsupportedEntityTypeException:
+            continue
+
+        entity_ids_by_type[entity_type].append(_entity_id_from_uri(entity_uri))
+
+    panels = {}
+    for entity_type, type_entity_ids in entity_ids_by_type.items():
+        query = read_sparql_values(BATCH_ENTITY_QUERIES[entity_type], type_entity_ids)
+        with timed("detail"):
+            response = wikidata_sparql_query(query)
+        if not response:
+            continue
+
+        for entity_uri, entity_response in split_response_by_entity(response).items():
+            panel = ENTITY_FORMATTERS[entity_type](entity_response)
+            panels[_entity_id_from_uri(entity_uri)] = (entity_type, panel)
+
+    return panels
+
 class WikidataParser(AbstractParser):
     """parses wikidata sources"""
 
     def __init__(self, uri):
         super().__init__(uri)
+        self.entity_type = None # Set once parse() has determined it
         self.entity_id = self._get_wikidata_id_from_uri()
         if self.entity_id is None:
             raise Exception("Invalid Wikidata URI")
@@ -60,8 +337,22 @@ class WikidataParser(AbstractParser):
         """ Does a Regex match to get the Wikidata ID from the URI """
         return re.search('Q[0-9]+', self.uri).group(0)
 
-    def parse(self) -> dict: # pylint: disable=too-many-return-statements
-        """call this method to start parsing"""
+    def parse(self) -> dict:
+        """ call this method to start parsing. If the request's deadline passes before
+            the panel has been fetched, a partial panel is returned instead (see
+            parse_partial), which is fetched in the last PANEL_PARTIAL_RESERVE seconds
+        """
+        try:
+            with reserve_time(get_partial_reserve()):
+                return self._parse()
+        except DeadlineExceeded as err:
+            print(f"Couldn't parse {self.entity_id} in time ({err})")
+            return self.parse_partial()
+
+    def _parse(self) -> dict:
+        if getattr(settings, 'WIKIDATA_COMBINED_RESOLUTION', False):
+            return self.parse_combined()
+
         try:
             entity_type =  self.get_entity_type()
         except UnsupportedEntityTypeException as err:
@@ -71,6 +362,66 @@ class WikidataParser(AbstractParser):
         if not entity_type: # entity type is None, most likely because it failed
             return None
 
+        self.entity_type = entity_type
+        return self._parse_entity_type(entity_type)
+
+    def parse_combined(self) -> dict:
+        """ Like parse, but determines the entity type and fetches its fields in a
+            single request using get_entity.sparql, rather than one request for each.
+            Falls back to the type specific query if the combined one didn't return
+            any fields for the entity type.
+        """
+        query = read_sparql("get_entity.sparql", self.entity_id)
+        with timed("combined"):
+            response = wikidata_sparql_query(query)
+
+        panel = self._format_combined(response)
+        if panel is None and self.entity_type:
+            return self._parse_entity_type(self.entity_type)
+
+        return panel
+
+    async def aparse_combined(self) -> dict:
+        """ Async version of parse_combined """
+        query = read_sparql("get_entity.sparql", self.entity_id)
+        with timed("combined"):
+            response = await wikidata_sparql_query_async(query)
+
+        panel = self._format_combined(response)
+        if panel is None and self.entity_type:
+            return await self._aparse_query(self.entity_type)
+
+        return panel
+
+    def _format_combined(self, response: dict) -> dict:
+        """ Classifies the entity from a get_entity.sparql response and formats its
+            fields. Returns None if the response failed, the entity type isn't
+            supported, or the response didn't have the fields for its entity type (in
+            which case self.entity_type will be set)
+        """
+        if not response: # Response failed, so return None
+            return None
+
+        bindings = response['results']['bindings']
+        labels = [entry for entry in bindings if 'label' in entry]
+        try:
+            entity_type = get_entity_type_from_labels(labels)
+        except UnsupportedEntityTypeException as err:
+            print(err)
+            return None
+
+        self.entity_type = entity_type
+        fields = [
+            entry for entry in bindings
+            if entry.get('entityType', {}).get('value') == entity_type.name
+        ]
+        if not fields:
+            return None
+
+        return ENTITY_FORMATTERS[entity_type]({ 'results': { 'bindings': fields } })
+
+    def _parse_entity_type(self, entity_type: EntityType) -> dict:
+        """ Calls the parse function for the given entity type """
         if entity_type == EntityType.BOOK:
             return self.parse_book()
         if entity_type == EntityType.PERSON:
@@ -82,39 +433,91 @@ class WikidataParser(AbstractParser):
 
         return None
 
+    async def aparse(self) -> dict:
+        """ Async version of parse """
+        try:
+            with reserve_time(get_partial_reserve()):
+                return await self._aparse()
+        except DeadlineExceeded as err:
+            print(f"Couldn't parse {self.entity_id} in time ({err})")
+            return await self.aparse_partial()
+
+    async def _aparse(self) -> dict:
+        if getattr(settings, 'WIKIDATA_COMBINED_RESOLUTION', False):
+            return await self.aparse_combined()
+
+        try:
+            entity_type = await self.aget_entity_type()
+        except UnsupportedEntityTypeException as err:
+            print(err)
+            return None
+
+        if not entity_type: # entity type is None, most likely because it failed
+            return None
+
+        self.entity_type = entity_type
+        return await self._aparse_query(entity_type)
+
+    def parse_partial(self) -> dict:
+        """ Fetches just the entity's title and subtitle, for a panel marked as partial
+            when the full one can't be fetched in time. Raises DeadlineExceeded if even
+            that can't be
+        """
+        query = read_sparql("get_label.sparql", self.entity_id)
+        with timed("partial"):
+            response = wikidata_sparql_query(query)
+        return format_partial(response)
+
+    async def aparse_partial(self) -> dict:
+        """ Async version of parse_partial """
+        query = read_sparql("get_label.sparql", self.entity_id)
+        with timed("partial"):
+            response = await wikidata_sparql_query_async(query)
+        return format_partial(response)
+
     def get_entity_type(self) -> str:
         """ gets the entity type """
         query = read_sparql("get_instance.sparql", self.entity_id)
-        response =  wikidata_sparql_query(query)
+        with timed("entity_type"):
+            response = wikidata_sparql_query(query)
 
         if not response: # Response failed, so return None
             return None
 
-        for entry in response['results']['bindings']:
-            entity_type = entry['label']['value']
+        return get_entity_type_from_labels(response['results']['bindings'])
+
+    async def aget_entity_type(self) -> str:
+        """ Async version of get_entity_type """
+        query = read_sparql("get_instance.sparql", self.entity_id)
+        with timed("entity_type"):
+            response = await wikidata_sparql_query_async(query)
 
-            if entity_type in PERSON_ENTITY_TYPES:
-                return EntityType.PERSON
-            if entity_type in BOOK_ENTITY_TYPES:
-                return EntityType.BOOK
-            if entity_type in COUNTRY_TYPES:
-                return EntityType.COUNTRY
-            if entity_type in LANDMARK_TYPES:
-                return EntityType.LANDMARK
+        if not response: # Response failed, so return None
+            return None
 
-        raise UnsupportedEntityTypeException("Unsupported entity type")
+        return get_entity_type_from_labels(response['results']['bindings'])
 
     def parse_person(self) -> dict:
         """ Parses a person entity type """
         query = read_sparql("get_person.sparql", self.entity_id)
-        response = wikidata_sparql_query(query)
+        with timed("detail"):
+            response = wikidata_sparql_query(query)
+
+        if not response: # Response failed, so return None
+            return None
+
         return format_person(response)
 
     def parse_book(self) -> dict:
         """ Parses a book entity type """
 
         query = read_sparql("get_book.sparql", self.entity_id)
-        response = wikidata_sparql_query(query)
+        with timed("detail"):
+            response = wikidata_sparql_query(query)
+
+        if not response: # Response failed, so return None
+            return None
+
         return format_book(response)
     def parse_country(self) -> dict:
         """ Parse a country entity type
@@ -124,7 +527,11 @@ class WikidataParser(AbstractParser):
                 - Ghana: https://www.wikidata.org/wiki/Q117
         """
         query = read_sparql("get_country.sparql", self.entity_id)
-        response = wikidata_sparql_query(query)
+        with timed("detail"):
+            response = wikidata_sparql_query(query)
+
+        if not response: # Response failed, so return None
+            return None
 
         return format_country(response)
         # return response
@@ -139,7 +546,38 @@ class WikidataParser(AbstractParser):
                 - Table Mountain: https://www.wikidata.org/wiki/Q213360
         """
         query = read_sparql("get_landmark.sparql", self.entity_id)
-        response =  wikidata_sparql_query(query)
+        with timed("detail"):
+            response = wikidata_sparql_query(query)
+
+        if not response: # Response failed, so return None
+            return None
 
         # Format the query
         return format_landmark(response)
+
+    async def _aparse_query(self, entity_type: EntityType) -> dict:
+        """ Runs the query for the entity type and formats the response """
+        query = read_sparql(ENTITY_QUERIES[entity_type], self.entity_id)
+        with timed("detail"):
+            response = await wikidata_sparql_query_async(query)
+
+        if not response: # Response failed, so return None
+            return None
+
+        return ENTITY_FORMATTERS[entity_type](response)
+
+    async def aparse_person(self) -> dict:
+        """ Async version of parse_person """
+        return await self._aparse_query(EntityType.PERSON)
+
+    async def aparse_book(self) -> dict:
+        """ Async version of parse_book """
+        return await self._aparse_query(EntityType.BOOK)
+
+    async def aparse_country(self) -> dict:
+        """ Async version of parse_country """
+        return await self._aparse_query(EntityType.COUNTRY)
+
+    async def aparse_landmark(self) -> dict:
+        """ Async version of parse_landmark """
+        return await self._aparse_query(EntityType.LANDMARK)
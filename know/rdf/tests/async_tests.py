@@ -0,0 +1,134 @@
+import asyncio
+import unittest
+from unittest.mock import patch, AsyncMock
+from django.test import AsyncClient
+from know.asgi import application
+from rdf.parser.abstract_parser import EntityType
+from rdf.parser.http_client import async_http_client
+from rdf.parser.panel_cache import panel_cache
+from rdf.parser.summarizer import Summarizer
+from rdf.parser.wikidata_parser import WikidataParser
+
+SPARQL_QUERY_ASYNC = "rdf.parser.wikidata_parser.wikidata_sparql_query_async"
+PANEL = { "title": "Taj Mahal", "subtitle": "mausoleum in Agra, India", "entries": {} }
+
+class AsyncTestCase(unittest.TestCase):
+    """ Runs each test's coroutines in a loop of its own, closing the loop's HTTP client
+        once the test is done
+    """
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.run_until_complete(async_http_client.aclose())
+        self.loop.close()
+
+    def run_async(self, awaitable):
+        """ Runs awaitable in the test's loop, returning its result """
+        return self.loop.run_until_complete(awaitable)
+
+class AsyncParserTests(AsyncTestCase):
+    """ Tests the async versions of WikidataParser and Summarizer """
+
+    def setUp(self):
+        super().setUp()
+        panel_cache.clear()
+
+    @patch(SPARQL_QUERY_ASYNC, new_callable=AsyncMock)
+    def test_aparse_combined_formats_response(self, sparql_query):
+        """ Tests that aparse_combined classifies and formats like parse_combined """
+        # arrange
+        sparql_query.return_value = { "results": { "bindings": [
+            { "label": { "type": "literal", "value": "tourist attraction" } },
+            {
+                "entityType": { "type": "literal", "value": "LANDMARK" },
+                "name": { "type": "literal", "value": "Taj Mahal" },
+                "description": { "type": "literal", "value": "mausoleum in Agra, India" },
+            },
+        ]}}
+        parser = WikidataParser("https://www.wikidata.org/wiki/Q9141")
+
+        # act
+        actual = self.run_async(parser.aparse_combined())
+
+        # assert
+        self.assertEqual(PANEL, actual)
+        self.assertEqual(EntityType.LANDMARK, parser.entity_type)
+
+    @patch.object(WikidataParser, "aparse", new_callable=AsyncMock)
+    def test_concurrent_asummarize_calls_overlap(self, aparse):
+        """ Tests that many in-flight asummarize calls wait on upstream concurrently
+            instead of one after another
+        """
+        # arrange
+        async def slow_parse():
+            await asyncio.sleep(0.1)
+            return PANEL
+        aparse.side_effect = slow_parse
+
+        async def summarize_many():
+            uris = [f"https://www.wikidata.org/wiki/Q{i}" for i in range(1, 51)]
+            return await asyncio.gather(*(Summarizer(uri).asummarize() for uri in uris))
+
+        # act
+        start = self.loop.time()
+        panels = self.run_async(summarize_many())
+        elapsed = self.loop.time() - start
+
+        # assert
+        self.assertEqual([PANEL] * 50, panels)
+        self.assertLess(elapsed, 1)
+
+class AsyncViewTests(AsyncTestCase):
+    """ Tests get_knowledge_panel_data_async """
+
+    def test_missing_uri_returns_400(self):
+        """ Tests that the uri parameter is required """
+        # act
+        response = self.run_async(AsyncClient().get("/async/"))
+
+        # assert
+        self.assertEqual(response.status_code, 400)
+
+    @patch.object(Summarizer, "asummarize", new_callable=AsyncMock)
+    def test_returns_panel(self, asummarize):
+        """ Tests that the panel is returned as JSON """
+        # arrange
+        asummarize.return_value = PANEL
+
+        # act (the uri is in the URL, as Django 3.2's AsyncClient drops the data of a GET)
+        response = self.run_async(
+            AsyncClient().get("/async/?uri=https://www.wikidata.org/wiki/Q9141")
+        )
+
+        # assert
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), PANEL)
+
+class AsgiLifespanTests(AsyncTestCase):
+    """ Tests the lifespan handling of the ASGI application """
+
+    @patch.object(async_http_client, "aclose", new_callable=AsyncMock)
+    def test_shutdown_closes_http_client(self, aclose):
+        """ Tests that startup is acknowledged, and that the async HTTP client is closed
+            on shutdown
+        """
+        # arrange
+        messages = [{ "type": "lifespan.startup" }, { "type": "lifespan.shutdown" }]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message["type"])
+
+        # act
+        self.run_async(application({ "type": "lifespan" }, receive, send))
+
+        # assert
+        self.assertEqual(
+            sent, ["lifespan.startup.complete", "lifespan.shutdown.complete"]
+        )
+        aclose.assert_awaited_once()
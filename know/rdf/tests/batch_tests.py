@@ -0,0 +1,168 @@
+import unittest
+from unittest.mock import patch
+from django.test import Client
+from rdf.parser.deadline import DeadlineExceeded, get_deadline
+from rdf.parser.panel_cache import panel_cache
+from rdf.parser.sparql_reader import InvalidEntityIdException
+from rdf.parser.summarizer import Summarizer
+from rdf.parser.wikidata_parser import parse_entities
+
+SPARQL_QUERY = "rdf.parser.wikidata_parser.wikidata_sparql_query"
+
+def _literal(value: str) -> dict:
+    return { "type": "literal", "value": value }
+
+def _entity(entity_id: str) -> dict:
+    return { "type": "uri", "value": f"http://www.wikidata.org/entity/{entity_id}" }
+
+INSTANCES_RESPONSE = { "results": { "bindings": [
+    { "entity": _entity("Q23"), "label": _literal("human") },
+    { "entity": _entity("Q937"), "label": _literal("human") },
+    { "entity": _entity("Q142"), "label": _literal("sovereign state") },
+    { "entity": _entity("Q6928344"), "label": _literal("Wikimedia disambiguation page") },
+]}}
+
+PEOPLE_RESPONSE = { "results": { "bindings": [
+    {
+        "entity": _entity("Q23"),
+        "name": _literal("George Washington"),
+        "description": _literal("1st president of the United States"),
+    },
+    {
+        "entity": _entity("Q937"),
+        "name": _literal("Albert Einstein"),
+        "description": _literal("German-born theoretical physicist"),
+        "occupationLabel": _literal("physicist"),
+    },
+]}}
+
+COUNTRIES_RESPONSE = { "results": { "bindings": [
+    {
+        "entity": _entity("Q142"),
+        "name": _literal("France"),
+        "description": _literal("country in Western Europe"),
+    },
+]}}
+
+def fake_sparql_query(query: str) -> dict:
+    """ Returns the canned response for whichever batch query was made """
+    if "?label" in query:
+        return INSTANCES_RESPONSE
+    if "P569" in query:
+        return PEOPLE_RESPONSE
+    return COUNTRIES_RESPONSE
+
+class BatchParseTests(unittest.TestCase):
+    """ parse_entities and Summarizer.summarize_many tests """
+
+    def setUp(self):
+        panel_cache.clear()
+
+    @patch(SPARQL_QUERY, side_effect=fake_sparql_query)
+    def test_one_query_per_entity_type(self, sparql_query):
+        """ Tests that 4 entities of 2 supported types only take 3 queries """
+        # act
+        panels = parse_entities(["Q23", "Q937", "Q142", "Q6928344"])
+
+        # assert
+        self.assertEqual(sparql_query.call_count, 3)
+        self.assertEqual(sorted(panels.keys()), ["Q142", "Q23", "Q937"])
+        self.assertEqual(panels["Q937"][1], {
+            "title": "Albert Einstein",
+            "subtitle": "German-born theoretical physicist",
+            "entries": { "Occupation": [{ "value": "physicist" }] },
+        })
+
+    @patch(SPARQL_QUERY, side_effect=fake_sparql_query)
+    def test_summarize_many_uses_and_fills_cache(self, sparql_query):
+        """ Tests that URI variants share a panel, unparseable URIs are None, and
+            parsed panels are cached for the next request
+        """
+        # arrange
+        uris = [
+            "https://www.wikidata.org/wiki/Q23",
+            "http://www.wikidata.org/entity/Q23",
+            "https://www.wikidata.org/wiki/Q142",
+            "https://www.wikidata.org/wiki/Q6928344",
+            "https://example.com/not-a-panel",
+        ]
+
+        # act
+        panels = Summarizer.summarize_many(uris)
+        Summarizer.summarize_many(uris[:3])
+
+        # assert
+        self.assertEqual(panels[uris[0]]["title"], "George Washington")
+        self.assertEqual(panels[uris[1]]["title"], "George Washington")
+        self.assertEqual(panels[uris[2]]["title"], "France")
+        self.assertIsNone(panels[uris[3]])
+        self.assertIsNone(panels[uris[4]])
+        self.assertEqual(sparql_query.call_count, 3)
+
+    @patch("builtins.print")
+    @patch.object(Summarizer, "resolve_viaf", side_effect=InvalidEntityIdException)
+    @patch(SPARQL_QUERY, side_effect=fake_sparql_query)
+    def test_failing_uri_is_none(self, *_):
+        """ Tests that a URI that fails to resolve is None, without failing the rest """
+        # arrange
+        uris = ["http://viaf.org/viaf/75121530/", "https://www.wikidata.org/wiki/Q23"]
+
+        # act
+        panels = Summarizer.summarize_many(uris)
+
+        # assert
+        self.assertIsNone(panels[uris[0]])
+        self.assertEqual(panels[uris[1]]["title"], "George Washington")
+
+class BatchViewTests(unittest.TestCase):
+    """ get_knowledge_panels tests """
+
+    def test_uris_must_be_a_list(self):
+        """ Tests that a body without a list of URIs is rejected """
+        # act
+        response = Client().post(
+            "/batch/", { "uris": "https://www.wikidata.org/wiki/Q23" },
+            content_type="application/json",
+        )
+
+        # assert
+        self.assertEqual(response.status_code, 400)
+
+    @patch.object(Summarizer, "summarize_many")
+    def test_returns_panels(self, summarize_many):
+        """ Tests that the panels are returned keyed by URI """
+        # arrange
+        summarize_many.return_value = { "https://www.wikidata.org/wiki/Q23": None }
+
+        # act
+        response = Client().post(
+            "/batch/", { "uris": ["https://www.wikidata.org/wiki/Q23"] },
+            content_type="application/json",
+        )
+
+        # assert
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), summarize_many.return_value)
+
+    @patch.object(Summarizer, "summarize_many")
+    def test_deadline_returns_504(self, summarize_many):
+        """ Tests that the batch is summarized within a deadline, and that a 504 is
+            returned if it runs out
+        """
+        # arrange
+        deadlines = []
+
+        def summarize_many_late(_):
+            deadlines.append(get_deadline())
+            raise DeadlineExceeded()
+        summarize_many.side_effect = summarize_many_late
+
+        # act
+        response = Client().post(
+            "/batch/", { "uris": ["https://www.wikidata.org/wiki/Q23"] },
+            content_type="application/json",
+        )
+
+        # assert
+        self.assertEqual(response.status_code, 504)
+        self.assertIsNotNone(deadlines[0])
@@ -0,0 +1,147 @@
+import threading
+import unittest
+import requests
+from django.test import override_settings
+from rdf.parser.panel_cache import panel_cache
+from rdf.parser.summarizer import Summarizer
+from rdf.parser.viaf_resolver import viaf_links
+from rdf.benchmarks.replay import replay_wikidata
+from rdf.benchmarks.suite import BENCHMARKS, run_benchmarks, compare_results
+from rdf.benchmarks.load import zipf_workload, percentile
+from rdf.benchmarks.standin import StandinServer, InvalidLatencyException, parse_latency
+
+def _results(calibration: float, **times: float) -> dict:
+    return {
+        "meta": { "calibration_us": calibration },
+        "benchmarks": { name: { "min_us": time } for name, time in times.items() },
+    }
+
+class CompareResultsTests(unittest.TestCase):
+    """ compare_results tests """
+
+    def test_flags_regressions_over_threshold(self):
+        """ Tests that only benchmarks more than the threshold slower are regressions """
+        # arrange
+        baseline = _results(10, fast=100, slow=100, removed=100)
+        current = _results(10, fast=110, slow=130, added=100)
+
+        # act
+        actual = compare_results(baseline, current, threshold=0.2)
+
+        # assert
+        self.assertEqual(
+            [(result[0], result[-1]) for result in actual],
+            [("fast", False), ("slow", True)],
+        )
+
+    def test_scales_by_calibration(self):
+        """ Tests that a machine that's twice as slow doesn't count as a regression """
+        # arrange
+        baseline = _results(10, summarize=100)
+        current = _results(20, summarize=210)
+
+        # act
+        actual = compare_results(baseline, current, threshold=0.2)
+
+        # assert
+        self.assertEqual(actual, [("summarize", 200, 210, 1.05, False)])
+
+class BenchmarkSuiteTests(unittest.TestCase):
+    """ Tests that the benchmarks run against the recorded responses """
+
+    def setUp(self):
+        panel_cache.clear()
+
+    def test_replayed_summarize(self):
+        """ Tests that a panel can be made from the recorded responses alone """
+        # act
+        with replay_wikidata() as client:
+            actual = Summarizer("https://www.wikidata.org/wiki/Q23").summarize()
+
+        # assert
+        self.assertEqual(actual['title'], "George Washington")
+        self.assertEqual(actual['entries']['Born'], [{ "value": "February 22, 1732" }])
+        self.assertEqual(client.requests_sent, 1)
+
+    def test_every_benchmark_runs(self):
+        """ Tests that every benchmark runs without going over the network """
+        # act
+        actual = run_benchmarks(min_time=0, repeat=1)
+
+        # assert
+        self.assertEqual(list(actual['benchmarks']), list(BENCHMARKS))
+        self.assertGreater(actual['meta']['calibration_us'], 0)
+
+class StandinServerTests(unittest.TestCase):
+    """ Tests the stand-in Wikidata and VIAF server """
+
+    def setUp(self):
+        panel_cache.clear()
+        viaf_links.clear()
+        self.server = StandinServer(("127.0.0.1", 0), latency="fixed:0.001", seed=0)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_summarize_through_standin(self):
+        """ Tests that a VIAF URI is resolved and summarized from the stand-in alone """
+        # act
+        with override_settings(WIKIDATA_ENDPOINT=f"{self.base_url}/sparql",
+                               VIAF_ENDPOINT=f"{self.base_url}/viaf/"):
+            actual = Summarizer("http://viaf.org/viaf/31432428/").summarize()
+
+        # assert
+        self.assertEqual(actual['title'], "George Washington")
+        self.assertEqual(self.server.outcomes, { 'served': 2, 'failed': 0, 'missing': 0 })
+
+    def test_injected_errors(self):
+        """ Tests that requests fail at the error rate """
+        # arrange
+        self.server.error_rate = 1
+
+        # act
+        actual = requests.get(f"{self.base_url}/viaf/31432428/", timeout=5)
+
+        # assert
+        self.assertEqual(actual.status_code, 503)
+
+    def test_missing_recording(self):
+        """ Tests that queries that weren't recorded aren't found """
+        # act
+        actual = requests.get(f"{self.base_url}/sparql", {'query': "ASK {}"}, timeout=5)
+
+        # assert
+        self.assertEqual(actual.status_code, 404)
+
+    def test_invalid_latency(self):
+        """ Tests latency distributions that can't be parsed """
+        for spec in ("fixed", "uniform:1", "lognormal:0,1", "normal:1,2", "fixed:a"):
+            self.assertRaises(InvalidLatencyException, parse_latency, spec)
+
+class LoadTests(unittest.TestCase):
+    """ Tests the load test workload and statistics """
+
+    def test_zipf_workload_is_skewed(self):
+        """ Tests that the first entities are requested the most """
+        # act
+        actual = zipf_workload(["Q1", "Q2", "Q3", "Q4"], 10000, exponent=1.1, seed=0)
+
+        # assert
+        counts = [actual.count(entity_id) for entity_id in ("Q1", "Q2", "Q3", "Q4")]
+        self.assertEqual(counts, sorted(counts, reverse=True))
+        self.assertGreater(counts[0], 4000)
+
+    def test_percentile(self):
+        """ Tests nearest-rank percentiles """
+        # arrange
+        values = list(range(1, 101))
+
+        # act
+        actual = [percentile(values, percent) for percent in (50, 95, 99, 100)]
+
+        # assert
+        self.assertEqual(actual, [50, 95, 99, 100])
+        self.assertEqual(percentile([], 50), 0)
@@ -0,0 +1,92 @@
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+from rdf.parser.panel_cache import panel_cache
+from rdf.parser.summarizer import Summarizer
+from rdf.benchmarks.replay import replay_wikidata
+from rdf.parser.cache_warmer import (
+    CacheWarmer, WarmCheckpoint, parse_warm_target, read_warm_targets
+)
+
+ACCESS_LOG = [
+    '127.0.0.1 - - [18/Oct/2026:10:00:00 +0000] '
+    '"GET /?uri=https%3A%2F%2Fwww.wikidata.org%2Fwiki%2FQ142 HTTP/1.1" 200 812',
+    '127.0.0.1 - - [18/Oct/2026:10:00:01 +0000] '
+    '"GET /?uri=http%3A%2F%2Fwww.wikidata.org%2Fentity%2FQ23 HTTP/1.1" 200 1024',
+    '127.0.0.1 - - [18/Oct/2026:10:00:02 +0000] '
+    '"GET /?uri=https%3A%2F%2Fwww.wikidata.org%2Fwiki%2FQ23 HTTP/1.1" 200 1024',
+    '127.0.0.1 - - [18/Oct/2026:10:00:03 +0000] "GET /?uri=nonsense HTTP/1.1" 400 0',
+    '127.0.0.1 - - [18/Oct/2026:10:00:04 +0000] "GET /metrics HTTP/1.1" 200 4096',
+]
+
+class ReadWarmTargetsTests(unittest.TestCase):
+    """ Tests reading the entities to warm """
+
+    def test_parse_warm_target(self):
+        """ Tests URIs, QIDs, and lines that aren't entities """
+        self.assertEqual(parse_warm_target("Q23\n"), "https://www.wikidata.org/wiki/Q23")
+        self.assertEqual(
+            parse_warm_target("http://viaf.org/viaf/31432428/"),
+            "http://viaf.org/viaf/31432428/"
+        )
+        self.assertIsNone(parse_warm_target("# popular entities"))
+        self.assertIsNone(parse_warm_target("   "))
+
+    def test_access_log_most_requested_first(self):
+        """ Tests that an access log is read most requested entity first, once each """
+        # act
+        actual = read_warm_targets(ACCESS_LOG)
+
+        # assert
+        self.assertEqual(actual, [
+            "http://www.wikidata.org/entity/Q23", "https://www.wikidata.org/wiki/Q142"
+        ])
+
+class CacheWarmerTests(unittest.TestCase):
+    """ Tests warming and resuming """
+
+    def setUp(self):
+        self.directory = Path(tempfile.mkdtemp())
+        self.checkpoint_path = str(self.directory / "uris.warmed")
+        panel_cache.clear()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        panel_cache.clear()
+
+    def test_warms_panel_cache(self):
+        """ Tests that warmed panels are served from the cache """
+        # arrange
+        uris = ["https://www.wikidata.org/wiki/Q23", "https://www.wikidata.org/wiki/Q142"]
+        warmer = CacheWarmer(
+            lambda uri: Summarizer(uri).summarize() is not None, concurrency=2, rate=0
+        )
+
+        # act
+        with replay_wikidata() as client:
+            stats = warmer.run(uris)
+            Summarizer(uris[0]).summarize()
+
+        # assert
+        self.assertEqual((stats['warmed'], stats['failed']), (2, 0))
+        self.assertEqual(client.requests_sent, 2)
+
+    def test_resumes_from_checkpoint(self):
+        """ Tests that warmed entities are skipped next time and failed ones retried """
+        # arrange
+        uris = ["https://www.wikidata.org/wiki/Q1", "https://www.wikidata.org/wiki/Q2"]
+        warmed = []
+        def warm(uri: str) -> bool:
+            warmed.append(uri)
+            return uri.endswith("Q1")
+
+        # act
+        for _ in range(2):
+            checkpoint = WarmCheckpoint(self.checkpoint_path)
+            stats = CacheWarmer(warm, 1, rate=0, checkpoint=checkpoint).run(uris)
+
+        # assert
+        self.assertEqual(warmed, [uris[0], uris[1], uris[1]])
+        self.assertEqual((stats['skipped'], stats['failed']), (1, 1))
+        self.assertEqual(WarmCheckpoint(self.checkpoint_path).load(), { "wikidata:Q1" })
@@ -0,0 +1,117 @@
+import json
+import time
+import threading
+import unittest
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+from django.test import Client, override_settings
+from rdf.parser.panel_cache import panel_cache
+from rdf.parser.wikidata_parser import wikidata_breaker
+from rdf.parser.deadline import (
+    DeadlineExceeded, request_deadline, reserve_time, bound_timeout, get_deadline
+)
+
+LABEL_RESPONSE = { "results": { "bindings": [{
+    "name": { "type": "literal", "value": "George Washington" },
+    "description": { "type": "literal", "value": "1st president of the United States" },
+}] } }
+
+class HangingWikidataHandler(BaseHTTPRequestHandler):
+    """ A SPARQL endpoint that answers get_label.sparql straight away, and hangs on
+        every other query (or on every query, if the server's hang_everything is set)
+    """
+
+    def do_GET(self): # pylint: disable=invalid-name
+        """ Answers or hangs on the query """
+        query = parse_qs(urlsplit(self.path).query)['query'][0]
+        if self.server.hang_everything or "wikibase:label" in query:
+            time.sleep(2)
+            return
+
+        body = json.dumps(LABEL_RESPONSE).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/sparql-results+json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *_): # pylint: disable=arguments-differ
+        pass
+
+class DeadlineTests(unittest.TestCase):
+    """ Deadline tests """
+
+    def test_timeouts_are_cut_short(self):
+        """ Tests that timeouts are cut short by the deadline, and by reserved time """
+        # act
+        with request_deadline(5):
+            bounded = bound_timeout(30)
+            with reserve_time(1):
+                reserved = bound_timeout(30)
+        with request_deadline(0):
+            with self.assertRaises(DeadlineExceeded):
+                bound_timeout(30)
+
+        # assert
+        self.assertAlmostEqual(bounded, 5, places=1)
+        self.assertAlmostEqual(reserved, 4, places=1)
+        self.assertEqual(bound_timeout(30), 30)
+        self.assertIsNone(get_deadline())
+
+class PanelDeadlineTests(unittest.TestCase):
+    """ Tests the panel route when Wikidata doesn't answer in time """
+
+    def setUp(self):
+        panel_cache.clear()
+        wikidata_breaker.reset()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), HangingWikidataHandler)
+        self.server.daemon_threads = True
+        self.server.block_on_close = False
+        self.server.hang_everything = False
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        endpoint = f"http://127.0.0.1:{self.server.server_address[1]}/sparql"
+        self.settings = override_settings(
+            WIKIDATA_ENDPOINT=endpoint, PANEL_DEADLINE=0.5, PANEL_PARTIAL_RESERVE=0.25
+        )
+        self.settings.enable()
+
+    def tearDown(self):
+        self.settings.disable()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_partial_panel(self):
+        """ Tests that a partial panel is sent once the deadline is close, without it
+            being cached or counting as a Wikidata failure
+        """
+        # act
+        started = time.monotonic()
+        response = Client().get("/", { 'uri': "https://www.wikidata.org/wiki/Q23" })
+        elapsed = time.monotonic() - started
+
+        # assert
+        self.assertLess(elapsed, 1)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {
+            "title": "George Washington",
+            "subtitle": "1st president of the United States",
+            "entries": {},
+            "partial": True,
+        })
+        self.assertEqual(response['Cache-Control'], "no-store")
+        self.assertIsNone(panel_cache.peek("wikidata:Q23")[0])
+        self.assertEqual(wikidata_breaker.failures, 0)
+
+    def test_gateway_timeout(self):
+        """ Tests that a 504 is sent if not even the partial panel is fetched in time """
+        # arrange
+        self.server.hang_everything = True
+
+        # act
+        started = time.monotonic()
+        response = Client().get("/", { 'uri': "https://www.wikidata.org/wiki/Q23" })
+        elapsed = time.monotonic() - started
+
+        # assert
+        self.assertLess(elapsed, 1)
+        self.assertEqual(response.status_code, 504)
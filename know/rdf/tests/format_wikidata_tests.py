@@ -1,5 +1,8 @@
 # pylint: disable=too-many-lines
 from unittest import TestCase
+from rdf.parser.format_output import (
+    compile_format_plan, format_date_string, format_query, merge_property_rows
+)
 from rdf.parser.wikidata_formatter import (
     format_landmark,
     format_country,
@@ -587,3 +590,177 @@ class FormatWikidataTests(TestCase):
         }
         actual = format_book(json_input)
         self.assertEqual(actual, expected)
+
+class FormatPlanTests(TestCase):
+    """ Tests compile_format_plan """
+
+    def test_entries_keep_row_order(self):
+        """ Tests that pretty keys come out in the order the rows would give them, and
+            that values repeated by exploded rows are only added once
+        """
+        # arrange
+        plan = compile_format_plan(
+            { "birthDate": "Born", "occupationLabel": "Occupation" }, {},
+            { "birthDate": lambda val: f"born {val}" },
+        )
+        response = { "results": { "bindings": [
+            { "name": { "value": "A" }, "occupationLabel": { "value": "poet" } },
+            { "name": { "value": "A" }, "occupationLabel": { "value": "poet" },
+              "birthDate": { "value": "1757" } },
+            { "name": { "value": "A" }, "occupationLabel": { "value": "painter" },
+              "birthDate": { "value": "1757" } },
+        ] } }
+
+        # act
+        actual = plan.format(response)
+
+        # assert
+        self.assertEqual(list(actual["entries"]), ["Occupation", "Born"])
+        self.assertEqual(actual["entries"], {
+            "Occupation": [{ "value": "poet" }, { "value": "painter" }],
+            "Born": [{ "value": "born 1757" }],
+        })
+
+    def test_shared_pretty_key(self):
+        """ Tests columns that share a pretty key, through format_query """
+        # arrange
+        response = { "results": { "bindings": [
+            {
+                "name": { "value": "A" }, "b": { "value": "2" },
+                "bLink": { "value": "l" },
+            },
+            { "name": { "value": "A" }, "a": { "value": "1" }, "b": { "value": "2" } },
+        ] } }
+
+        # act
+        actual = format_query(
+            response, { "a": "Value", "b": "Value" }, { "b": "bLink" },
+            lambda val, key: val,
+        )
+
+        # assert
+        self.assertEqual(actual["entries"], {
+            "Value": [{ "value": "2", "link": "l" }, { "value": "1" }],
+        })
+
+class MergePropertyRowsTests(TestCase):
+    """ merge_property_rows tests """
+
+    def test_union_rows_format_like_exploded_rows(self):
+        """ Tests that a row for each value formats the same as a row for every
+            combination of values, with the links kept with their labels
+        """
+        # arrange
+        name = { "name": { "value": "A" }, "description": { "value": "poet" } }
+        birth = { "birthDate": { "value": "1757-11-28T00:00:00Z" } }
+        occupations = [
+            { "occupationLabel": { "value": val } } for val in ("poet", "painter")
+        ]
+        spouses = [
+            {
+                "spouse": { "value": f"http://www.wikidata.org/entity/Q{i}" },
+                "spouseLabel": { "value": f"Spouse {i}" },
+            }
+            for i in (1, 2)
+        ]
+        exploded = [
+            { **name, **birth, **occupation, **spouse }
+            for occupation in occupations for spouse in spouses
+        ]
+
+        # act
+        actual = format_person({ "results": { "bindings": [
+            name, birth, *occupations, *spouses
+        ] } })
+
+        # assert
+        self.assertEqual(actual, format_person({ "results": { "bindings": exploded } }))
+        self.assertEqual(actual["title"], "A")
+        self.assertEqual(actual["entries"]["Spouse"][1], {
+            "value": "Spouse 2", "link": "http://www.wikidata.org/entity/Q2"
+        })
+
+    def test_entity_columns(self):
+        """ Tests rows from the batch and combined queries, which all have the entity
+            and its type
+        """
+        # arrange
+        entity = {
+            "entity": { "value": "http://www.wikidata.org/entity/Q1" },
+            "entityType": { "value": "PERSON" },
+        }
+        name = { "name": { "value": "A" } }
+        poet, painter = { "value": "poet" }, { "value": "painter" }
+
+        # act
+        actual = merge_property_rows([
+            { **entity, **name },
+            { **entity, "occupationLabel": poet },
+            { **entity, "occupationLabel": painter },
+        ])
+
+        # assert
+        self.assertEqual(actual, [
+            { **entity, **name, "occupationLabel": poet },
+            { **entity, **name, "occupationLabel": painter },
+        ])
+
+    def test_other_rows_are_unchanged(self):
+        """ Tests that exploded rows, and rows where a column is bound with different
+            columns, are returned as they are
+        """
+        # arrange
+        exploded = [
+            { "a": { "value": "1" }, "b": { "value": "1" } },
+            { "a": { "value": "1" }, "b": { "value": "2" } },
+        ]
+        mixed = [
+            { "name": { "value": "A" }, "b": { "value": "1" } },
+            { "name": { "value": "A" }, "a": { "value": "1" }, "b": { "value": "2" } },
+        ]
+
+        # act
+        actual = [merge_property_rows(exploded), merge_property_rows(mixed)]
+
+        # assert
+        self.assertIs(actual[0], exploded)
+        self.assertIs(actual[1], mixed)
+
+class FormatDateStringTests(TestCase):
+    """ format_date_string tests """
+
+    def test_wikidata_times(self):
+        """ Tests the times the query service returns """
+        # act
+        actual = [
+            format_date_string("1732-02-22T00:00:00Z"),
+            format_date_string("-0069-01-01T00:00:00Z"),
+            format_date_string("+1879-03-14T00:00:00Z"),
+        ]
+
+        # assert
+        self.assertEqual(actual, ["February 22, 1732", "69 BCE", "March 14, 1879"])
+
+    def test_precision(self):
+        """ Tests that times less precise than a day only show what's known """
+        # act
+        actual = [
+            format_date_string("1732-01-01T00:00:00Z", 9),
+            format_date_string("1732-02-01T00:00:00Z", 10),
+            format_date_string("+1732-02-00T00:00:00Z"),
+            format_date_string("+1732-00-00T00:00:00Z"),
+            format_date_string("-13798000000-00-00T00:00:00Z"),
+        ]
+
+        # assert
+        self.assertEqual(
+            actual, ["1732", "February 1732", "February 1732", "1732", "13798000000 BCE"]
+        )
+
+    def test_other_dates_fall_back_to_dateutil(self):
+        """ Tests dates that aren't Wikidata times """
+        # act
+        actual = format_date_string("Sep 1 2019 07:58")
+
+        # assert
+        self.assertEqual(actual, "September 1, 2019")
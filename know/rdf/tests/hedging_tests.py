@@ -0,0 +1,169 @@
+import time
+import asyncio
+import threading
+import unittest
+from django.test import override_settings
+from rdf.parser.hedging import SparqlHedger, LatencyWindow, MIN_SAMPLES
+
+def _warmed_up_hedger() -> SparqlHedger:
+    """ Returns a hedger that's seen enough 10ms requests to start hedging """
+    hedger = SparqlHedger()
+    for _ in range(MIN_SAMPLES):
+        hedger.latencies.record(0.01)
+    return hedger
+
+def _slow_then_fast():
+    """ Returns a request that takes 0.5 seconds the first time it's sent, and answers
+        straight away after that
+    """
+    calls = []
+
+    def request():
+        calls.append(time.monotonic())
+        if len(calls) == 1:
+            time.sleep(0.5)
+            return "primary"
+        return "hedge"
+
+    return request, calls
+
+class SparqlHedgerTests(unittest.TestCase):
+    """ SparqlHedger tests """
+
+    def setUp(self):
+        self.settings = override_settings(
+            WIKIDATA_HEDGE=True, WIKIDATA_HEDGE_MIN_DELAY=0.02
+        )
+        self.settings.enable()
+
+    def tearDown(self):
+        self.settings.disable()
+
+    def test_latency_percentile(self):
+        """ Tests that there's no percentile until there are enough latencies """
+        # arrange
+        window = LatencyWindow(100)
+
+        # act
+        before = window.percentile(95)
+        for latency in range(1, 101):
+            window.record(latency)
+
+        # assert
+        self.assertIsNone(before)
+        self.assertEqual(window.percentile(95), 95)
+        self.assertEqual(window.percentile(50), 50)
+
+    def test_slow_request_is_hedged(self):
+        """ Tests that a request slower than usual is sent again, that the quicker
+            answer is used, and that the time it saved is counted
+        """
+        # arrange
+        hedger = _warmed_up_hedger()
+        request, calls = _slow_then_fast()
+
+        # act
+        started = time.monotonic()
+        actual = hedger.get(request)
+        elapsed = time.monotonic() - started
+
+        # assert
+        self.assertEqual(actual, "hedge")
+        self.assertLess(elapsed, 0.3)
+        self.assertEqual(len(calls), 2)
+        metrics = hedger.metrics()
+        self.assertEqual((metrics['hedges'], metrics['hedge_wins']), (1, 1))
+        self.assertGreaterEqual(metrics['saved_seconds'], 0.02)
+        self.assertEqual(metrics['hedge_rate'], 1.0)
+
+    def test_fast_request_is_not_hedged(self):
+        """ Tests that a request that answers in the usual time is only sent once """
+        # arrange
+        hedger = _warmed_up_hedger()
+
+        # act
+        actual = hedger.get(lambda: "primary")
+
+        # assert
+        self.assertEqual(actual, "primary")
+        self.assertEqual(hedger.metrics()['hedges'], 0)
+
+    @override_settings(WIKIDATA_HEDGE_MAX_IN_FLIGHT=0)
+    def test_capped_hedges_are_denied(self):
+        """ Tests that no hedge is sent once the cap is reached """
+        # arrange
+        hedger = _warmed_up_hedger()
+        request, calls = _slow_then_fast()
+
+        # act
+        actual = hedger.get(request)
+
+        # assert
+        self.assertEqual(actual, "primary")
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(hedger.metrics()['hedges_denied'], 1)
+
+    @override_settings(WIKIDATA_HEDGE_WORKERS=1, WIKIDATA_HEDGE_MAX_IN_FLIGHT=1)
+    def test_busy_pool_is_not_waited_for(self):
+        """ Tests that a request is sent from the calling thread, without hedging, when
+            the pool has no thread left for it
+        """
+        # arrange
+        hedger = _warmed_up_hedger()
+        request, calls = _slow_then_fast()
+        threads = []
+
+        def send():
+            threads.append(threading.current_thread())
+            return request()
+
+        # act
+        actual = hedger.get(send)
+
+        # assert
+        self.assertEqual(actual, "primary")
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(threads, [threading.current_thread()])
+        self.assertEqual(hedger.metrics()['hedges'], 0)
+
+    def test_async_loser_is_cancelled(self):
+        """ Tests that the async version uses the quicker answer, cancels the other, and
+            counts the time it saved
+        """
+        # arrange
+        hedger = _warmed_up_hedger()
+        delays, cancelled = [0.5, 0], []
+
+        async def request():
+            delay = delays.pop(0)
+            try:
+                await asyncio.sleep(delay)
+            except asyncio.CancelledError:
+                cancelled.append(delay)
+                raise
+            return delay
+
+        # act
+        actual = asyncio.run(hedger.aget(request))
+
+        # assert
+        self.assertEqual(actual, 0)
+        self.assertEqual(cancelled, [0.5])
+        metrics = hedger.metrics()
+        self.assertEqual(metrics['hedge_wins'], 1)
+        self.assertGreater(metrics['saved_seconds'], 0)
+
+    @override_settings(WIKIDATA_HEDGE=False)
+    def test_off(self):
+        """ Tests that requests go straight through when hedging is off """
+        # arrange
+        hedger = _warmed_up_hedger()
+        request, calls = _slow_then_fast()
+
+        # act
+        actual = hedger.get(request)
+
+        # assert
+        self.assertEqual(actual, "primary")
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(hedger.metrics()['requests'], 0)
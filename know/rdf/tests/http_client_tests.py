@@ -0,0 +1,74 @@
+import json
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from requests import HTTPError
+from rdf.parser.http_client import HttpClient
+
+class _JsonHandler(BaseHTTPRequestHandler):
+    """ Echoes the request headers back as JSON over a keep-alive connection """
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self): # pylint: disable=invalid-name
+        """ Responds to every GET, with a 404 for /missing """
+        body = json.dumps(dict(self.headers)).encode()
+        self.send_response(404 if self.path == "/missing" else 200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *_): # Keep the test output clean
+        pass
+
+class HttpClientTests(unittest.TestCase):
+    """ HttpClient tests, against a local server """
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _JsonHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.client = HttpClient()
+
+    def tearDown(self):
+        self.client.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_connection_is_reused(self):
+        """ Tests that consecutive requests share one kept-alive connection """
+        # arrange
+        opened_before = self.client.metrics()["connections_opened"]
+
+        # act
+        for _ in range(3):
+            self.client.get(self.url + "/sparql")
+        metrics = self.client.metrics()
+
+        # assert
+        self.assertEqual(metrics["requests"], 3)
+        self.assertEqual(metrics["connections_opened"] - opened_before, 1)
+
+    def test_requests_compressed_responses(self):
+        """ Tests that gzip/deflate is negotiated """
+        # act
+        headers = self.client.get(self.url).json()
+
+        # assert
+        self.assertEqual(headers["Accept-Encoding"], "gzip, deflate")
+
+    def test_raise_for_status_raises_http_error(self):
+        """ Tests that error statuses raise when asked to """
+        self.assertRaises(
+            HTTPError, self.client.get, self.url + "/missing", raise_for_status=True
+        )
+
+    def test_stream_yields_body(self):
+        """ Tests that a streamed body is the same as a downloaded one """
+        # act
+        with self.client.stream(self.url + "/stream") as chunks:
+            body = b"".join(chunks)
+
+        # assert
+        self.assertEqual(json.loads(body)["Accept-Encoding"], "gzip, deflate")
+        self.assertEqual(self.client.metrics()["requests"], 1)
@@ -0,0 +1,191 @@
+import unittest
+from unittest.mock import patch
+from rdf.parser.abstract_parser import EntityType
+from rdf.parser.panel_cache import (
+    panel_cache, panel_refresher, canonical_entity_key, viaf_alias_key, panel_etag
+)
+from rdf.parser.summarizer import Summarizer
+from rdf.parser.viaf_resolver import viaf_links
+
+PANEL = { "title": "George Washington", "subtitle": "1st president", "entries": {} }
+
+class CanonicalEntityKeyTests(unittest.TestCase):
+    """ canonical_entity_key and viaf_alias_key tests """
+
+    def test_uri_variants_map_to_same_key(self):
+        """ Tests that every form of a Wikidata URI maps to the same key """
+        # arrange
+        uris = [
+            "https://www.wikidata.org/wiki/Q23",
+            "http://www.wikidata.org/wiki/Q23",
+            "http://www.wikidata.org/entity/Q23",
+            "https://wikidata.org/entity/Q23",
+        ]
+
+        # act
+        keys = { canonical_entity_key(uri) for uri in uris }
+
+        # assert
+        self.assertEqual(keys, { "wikidata:Q23" })
+
+    def test_uri_without_id_returns_none(self):
+        """ Tests that a URI without a Wikidata ID has no key """
+        self.assertIsNone(canonical_entity_key("https://www.wikidata.org/wiki/"))
+
+    def test_viaf_alias_key(self):
+        """ Tests that the VIAF ID is pulled out of a VIAF URI """
+        actual = viaf_alias_key("http://viaf.org/viaf/75121530/")
+        self.assertEqual(actual, "viaf:75121530")
+
+    def test_panel_etag(self):
+        """ Tests that a panel's ETag depends on its content but not its key order """
+        # arrange
+        reordered = dict(reversed(PANEL.items()))
+
+        # act
+        actual = panel_etag(reordered)
+
+        # assert
+        self.assertEqual(actual, panel_etag(PANEL))
+        self.assertNotEqual(actual, panel_etag({ **PANEL, "subtitle": "president" }))
+        self.assertRegex(actual, '^"[0-9a-f]{32}"$')
+
+class PanelCacheTests(unittest.TestCase):
+    """ Tests caching of panels in Summarizer.summarize """
+
+    def setUp(self):
+        panel_cache.clear()
+        viaf_links.clear()
+
+    @patch("rdf.parser.summarizer.WikidataParser")
+    def test_repeat_request_is_served_from_cache(self, parser_class):
+        """ Tests that a second request for the same entity doesn't parse again """
+        # arrange
+        parser_class.return_value.parse.return_value = PANEL
+        parser_class.return_value.entity_type = EntityType.PERSON
+
+        # act
+        first = Summarizer("https://www.wikidata.org/wiki/Q23").summarize()
+        second = Summarizer("http://www.wikidata.org/entity/Q23").summarize()
+
+        # assert
+        self.assertEqual(first, PANEL)
+        self.assertEqual(second, PANEL)
+        self.assertEqual(parser_class.return_value.parse.call_count, 1)
+        self.assertEqual(panel_cache.stats()["hits"], 1)
+        self.assertEqual(panel_cache.stats()["misses"], 1)
+
+    @patch("rdf.parser.summarizer.WikidataParser")
+    def test_failed_parse_is_not_cached(self, parser_class):
+        """ Tests that a panel that failed to parse is retried on the next request """
+        # arrange
+        parser_class.return_value.parse.return_value = None
+        parser_class.return_value.entity_type = None
+
+        # act
+        Summarizer("https://www.wikidata.org/wiki/Q23").summarize()
+        Summarizer("https://www.wikidata.org/wiki/Q23").summarize()
+
+        # assert
+        self.assertEqual(parser_class.return_value.parse.call_count, 2)
+
+    @patch.object(Summarizer, "get_wikidata_uri")
+    @patch("rdf.parser.summarizer.WikidataParser")
+    def test_viaf_uri_shares_wikidata_entry(self, parser_class, get_wikidata_uri):
+        """ Tests that a VIAF URI is served from the panel of the QID it resolves to,
+            and that the VIAF resolution itself is only done once
+        """
+        # arrange
+        parser_class.return_value.parse.return_value = PANEL
+        parser_class.return_value.entity_type = EntityType.PERSON
+        get_wikidata_uri.return_value = "http://www.wikidata.org/entity/Q23"
+
+        # act
+        Summarizer("https://www.wikidata.org/wiki/Q23").summarize()
+        Summarizer("http://viaf.org/viaf/12345/").summarize()
+        actual = Summarizer("https://viaf.org/viaf/12345").summarize()
+
+        # assert
+        self.assertEqual(actual, PANEL)
+        self.assertEqual(parser_class.return_value.parse.call_count, 1)
+        self.assertEqual(get_wikidata_uri.call_count, 1)
+
+    @patch.object(Summarizer, "get_wikidata_uri")
+    @patch("rdf.parser.summarizer.WikidataParser")
+    def test_viaf_links_are_kept_apart(self, parser_class, get_wikidata_uri):
+        """ Tests that VIAF links are kept out of the panel cache, so they can't evict
+            panels, and aren't counted in its stats
+        """
+        # arrange
+        parser_class.return_value.parse.return_value = PANEL
+        parser_class.return_value.entity_type = EntityType.PERSON
+        get_wikidata_uri.return_value = "http://www.wikidata.org/entity/Q23"
+
+        # act
+        Summarizer("http://viaf.org/viaf/12345/").summarize()
+
+        # assert
+        self.assertIsNone(panel_cache.backend.get("viaf:12345"))
+        self.assertEqual(viaf_links.backend.get("viaf:12345"), "Q23")
+        self.assertEqual(panel_cache.stats()["misses"], 1)
+        self.assertEqual(panel_cache.stats()["hits"], 0)
+
+    def test_ttl_depends_on_entity_type(self):
+        """ Tests that entity types get the TTL configured for them """
+        # act
+        country_ttl = panel_cache.get_ttl(EntityType.COUNTRY)
+        book_ttl = panel_cache.get_ttl(EntityType.BOOK)
+
+        # assert
+        self.assertLess(country_ttl, book_ttl)
+
+@patch("rdf.parser.panel_cache.time.time")
+class StaleWhileRevalidateTests(unittest.TestCase):
+    """ Tests serving stale panels while they're refreshed """
+
+    def setUp(self):
+        panel_cache.clear()
+
+    @patch("rdf.parser.summarizer.WikidataParser")
+    def test_stale_panel_is_served_and_refreshed(self, parser_class, now):
+        """ Tests that a stale panel is returned straight away, and replaced in the
+            background
+        """
+        # arrange
+        now.return_value = 0
+        ttl = panel_cache.get_ttl(EntityType.PERSON)
+        panel_cache.set("wikidata:Q23", PANEL, EntityType.PERSON)
+        refreshed = { **PANEL, "title": "George Washington (refreshed)" }
+        parser_class.return_value.parse.return_value = refreshed
+        parser_class.return_value.entity_type = EntityType.PERSON
+        now.return_value = ttl + 1
+
+        # act
+        served = Summarizer("https://www.wikidata.org/wiki/Q23").summarize()
+        panel_refresher.wait(timeout=5)
+        after_refresh = panel_cache.get_entry("wikidata:Q23")
+
+        # assert
+        self.assertEqual(served, PANEL)
+        self.assertEqual(after_refresh, (refreshed, False))
+        self.assertEqual(panel_cache.stats()["stale_hits"], 1)
+
+    @patch("rdf.parser.summarizer.WikidataParser")
+    def test_failed_refresh_keeps_stale_panel(self, parser_class, now):
+        """ Tests that the stale panel keeps being served while Wikidata is failing """
+        # arrange
+        now.return_value = 0
+        ttl = panel_cache.get_ttl(EntityType.PERSON)
+        panel_cache.set("wikidata:Q23", PANEL, EntityType.PERSON)
+        parser_class.return_value.parse.return_value = None
+        now.return_value = ttl + 1
+
+        # act
+        Summarizer("https://www.wikidata.org/wiki/Q23").summarize()
+        panel_refresher.wait(timeout=5)
+        served = Summarizer("https://www.wikidata.org/wiki/Q23").summarize()
+        panel_refresher.wait(timeout=5)
+
+        # assert
+        self.assertEqual(served, PANEL)
+        self.assertEqual(panel_cache.get_entry("wikidata:Q23"), (PANEL, True))
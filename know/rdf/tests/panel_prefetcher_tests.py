@@ -0,0 +1,94 @@
+import unittest
+from unittest.mock import patch, MagicMock
+from django.test import override_settings
+from rdf.parser.abstract_parser import EntityType
+from rdf.parser.panel_cache import panel_cache
+from rdf.parser.panel_prefetcher import panel_prefetcher, linked_uris
+from rdf.parser.summarizer import Summarizer
+
+ENTITY = "http://www.wikidata.org/entity/"
+PANEL = {
+    "title": "George Washington",
+    "entries": {
+        "Born": [{ "value": "February 22, 1732" }],
+        "Nationality": [
+            { "value": "United States of America", "link": ENTITY + "Q30" },
+            { "value": "Kingdom of Great Britain", "link": ENTITY + "Q161885" },
+        ],
+        "Spouse": [{ "value": "Martha Washington", "link": ENTITY + "Q191789" }],
+    },
+}
+
+def fake_parser(uri: str) -> MagicMock:
+    """ Returns a WikidataParser whose panel is PANEL for Q23, and a panel without links
+        for anything else
+    """
+    parser = MagicMock()
+    parser.entity_type = EntityType.PERSON
+    parser.parse.return_value = PANEL if uri.endswith("Q23") else { "title": uri }
+    return parser
+
+class LinkedUrisTests(unittest.TestCase):
+    """ linked_uris tests """
+
+    def test_links_in_order_without_duplicates(self):
+        """ Tests that every entry's links are returned once, in order """
+        # arrange
+        panel = { **PANEL, "entries": { **PANEL["entries"], "Spouse": [
+            { "value": "Martha Washington", "link": ENTITY + "Q30" },
+        ] } }
+
+        # act
+        actual = linked_uris(panel)
+
+        # assert
+        self.assertEqual(actual, [ENTITY + "Q30", ENTITY + "Q161885"])
+        self.assertEqual(linked_uris(None), [])
+
+@patch("rdf.parser.summarizer.WikidataParser", side_effect=fake_parser)
+class PanelPrefetcherTests(unittest.TestCase):
+    """ Tests prefetching linked panels in Summarizer.summarize """
+
+    def setUp(self):
+        panel_cache.clear()
+
+    @override_settings(PANEL_PREFETCH=True, PANEL_PREFETCH_RATE=0)
+    def test_linked_panels_are_cached(self, parser_class):
+        """ Tests that following a link after a panel is parsed is a cache hit """
+        # act
+        Summarizer("https://www.wikidata.org/wiki/Q23").summarize()
+        panel_prefetcher.wait(timeout=5)
+        actual = Summarizer("https://www.wikidata.org/wiki/Q191789").summarize()
+
+        # assert
+        self.assertEqual(actual, { "title": ENTITY + "Q191789" })
+        self.assertEqual(parser_class.call_count, 4)
+        self.assertEqual(panel_cache.stats()["hits"], 1)
+
+    @override_settings(PANEL_PREFETCH=True, PANEL_PREFETCH_RATE=0,
+                       PANEL_PREFETCH_MAX_LINKS=2)
+    def test_fan_out_cap_and_cached_links(self, parser_class):
+        """ Tests that at most PANEL_PREFETCH_MAX_LINKS links are prefetched, and that
+            links that are already cached aren't parsed again
+        """
+        # arrange
+        panel_cache.set("wikidata:Q30", { "title": "United States of America" })
+
+        # act
+        Summarizer("https://www.wikidata.org/wiki/Q23").summarize()
+        panel_prefetcher.wait(timeout=5)
+
+        # assert
+        self.assertEqual(parser_class.call_count, 2)
+        self.assertIsNotNone(panel_cache.peek("wikidata:Q161885")[0])
+        self.assertIsNone(panel_cache.peek("wikidata:Q191789")[0])
+
+    def test_off_by_default(self, parser_class):
+        """ Tests that nothing is prefetched unless PANEL_PREFETCH is on """
+        # act
+        Summarizer("https://www.wikidata.org/wiki/Q23").summarize()
+        panel_prefetcher.wait(timeout=5)
+
+        # assert
+        self.assertEqual(parser_class.call_count, 1)
+        self.assertIsNone(panel_cache.peek("wikidata:Q30")[0])
@@ -0,0 +1,238 @@
+import time
+import asyncio
+import unittest
+from unittest.mock import patch, AsyncMock, MagicMock
+import requests
+from django.test import override_settings
+from rdf.parser.resilience import BreakerState, CircuitBreaker, RetryBudget, backoff_delay
+from rdf.parser.wikidata_parser import (
+    WikidataParser, wikidata_sparql_query, wikidata_sparql_query_async
+)
+
+RESPONSE = { "results": { "bindings": [] } }
+HUMAN = { "results": { "bindings": [{ "label": { "value": "human" } }] } }
+
+def _response(status_code: int, headers: dict = None) -> MagicMock:
+    response = MagicMock(status_code=status_code, headers=headers or {})
+    response.json.return_value = RESPONSE
+    return response
+
+class ResilienceTests(unittest.TestCase):
+    """ Tests the backoff, retry budget and circuit breaker """
+
+    def test_backoff_is_capped(self):
+        """ Tests that the jittered delay never exceeds the cap """
+        delays = [backoff_delay(attempt, 0.1, 2) for attempt in range(20)]
+        self.assertTrue(all(0 <= delay <= 2 for delay in delays))
+
+    def test_retry_budget_runs_out(self):
+        """ Tests that retries are denied once the budget is spent """
+        # arrange
+        budget = RetryBudget(ratio=0.5, max_tokens=2)
+
+        # act
+        allowed = [budget.try_retry() for _ in range(3)]
+        budget.record_request()
+        budget.record_request()
+
+        # assert
+        self.assertEqual(allowed, [True, True, False])
+        self.assertTrue(budget.try_retry())
+
+    @patch("rdf.parser.resilience.time.monotonic")
+    def test_breaker_opens_and_recovers(self, monotonic):
+        """ Tests that the breaker opens after enough failures, then lets a probe
+            through after the reset timeout and closes if it succeeds
+        """
+        # arrange
+        monotonic.return_value = 100
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+
+        # act / assert
+        breaker.record_failure(breaker.allow_request())
+        breaker.record_failure(breaker.allow_request())
+        self.assertEqual(breaker.state, BreakerState.OPEN)
+        self.assertIsNone(breaker.allow_request())
+
+        monotonic.return_value = 131
+        probe = breaker.allow_request()
+        self.assertIsNotNone(probe)
+        self.assertIsNone(breaker.allow_request()) # Only one probe at a time
+        breaker.record_success(probe)
+        self.assertEqual(breaker.state, BreakerState.CLOSED)
+        self.assertIsNotNone(breaker.allow_request())
+
+    @patch("rdf.parser.resilience.time.monotonic")
+    def test_stale_success_doesnt_close(self, monotonic):
+        """ Tests that a request that was in flight when the breaker opened doesn't
+            close it when it succeeds, during the reset timeout or while probing
+        """
+        # arrange
+        monotonic.return_value = 100
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+        in_flight = [breaker.allow_request() for _ in range(3)]
+        breaker.record_failure(in_flight[0])
+        breaker.record_failure(in_flight[1])
+
+        # act / assert
+        breaker.record_success(in_flight[2])
+        self.assertEqual(breaker.state, BreakerState.OPEN)
+        self.assertEqual(breaker.failures, 2)
+        self.assertIsNone(breaker.allow_request())
+
+        monotonic.return_value = 131
+        probe = breaker.allow_request()
+        breaker.record_success(in_flight[2])
+        self.assertEqual(breaker.state, BreakerState.HALF_OPEN)
+        breaker.record_success(probe)
+        self.assertEqual(breaker.state, BreakerState.CLOSED)
+
+@patch("rdf.parser.wikidata_parser.time.sleep")
+@patch("rdf.parser.wikidata_parser.http_client")
+class WikidataQueryResilienceTests(unittest.TestCase):
+    """ Tests retries and fail fast in wikidata_sparql_query """
+
+    def setUp(self):
+        self.breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30)
+        self.budget = RetryBudget(ratio=0.2, max_tokens=10)
+        patchers = [
+            patch("rdf.parser.wikidata_parser.wikidata_breaker", self.breaker),
+            patch("rdf.parser.wikidata_parser.retry_budget", self.budget),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_retries_server_errors_and_timeouts(self, http_client, sleep):
+        """ Tests that 503s and timeouts are retried with a backoff """
+        # arrange
+        http_client.get.side_effect = [
+            _response(503), requests.Timeout("timed out"), _response(200)
+        ]
+
+        # act
+        actual = wikidata_sparql_query("SELECT ?retries {}")
+
+        # assert
+        self.assertEqual(actual, RESPONSE)
+        self.assertEqual(sleep.call_count, 2)
+        self.assertEqual(self.budget.retries, 2)
+
+    def test_rejected_query_is_not_retried(self, http_client, sleep):
+        """ Tests that a 400 isn't retried and doesn't count against upstream """
+        # arrange
+        http_client.get.return_value = _response(400)
+
+        # act
+        actual = wikidata_sparql_query("SELECT ?malformed {")
+
+        # assert
+        self.assertIsNone(actual)
+        sleep.assert_not_called()
+        self.assertEqual(self.breaker.failures, 0)
+
+    def test_retry_after_is_respected(self, http_client, sleep):
+        """ Tests that a 429's Retry-After is waited out """
+        # arrange
+        throttled = _response(429, { "Retry-After": "3" })
+        http_client.get.side_effect = [throttled, _response(200)]
+
+        # act
+        wikidata_sparql_query("SELECT ?throttled {}")
+
+        # assert
+        self.assertGreaterEqual(sleep.call_args[0][0], 3)
+
+    def test_open_breaker_fails_fast(self, http_client, _):
+        """ Tests that once the breaker opens, queries don't reach Wikidata """
+        # arrange
+        http_client.get.side_effect = requests.ConnectionError("down")
+
+        # act
+        wikidata_sparql_query("SELECT ?outage {}")
+        calls_during_outage = http_client.get.call_count
+        actual = wikidata_sparql_query("SELECT ?outage2 {}")
+
+        # assert
+        self.assertIsNone(actual)
+        self.assertEqual(calls_during_outage, 3)
+        self.assertEqual(http_client.get.call_count, 3)
+        self.assertEqual(self.breaker.state, BreakerState.OPEN)
+
+    def _half_open(self):
+        """ Opens the breaker long enough ago that the next query is its probe """
+        self.breaker.state = BreakerState.OPEN
+        self.breaker.opened_at = time.monotonic() - self.breaker.reset_timeout
+
+    def test_probe_is_freed_after_unexpected_error(self, http_client, _):
+        """ Tests that a probe that raises something other than a retryable error
+            doesn't leave the breaker half open for good
+        """
+        # arrange
+        self._half_open()
+        http_client.get.side_effect = ValueError("unexpected")
+
+        # act
+        with self.assertRaises(ValueError):
+            wikidata_sparql_query("SELECT ?unexpected {}")
+
+        # assert
+        self.assertEqual(self.breaker.probes_in_flight, 0)
+        self.assertIsNotNone(self.breaker.allow_request())
+
+    def test_cancelled_probe_is_freed(self, *_):
+        """ Tests that an async probe cancelled by the client disconnecting frees its
+            slot
+        """
+        # arrange
+        self._half_open()
+        async_get = AsyncMock(side_effect=asyncio.CancelledError)
+
+        # act
+        with patch("rdf.parser.wikidata_parser.async_http_client.get", async_get):
+            with self.assertRaises(asyncio.CancelledError):
+                asyncio.run(wikidata_sparql_query_async("SELECT ?cancelled {}"))
+
+        # assert
+        self.assertEqual(self.breaker.probes_in_flight, 0)
+        self.assertIsNotNone(self.breaker.allow_request())
+
+@patch("rdf.parser.wikidata_parser.async_http_client")
+@patch("rdf.parser.wikidata_parser.http_client")
+class OpenBreakerParseTests(unittest.TestCase):
+    """ Tests parsing when the breaker opens after the entity type has been fetched """
+
+    def setUp(self):
+        self.breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30)
+        patcher = patch("rdf.parser.wikidata_parser.wikidata_breaker", self.breaker)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_parse_fails_fast(self, http_client, async_http_client):
+        """ Tests that parse and aparse return None instead of formatting the missing
+            response, with and without WIKIDATA_COMBINED_RESOLUTION
+        """
+        # arrange
+        labels = _response(200)
+        labels.json.return_value = HUMAN
+        http_client.get.return_value = labels
+        async_http_client.get = AsyncMock(return_value=labels)
+        parses = [
+            lambda parser: parser.parse(),
+            lambda parser: asyncio.run(parser.aparse()),
+        ]
+
+        # act
+        actual = []
+        for combined in (False, True):
+            with override_settings(WIKIDATA_COMBINED_RESOLUTION=combined):
+                for parse in parses:
+                    # Only the first query gets through before the breaker opens
+                    self.breaker.allow_request = MagicMock(
+                        side_effect=[self.breaker.generation, None]
+                    )
+                    parser = WikidataParser("https://www.wikidata.org/wiki/Q23")
+                    actual.append(parse(parser))
+
+        # assert
+        self.assertEqual(actual, [None] * 4)
@@ -0,0 +1,212 @@
+import time
+import asyncio
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+from django.test import override_settings
+from rdf.parser.abstract_parser import EntityType
+from rdf.parser.panel_cache import panel_cache
+from rdf.parser.single_flight import SingleFlight
+from rdf.parser.deadline import DeadlineExceeded, request_deadline
+from rdf.parser.summarizer import Summarizer
+
+PANEL = { "title": "Albert Einstein", "subtitle": "physicist", "entries": {} }
+
+class SingleFlightTests(unittest.TestCase):
+    """ SingleFlight tests """
+
+    def test_concurrent_calls_share_one_result(self):
+        """ Tests that concurrent calls with the same key only do the work once """
+        # arrange
+        flight = SingleFlight()
+        calls = []
+        def work():
+            calls.append(1)
+            time.sleep(0.2)
+            return "result"
+
+        # act
+        with ThreadPoolExecutor(max_workers=10) as pool:
+            results = list(pool.map(lambda _: flight.do("Q937", work), range(10)))
+
+        # assert
+        self.assertEqual(results, ["result"] * 10)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(flight.coalesced, 9)
+        self.assertEqual(flight.in_flight(), 0)
+
+    def test_waiters_get_the_error(self):
+        """ Tests that an error is raised for every coalesced caller """
+        # arrange
+        flight = SingleFlight()
+        started = threading.Event()
+        def work():
+            started.set()
+            time.sleep(0.2)
+            raise ValueError("upstream failed")
+
+        # act
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            leader = pool.submit(flight.do, "Q937", work)
+            started.wait()
+            follower = pool.submit(flight.do, "Q937", work)
+
+        # assert
+        self.assertRaises(ValueError, leader.result)
+        self.assertRaises(ValueError, follower.result)
+
+    def test_async_calls_share_one_result(self):
+        """ Tests that ado coalesces calls in the same event loop """
+        # arrange
+        flight = SingleFlight()
+        calls = []
+        async def work():
+            calls.append(1)
+            await asyncio.sleep(0.1)
+            return "result"
+
+        async def call_many():
+            return await asyncio.gather(*(flight.ado("Q937", work) for _ in range(10)))
+
+        # act
+        results = asyncio.run(call_many())
+
+        # assert
+        self.assertEqual(results, ["result"] * 10)
+        self.assertEqual(len(calls), 1)
+
+    def test_waiter_keeps_its_own_deadline(self):
+        """ Tests that a waiter with a short deadline stops waiting on a slow leader
+            without a deadline (e.g. the cache warmer) once its own deadline passes
+        """
+        # arrange
+        flight = SingleFlight()
+        started = threading.Event()
+        def slow_work():
+            started.set()
+            time.sleep(1)
+            return "result"
+
+        def wait_briefly():
+            with request_deadline(0.2):
+                began = time.monotonic()
+                try:
+                    flight.do("Q937", slow_work)
+                except DeadlineExceeded:
+                    return time.monotonic() - began
+            return None
+
+        # act
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            leader = pool.submit(flight.do, "Q937", slow_work)
+            started.wait()
+            waited = pool.submit(wait_briefly).result()
+
+        # assert
+        self.assertIsNotNone(waited)
+        self.assertLess(waited, 0.5)
+        self.assertEqual(leader.result(), "result")
+
+    def test_leaders_missed_deadline_is_not_shared(self):
+        """ Tests that a waiter does the work itself if the leader ran out of time """
+        # arrange
+        flight = SingleFlight()
+        started = threading.Event()
+        calls = []
+        def work():
+            calls.append(1)
+            if len(calls) == 1:
+                started.set()
+                time.sleep(0.2)
+                raise DeadlineExceeded("No time left")
+            return "result"
+
+        def wait_with_time_left():
+            with request_deadline(30):
+                return flight.do("Q937", work)
+
+        # act
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            leader = pool.submit(flight.do, "Q937", work)
+            started.wait()
+            follower = pool.submit(wait_with_time_left)
+
+        # assert
+        self.assertRaises(DeadlineExceeded, leader.result)
+        self.assertEqual(follower.result(), "result")
+        self.assertEqual(len(calls), 2)
+
+    def test_async_waiter_keeps_its_own_deadline(self):
+        """ Tests that ado stops waiting once the waiter's deadline passes, without
+            cancelling the leader
+        """
+        # arrange
+        flight = SingleFlight()
+        async def slow_work():
+            await asyncio.sleep(0.5)
+            return "result"
+
+        async def wait_briefly():
+            with request_deadline(0.1):
+                await flight.ado("Q937", slow_work)
+
+        async def call_both():
+            leader = asyncio.ensure_future(flight.ado("Q937", slow_work))
+            await asyncio.sleep(0)
+            waiter = await asyncio.gather(wait_briefly(), return_exceptions=True)
+            return await leader, waiter[0]
+
+        # act
+        result, error = asyncio.run(call_both())
+
+        # assert
+        self.assertEqual(result, "result")
+        self.assertIsInstance(error, DeadlineExceeded)
+
+class SummarizerSingleFlightTests(unittest.TestCase):
+    """ Tests coalescing in Summarizer.summarize """
+
+    def setUp(self):
+        panel_cache.clear()
+
+    @patch("rdf.parser.summarizer.WikidataParser")
+    def test_concurrent_summarize_parses_once(self, parser_class):
+        """ Tests that concurrent requests for one entity only parse it once """
+        # arrange
+        def slow_parse():
+            time.sleep(0.2)
+            return PANEL
+        parser_class.return_value.parse.side_effect = slow_parse
+        parser_class.return_value.entity_type = EntityType.PERSON
+        uris = [
+            "https://www.wikidata.org/wiki/Q937", "http://www.wikidata.org/entity/Q937"
+        ] * 4
+
+        # act
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            panels = list(pool.map(lambda uri: Summarizer(uri).summarize(), uris))
+
+        # assert
+        self.assertEqual(panels, [PANEL] * 8)
+        self.assertEqual(parser_class.return_value.parse.call_count, 1)
+
+    @override_settings(PANEL_SINGLE_FLIGHT_CROSS_PROCESS=True)
+    @patch("rdf.parser.summarizer.WikidataParser")
+    def test_waits_for_other_process(self, parser_class):
+        """ Tests that when another process holds the fill lock, its panel is used """
+        # arrange
+        key = "wikidata:Q937"
+        panel_cache.acquire_fill_lock(key) # Pretend another process is filling it
+        def other_process():
+            time.sleep(0.2)
+            panel_cache.set(key, PANEL, EntityType.PERSON)
+            panel_cache.release_fill_lock(key)
+        threading.Thread(target=other_process).start()
+
+        # act
+        actual = Summarizer("https://www.wikidata.org/wiki/Q937").summarize()
+
+        # assert
+        self.assertEqual(actual, PANEL)
+        parser_class.return_value.parse.assert_not_called()
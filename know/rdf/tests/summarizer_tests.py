@@ -1,5 +1,5 @@
 import unittest
-from urllib.error import HTTPError
+from requests import HTTPError
 from rdf.parser.summarizer import Summarizer
 
 class SummarizerTester(unittest.TestCase):
@@ -0,0 +1,100 @@
+import asyncio
+import unittest
+from django.test import Client, AsyncClient
+from rdf.parser.panel_cache import panel_cache
+from rdf.parser.telemetry import Histogram, phase_seconds
+from rdf.benchmarks.replay import replay_wikidata
+
+def _server_timing(response) -> dict:
+    """ Returns the Server-Timing metrics by name """
+    return {
+        metric.split(";")[0]: metric.split(";", 1)[-1]
+        for metric in response['Server-Timing'].split(", ")
+    }
+
+class ServerTimingTests(unittest.TestCase):
+    """ Tests the Server-Timing header and /metrics """
+
+    def setUp(self):
+        panel_cache.clear()
+
+    def test_server_timing(self):
+        """ Tests that the phases of a panel request are in its Server-Timing header """
+        # act
+        with replay_wikidata():
+            first = Client().get("/", { "uri": "https://www.wikidata.org/wiki/Q23" })
+            second = Client().get("/", { "uri": "https://www.wikidata.org/wiki/Q23" })
+
+        # assert
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(
+            list(_server_timing(first)),
+            ["combined", "format", "serialize", "total", "cache", "sparql_rows"],
+        )
+        self.assertEqual(_server_timing(first)['cache'], 'desc="miss"')
+        self.assertEqual(_server_timing(first)['sparql_rows'], 'desc="13"')
+        # A cached panel is sent as it was encoded when it was cached
+        self.assertEqual(list(_server_timing(second)), ["total", "cache"])
+        self.assertEqual(_server_timing(second)['cache'], 'desc="hit"')
+
+    def test_async_server_timing(self):
+        """ Tests the Server-Timing header of the async route """
+        # act
+        with replay_wikidata():
+            # In the URL, as Django 3.2's AsyncClient drops the data of a GET
+            response = asyncio.run(
+                AsyncClient().get("/async/?uri=https://www.wikidata.org/wiki/Q142")
+            )
+
+        # assert
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("combined", _server_timing(response))
+        self.assertIn("serialize", _server_timing(response))
+
+    def test_metrics(self):
+        """ Tests that /metrics has the phase histograms, and the cache stats as counters
+            and gauges
+        """
+        # arrange
+        with replay_wikidata():
+            Client().get("/", { "uri": "https://www.wikidata.org/wiki/Q243" })
+
+        # act
+        response = Client().get("/metrics")
+
+        # assert
+        body = response.content.decode()
+        self.assertEqual(response['Content-Type'].split(";")[0], "text/plain")
+        self.assertIn('know_phase_seconds_count{phase="combined"}', body)
+        self.assertIn('know_request_seconds_count{view="get_knowledge_panel_data",'
+                      'status="200"}', body)
+        self.assertIn("# TYPE know_panel_cache_misses_total counter", body)
+        self.assertIn("know_panel_cache_misses_total 1", body)
+        self.assertIn("# TYPE know_panel_cache_hit_ratio gauge", body)
+        self.assertIn('know_wikidata_breaker_state{breaker_state="CLOSED"} 1', body)
+        phase_seconds.clear()
+
+class HistogramTests(unittest.TestCase):
+    """ Histogram tests """
+
+    def test_render(self):
+        """ Tests the Prometheus text format of a histogram """
+        # arrange
+        histogram = Histogram("test_seconds", "Test", ("phase",), (0.1, 1))
+        histogram.observe(0.05, "a")
+        histogram.observe(0.5, "a")
+        histogram.observe(5, "a")
+
+        # act
+        actual = histogram.render()
+
+        # assert
+        self.assertEqual(actual, [
+            "# HELP test_seconds Test",
+            "# TYPE test_seconds histogram",
+            'test_seconds_bucket{phase="a",le="0.1"} 1',
+            'test_seconds_bucket{phase="a",le="1"} 2',
+            'test_seconds_bucket{phase="a",le="+Inf"} 3',
+            'test_seconds_sum{phase="a"} 5.55',
+            'test_seconds_count{phase="a"} 3',
+        ])
@@ -0,0 +1,222 @@
+import gzip
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+from django.test import override_settings
+from rdf.parser.summarizer import Summarizer, NoWikidataException
+from rdf.parser.viaf_resolver import find_wikidata_link, viaf_links
+from rdf.parser.viaf_crosswalk import ViafCrosswalk, build_crosswalk
+
+CLUSTER = b"""<?xml version="1.0" encoding="UTF-8"?>
+<rdf:RDF xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#"
+         xmlns:schema="http://schema.org/">
+  <rdf:Description rdf:about="http://viaf.org/viaf/sourceID/LC%7Cn79022889">
+    <schema:sameAs rdf:resource="http://www.wikidata.org/entity/Q1"/>
+  </rdf:Description>
+  <rdf:Description rdf:about="http://viaf.org/viaf/75121530">
+    <schema:sameAs rdf:resource="http://id.loc.gov/authorities/names/n79022889"/>
+    <schema:sameAs>
+      <rdf:Description rdf:about="http://www.wikidata.org/entity/Q937"/>
+    </schema:sameAs>
+  </rdf:Description>
+"""
+CLUSTER_END = b"</rdf:RDF>\n"
+
+def _chunks(data: bytes, size: int = 16):
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+class FindWikidataLinkTests(unittest.TestCase):
+    """ find_wikidata_link tests """
+
+    def test_finds_link_of_the_cluster(self):
+        """ Tests that only the cluster's own sameAs links count """
+        # act
+        actual = find_wikidata_link(_chunks(CLUSTER + CLUSTER_END), "75121530")
+
+        # assert
+        self.assertEqual(actual, "http://www.wikidata.org/entity/Q937")
+
+    def test_stops_reading_at_the_link(self):
+        """ Tests that nothing after the link is read """
+        # arrange
+        def chunks():
+            yield from _chunks(CLUSTER)
+            raise AssertionError("Read past the link")
+
+        # act
+        actual = find_wikidata_link(chunks(), "75121530")
+
+        # assert
+        self.assertEqual(actual, "http://www.wikidata.org/entity/Q937")
+
+    def test_returns_none_without_link(self):
+        """ Tests clusters without a Wikidata link """
+        # act
+        actual = find_wikidata_link(_chunks(CLUSTER + CLUSTER_END), "12345")
+
+        # assert
+        self.assertIsNone(actual)
+
+@patch.object(Summarizer, "get_wikidata_uri")
+class ViafLinkCacheTests(unittest.TestCase):
+    """ Tests caching which Wikidata ID VIAF clusters resolve to """
+
+    def setUp(self):
+        self.directory = Path(tempfile.mkdtemp())
+        viaf_links.clear()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_cluster_without_link_is_cached(self, get_wikidata_uri):
+        """ Tests that a cluster without a Wikidata link is only fetched once """
+        # arrange
+        get_wikidata_uri.side_effect = NoWikidataException("no link")
+        summarizer = Summarizer("http://viaf.org/viaf/12345/")
+
+        # act
+        self.assertRaises(NoWikidataException, summarizer.resolve_viaf)
+        self.assertRaises(NoWikidataException, summarizer.resolve_viaf)
+
+        # assert
+        self.assertEqual(get_wikidata_uri.call_count, 1)
+
+    def test_links_persist_in_file(self, get_wikidata_uri):
+        """ Tests that links are read back from VIAF_CACHE_PATH once they're no longer
+            in memory, e.g. after a restart
+        """
+        # arrange
+        get_wikidata_uri.return_value = "http://www.wikidata.org/entity/Q937"
+
+        # act
+        with override_settings(VIAF_CACHE_PATH=str(self.directory / "viaf.sqlite3")):
+            Summarizer("http://viaf.org/viaf/75121530/").resolve_viaf()
+            viaf_links.clear()
+            actual = Summarizer("https://viaf.org/viaf/75121530").resolve_viaf()
+
+        # assert
+        self.assertEqual(actual, "http://www.wikidata.org/entity/Q937")
+        self.assertEqual(get_wikidata_uri.call_count, 1)
+
+    @override_settings(VIAF_NEGATIVE_TTL=-1)
+    def test_cluster_without_link_is_checked_again(self, get_wikidata_uri):
+        """ Tests that clusters without a link are fetched again once it's expired """
+        # arrange
+        get_wikidata_uri.side_effect = NoWikidataException("no link")
+
+        # act
+        with override_settings(VIAF_CACHE_PATH=str(self.directory / "viaf.sqlite3")):
+            for _ in range(2):
+                viaf_links.clear()
+                summarizer = Summarizer("http://viaf.org/viaf/1/")
+                self.assertRaises(NoWikidataException, summarizer.resolve_viaf)
+
+        # assert
+        self.assertEqual(get_wikidata_uri.call_count, 2)
+
+LINKS = [
+    "http://viaf.org/viaf/75121530\tLC|n  79022889",
+    "http://viaf.org/viaf/75121530\tWKP|Q937",
+    "http://viaf.org/viaf/31432428\tWKP|Q23",
+    "http://viaf.org/viaf/9\tWKP|Q42",
+    "http://viaf.org/viaf/3961158914281025860004\tWKP|Q1339",
+    "http://viaf.org/viaf/31432428\tWKP|Q99999", # A second link for the same cluster
+]
+
+class ViafCrosswalkTests(unittest.TestCase):
+    """ Tests building and searching the VIAF crosswalk index """
+
+    def setUp(self):
+        self.directory = Path(tempfile.mkdtemp())
+        self.index_path = self.directory / "viaf.crosswalk"
+        links_path = self.directory / "links.txt.gz"
+        with gzip.open(links_path, "wt", encoding="utf-8") as links:
+            links.write("\n".join(LINKS) + "\n")
+
+        # A tiny chunk size, so the sorted runs have to be merged
+        self.count = build_crosswalk(str(links_path), str(self.index_path), chunk_size=2)
+        viaf_links.clear()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_lookup(self):
+        """ Tests that every cluster with a Wikidata link can be found """
+        # arrange
+        crosswalk = ViafCrosswalk(self.index_path)
+
+        # act
+        actual = [
+            crosswalk.lookup(viaf_id)
+            for viaf_id in ("9", "31432428", "75121530", "3961158914281025860004")
+        ]
+
+        # assert
+        self.assertEqual(actual, ["Q42", "Q23", "Q937", "Q1339"])
+        self.assertEqual((self.count, len(crosswalk)), (4, 4))
+
+    def test_lookup_missing(self):
+        """ Tests clusters that aren't in the index """
+        # arrange
+        crosswalk = ViafCrosswalk(self.index_path)
+
+        # act
+        actual = [crosswalk.lookup(viaf_id) for viaf_id in ("1", "10", "99999999999")]
+
+        # assert
+        self.assertEqual(actual, [None, None, None])
+
+    def test_rebuilt_index_is_mapped_again(self):
+        """ Tests that a rebuilt index is used once it's next checked """
+        # arrange
+        crosswalk = ViafCrosswalk(self.index_path)
+        crosswalk.lookup("9")
+        links_path = self.directory / "rebuilt.txt"
+        links_path.write_text("http://viaf.org/viaf/9\tWKP|Q5\n", encoding="utf-8")
+        build_crosswalk(str(links_path), str(self.index_path))
+
+        # act
+        before_check = crosswalk.lookup("9")
+        with patch("rdf.parser.viaf_crosswalk.STAT_INTERVAL", 0):
+            actual = (crosswalk.lookup("9"), crosswalk.lookup("75121530"), len(crosswalk))
+
+        # assert
+        self.assertEqual(before_check, "Q42")
+        self.assertEqual(actual, ("Q5", None, 1))
+
+    @patch("builtins.print")
+    def test_invalid_index_is_ignored(self, print_error):
+        """ Tests that an index file that's empty, too short, not an index, or missing
+            some of its records is reported once and otherwise ignored
+        """
+        # arrange
+        index = self.index_path.read_bytes()
+        contents = [b"", b"VIAF", b"NOTVIAF!" + index[8:], index[:-1]]
+
+        for content in contents:
+            with self.subTest(content=content[:8]):
+                self.index_path.write_bytes(content)
+                crosswalk = ViafCrosswalk(self.index_path)
+                print_error.reset_mock()
+
+                # act
+                with patch("rdf.parser.viaf_crosswalk.STAT_INTERVAL", 0):
+                    actual = [crosswalk.lookup("9") for _ in range(2)] + [len(crosswalk)]
+
+                # assert
+                self.assertEqual(actual, [None, None, 0])
+                print_error.assert_called_once()
+
+    @patch.object(Summarizer, "get_wikidata_uri")
+    def test_summarizer_uses_index(self, get_wikidata_uri):
+        """ Tests that VIAF URIs in the index aren't fetched """
+        # act
+        with override_settings(VIAF_CROSSWALK_PATH=str(self.index_path)):
+            actual = Summarizer("http://viaf.org/viaf/75121530/").resolve_viaf()
+
+        # assert
+        self.assertEqual(actual, "http://www.wikidata.org/entity/Q937")
+        get_wikidata_uri.assert_not_called()
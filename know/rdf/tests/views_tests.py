@@ -0,0 +1,154 @@
+import json
+import unittest
+from django.test import Client, RequestFactory
+from rest_framework.renderers import JSONRenderer
+from rdf.renderers import FastJSONRenderer
+from rdf.parser.panel_cache import panel_cache, panel_refresher, panel_etag
+from rdf.benchmarks.replay import replay_wikidata
+from rdf.views import get_knowledge_panel_data, get_knowledge_panel_data_fast
+
+URI = "https://www.wikidata.org/wiki/Q23"
+
+class FastPathTests(unittest.TestCase):
+    """ Tests the panel route's view without DRF (PANEL_FAST_PATH) """
+
+    def setUp(self):
+        panel_cache.clear()
+
+    def test_same_json_as_drf(self):
+        """ Tests that the fast path and the DRF view respond with the bytes DRF's
+            JSONRenderer would write, both for a miss and a cache hit
+        """
+        # arrange
+        factory = RequestFactory()
+
+        # act
+        with replay_wikidata():
+            miss = get_knowledge_panel_data_fast(factory.get("/", { 'uri': URI }))
+            hit = get_knowledge_panel_data(factory.get("/", { 'uri': URI }))
+
+        # assert
+        self.assertEqual(miss.status_code, 200)
+        self.assertEqual(miss['Content-Type'], "application/json")
+        self.assertEqual(miss.content, JSONRenderer().render(json.loads(miss.content)))
+        self.assertEqual(hit.content, miss.content)
+
+    def test_bad_requests(self):
+        """ Tests that requests without a URI or that aren't GETs are rejected """
+        # arrange
+        factory = RequestFactory()
+
+        # act
+        without_uri = get_knowledge_panel_data_fast(factory.get("/"))
+        post = get_knowledge_panel_data_fast(factory.post("/", { 'uri': URI }))
+
+        # assert
+        self.assertEqual(without_uri.status_code, 400)
+        self.assertEqual(post.status_code, 405)
+
+class FastJSONRendererTests(unittest.TestCase):
+    """ Tests that FastJSONRenderer writes the same JSON as DRF's JSONRenderer """
+
+    def test_same_json(self):
+        """ Tests non-ASCII text, characters JavaScript doesn't allow, and numbers """
+        # arrange
+        data = {
+            "title": "Zoë Saldaña \u2014 \"actress\"",
+            "entries": { "Quote": ["line\u2028break\u2029", "tab\there"] },
+            "count": [1, 2.5, -3, None, True],
+        }
+
+        # act
+        actual = FastJSONRenderer().render(data)
+
+        # assert
+        self.assertEqual(actual, JSONRenderer().render(data))
+        self.assertNotIn("\u2028".encode("utf-8"), actual)
+
+    def test_indented(self):
+        """ Tests that indented JSON, e.g. for the browsable API, is still indented """
+        # arrange
+        renderer = FastJSONRenderer()
+
+        # act
+        actual = renderer.render({ "title": "Q23" }, "application/json; indent=2")
+
+        # assert
+        self.assertEqual(actual, b'{\n  "title": "Q23"\n}')
+
+class ConditionalGetTests(unittest.TestCase):
+    """ Tests the panel route's ETag, If-None-Match and Cache-Control handling """
+
+    def setUp(self):
+        panel_cache.clear()
+
+    def test_etag_and_cache_control(self):
+        """ Tests that a panel has an ETag of its content, and its entity type's
+            Cache-Control
+        """
+        # act
+        with replay_wikidata():
+            response = Client().get("/", { 'uri': URI })
+
+        # assert
+        self.assertEqual(response['ETag'], panel_etag(response.json()))
+        self.assertEqual(
+            response['Cache-Control'],
+            "public, max-age=3600, stale-while-revalidate=86400",
+        )
+        self.assertIn("Accept", response['Vary'])
+
+    def test_not_modified(self):
+        """ Tests that a request with the panel's ETag gets a 304 without the panel
+            being serialized, and that other ETags get the panel
+        """
+        # arrange
+        with replay_wikidata():
+            etag = Client().get("/", { 'uri': URI })['ETag']
+
+        # act
+        not_modified = Client().get(
+            "/", { 'uri': URI }, HTTP_IF_NONE_MATCH=f'"other", W/{etag}'
+        )
+        modified = Client().get("/", { 'uri': URI }, HTTP_IF_NONE_MATCH='"other"')
+
+        # assert
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified.content, b"")
+        self.assertEqual(not_modified['ETag'], etag)
+        self.assertNotIn("serialize", not_modified['Server-Timing'])
+        self.assertEqual(modified.status_code, 200)
+
+    def test_fast_path_not_modified(self):
+        """ Tests that the fast path has the same ETag and answers If-None-Match """
+        # arrange
+        factory = RequestFactory()
+        with replay_wikidata():
+            etag = Client().get("/", { 'uri': URI })['ETag']
+
+        # act
+        request = factory.get("/", { 'uri': URI }, HTTP_IF_NONE_MATCH=etag)
+        actual = get_knowledge_panel_data_fast(request)
+
+        # assert
+        self.assertEqual(actual.status_code, 304)
+        self.assertEqual(actual['ETag'], etag)
+
+    def test_stale_panel_max_age(self):
+        """ Tests that a stale panel isn't cached by clients, as it's being refreshed """
+        # arrange
+        factory = RequestFactory()
+        panel_cache.set("wikidata:Q23", { "title": "George Washington" })
+        entry = panel_cache.backend.get("wikidata:Q23")
+        entry['fresh_until'] = 0
+        panel_cache.backend.set("wikidata:Q23", entry)
+
+        # act
+        with replay_wikidata():
+            actual = get_knowledge_panel_data_fast(factory.get("/", { 'uri': URI }))
+            panel_refresher.wait()
+
+        # assert
+        self.assertEqual(
+            actual['Cache-Control'], "public, max-age=0, stale-while-revalidate=3600"
+        )
@@ -0,0 +1,253 @@
+import bz2
+import gzip
+import json
+import shutil
+import asyncio
+import threading
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+from django.core.management import call_command
+from django.test import override_settings
+from rdf.parser.abstract_parser import EntityType
+from rdf.parser.panel_cache import panel_cache
+from rdf.parser.panel_store import PanelStore, panel_store
+from rdf.parser.summarizer import Summarizer
+from rdf.parser.wikidata_dump import extract_entity, get_line_entity_id
+
+def _statement(property_id: str, value: dict, value_type: str, rank="normal") -> dict:
+    return {
+        "rank": rank,
+        "mainsnak": {
+            "snaktype": "value",
+            "property": property_id,
+            "datavalue": { "type": value_type, "value": value },
+        },
+    }
+
+def _item(property_id: str, entity_id: str, rank="normal") -> dict:
+    return _statement(property_id, { "id": entity_id }, "wikibase-entityid", rank)
+
+def _entity(entity_id: str, label: str = None, description: str = None, **claims):
+    return {
+        "id": entity_id,
+        "labels": { "en": { "language": "en", "value": label } } if label else {},
+        "descriptions": {
+            "en": { "language": "en", "value": description }
+        } if description else {},
+        "claims": claims,
+    }
+
+DUMP = [
+    _entity(
+        "Q23", "George Washington", "1st president of the United States",
+        P31=[_item("P31", "Q5")],
+        P569=[_statement(
+            "P569", { "time": "+1732-02-22T00:00:00Z", "precision": 11 }, "time"
+        )],
+        P26=[_item("P26", "Q191789")],
+        P27=[_item("P27", "Q30"), _item("P27", "Q174193", "deprecated")],
+        P106=[_item("P106", "Q82955"), _item("P106", "Q1734662")],
+    ),
+    _entity("Q191789", "Martha Washington", P31=[_item("P31", "Q5")]),
+    _entity(
+        "Q30", "United States of America",
+        P31=[_item("P31", "Q3624078"), _item("P31", "Q6256")],
+        P1082=[_statement("P1082", { "amount": "+331449281", "unit": "1" }, "quantity")],
+        P36=[_item("P36", "Q61")],
+    ),
+    _entity("Q82955", "politician", P31=[_item("P31", "Q28640")]),
+    _entity("Q1734662"), # No English label
+]
+
+WASHINGTON = {
+    "title": "George Washington",
+    "subtitle": "1st president of the United States",
+    "entries": {
+        "Born": [{ "value": "February 22, 1732" }],
+        "Occupation": [{ "value": "politician" }, { "value": "Q1734662" }],
+        "Nationality": [{
+            "value": "United States of America",
+            "link": "http://www.wikidata.org/entity/Q30",
+        }],
+        "Spouse": [{
+            "value": "Martha Washington",
+            "link": "http://www.wikidata.org/entity/Q191789",
+        }],
+    },
+}
+
+def write_dump(path: Path, opener=gzip.open):
+    """ Writes DUMP in the same layout as the Wikidata JSON dumps """
+    with opener(path, "wt", encoding="utf-8") as dump:
+        dump.write("[\n")
+        dump.write(",\n".join(json.dumps(entity) for entity in DUMP))
+        dump.write("\n]\n")
+
+class WikidataDumpTests(unittest.TestCase):
+    """ Tests ingesting Wikidata dumps into the panel store """
+
+    def setUp(self):
+        self.directory = Path(tempfile.mkdtemp())
+        self.store_path = self.directory / "panels.sqlite3"
+        panel_cache.clear()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_ingests_gzip_dump(self):
+        """ Tests that supported entities are stored and formatted like Wikidata's """
+        # arrange
+        dump_path = self.directory / "dump.json.gz"
+        write_dump(dump_path)
+
+        # act
+        call_command(
+            "ingest_wikidata_dump", str(dump_path), store=str(self.store_path),
+            workers=2, batch_size=2,
+        )
+        store = PanelStore(self.store_path)
+
+        # assert
+        self.assertEqual(store.count(), 3)
+        self.assertEqual(store.get_panel("Q23"), (EntityType.PERSON, WASHINGTON))
+        self.assertIsNone(store.get_panel("Q82955"))
+
+    def test_ingests_bz2_dump(self):
+        """ Tests reading a bzip2 dump, and linked entities without a stored label """
+        # arrange
+        dump_path = self.directory / "dump.json.bz2"
+        write_dump(dump_path, bz2.open)
+
+        # act
+        call_command(
+            "ingest_wikidata_dump", str(dump_path), store=str(self.store_path), workers=1
+        )
+        entity_type, panel = PanelStore(self.store_path).get_panel("Q30")
+
+        # assert
+        self.assertEqual(entity_type, EntityType.COUNTRY)
+        self.assertEqual(panel["entries"]["Population"], [{ "value": "331,449,281" }])
+        self.assertEqual(panel["entries"]["Capital"], [{ "value": "Q61" }])
+
+    def test_only_linked_labels_are_stored(self):
+        """ Tests that labels are only stored for the entities panels link to """
+        # arrange
+        dump_path = self.directory / "dump.json.gz"
+        write_dump(dump_path)
+
+        # act
+        call_command(
+            "ingest_wikidata_dump", str(dump_path), store=str(self.store_path), workers=1
+        )
+        labels = PanelStore(self.store_path).get_labels([entity["id"] for entity in DUMP])
+
+        # assert
+        self.assertEqual(sorted(labels), ["Q191789", "Q30", "Q82955"])
+
+    def test_line_entity_id(self):
+        """ Tests reading the ID from the start of a dump line, and from the JSON when
+            it isn't there
+        """
+        # arrange
+        lines = [
+            '{"type":"item","id":"Q42","labels":{}}',
+            '{"id": "Q23", "claims": {}}',
+            '{"labels":{},"id":"Q30"}',
+        ]
+
+        # act
+        actual = [get_line_entity_id(line) for line in lines]
+
+        # assert
+        self.assertEqual(actual, ["Q42", "Q23", "Q30"])
+
+    @patch("rdf.parser.summarizer.WikidataParser")
+    def test_async_summarizer_reads_store_off_the_loop(self, parser_class):
+        """ Tests that asummarize reads the store without blocking the event loop """
+        # arrange
+        dump_path = self.directory / "dump.json.gz"
+        write_dump(dump_path)
+        call_command(
+            "ingest_wikidata_dump", str(dump_path), store=str(self.store_path), workers=1
+        )
+        threads = []
+        get_panel = panel_store.get_panel
+
+        def get_panel_on_thread(entity_id: str):
+            threads.append(threading.current_thread())
+            return get_panel(entity_id)
+
+        # act
+        with override_settings(PANEL_STORE_PATH=str(self.store_path)), \
+                patch.object(panel_store, "get_panel", side_effect=get_panel_on_thread):
+            summarizer = Summarizer("https://www.wikidata.org/wiki/Q23")
+            actual = asyncio.run(summarizer.asummarize())
+
+        # assert
+        self.assertEqual(actual, WASHINGTON)
+        self.assertNotIn(threading.current_thread(), threads)
+        parser_class.assert_not_called()
+
+    def test_store_is_used_once_built(self):
+        """ Tests that the store's file is only looked for every STAT_INTERVAL seconds,
+            so a store built after it was first checked is used from the next check
+        """
+        # arrange
+        store = PanelStore(self.store_path)
+        before = store.get_panel("Q23")
+        dump_path = self.directory / "dump.json.gz"
+        write_dump(dump_path)
+        call_command(
+            "ingest_wikidata_dump", str(dump_path), store=str(self.store_path), workers=1
+        )
+
+        # act
+        before_check = store.get_panel("Q23")
+        with patch("rdf.parser.panel_store.STAT_INTERVAL", 0):
+            actual = store.get_panel("Q23")
+
+        # assert
+        self.assertEqual((before, before_check), (None, None))
+        self.assertEqual(actual, (EntityType.PERSON, WASHINGTON))
+
+    def test_extract_uses_best_rank(self):
+        """ Tests that only preferred statements are used when there are some, and that
+            imprecise dates are formatted like the query service does
+        """
+        # arrange
+        entity = _entity(
+            "Q1", "Someone",
+            P31=[_item("P31", "Q5")],
+            P569=[_statement(
+                "P569", { "time": "-0069-00-00T00:00:00Z", "precision": 9 }, "time"
+            )],
+            P27=[_item("P27", "Q30"), _item("P27", "Q145", "preferred")],
+        )
+
+        # act
+        entity_id, label, entity_type, fields = extract_entity(entity)
+
+        # assert
+        self.assertEqual((entity_id, label, entity_type), ("Q1", "Someone", "PERSON"))
+        self.assertEqual(fields["birthDate"], ["-0069-01-01T00:00:00Z"])
+        self.assertEqual(fields["nationality"], ["http://www.wikidata.org/entity/Q145"])
+
+    @patch("rdf.parser.summarizer.WikidataParser")
+    def test_summarizer_reads_store(self, parser_class):
+        """ Tests that the Summarizer uses the store instead of querying Wikidata """
+        # arrange
+        dump_path = self.directory / "dump.json.gz"
+        write_dump(dump_path)
+        call_command(
+            "ingest_wikidata_dump", str(dump_path), store=str(self.store_path), workers=1
+        )
+
+        # act
+        with override_settings(PANEL_STORE_PATH=str(self.store_path)):
+            actual = Summarizer("https://www.wikidata.org/wiki/Q23").summarize()
+
+        # assert
+        self.assertEqual(actual, WASHINGTON)
+        parser_class.assert_not_called()
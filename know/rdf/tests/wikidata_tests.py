@@ -1,5 +1,8 @@
 import unittest
-from rdf.parser.sparql_reader import read_sparql
+from unittest.mock import patch
+from rdf.parser.sparql_reader import (
+    read_sparql, read_sparql_values, register_sparql, InvalidEntityIdException
+)
 from rdf.parser.wikidata_parser import WikidataParser, UnsupportedEntityTypeException
 from rdf.parser.abstract_parser import EntityType
 
@@ -47,3 +50,110 @@ class ReadSparqlTests(unittest.TestCase):
         """
         parser = WikidataParser('https://www.wikidata.org/wiki/Q6928344')
         self.assertRaises(UnsupportedEntityTypeException, parser.get_entity_type)
+
+def _literal(value: str) -> dict:
+    return { "type": "literal", "value": value }
+
+class CombinedResolutionTests(unittest.TestCase):
+    """ WikidataParser.parse_combined tests """
+
+    @patch("rdf.parser.wikidata_parser.wikidata_sparql_query")
+    def test_parse_combined_makes_one_request(self, sparql_query):
+        """ Tests that the entity type and its fields come from a single query """
+        # arrange
+        sparql_query.return_value = { "results": { "bindings": [
+            { "label": _literal("human") },
+            { "label": _literal("featured article") },
+            {
+                "entityType": _literal("PERSON"),
+                "name": _literal("William Blake"),
+                "description": _literal("English poet"),
+                "occupationLabel": _literal("poet"),
+            },
+            {
+                "entityType": _literal("PERSON"),
+                "name": _literal("William Blake"),
+                "description": _literal("English poet"),
+                "occupationLabel": _literal("painter"),
+            },
+        ]}}
+        expected = {
+            "title": "William Blake",
+            "subtitle": "English poet",
+            "entries": {
+                "Occupation": [{ "value": "poet" }, { "value": "painter" }],
+            },
+        }
+        parser = WikidataParser("https://www.wikidata.org/wiki/Q41513")
+
+        # act
+        actual = parser.parse_combined()
+
+        # assert
+        self.assertEqual(expected, actual)
+        self.assertEqual(EntityType.PERSON, parser.entity_type)
+        self.assertEqual(1, sparql_query.call_count)
+
+    @patch.object(WikidataParser, "parse_book")
+    @patch("rdf.parser.wikidata_parser.wikidata_sparql_query")
+    def test_parse_combined_falls_back_without_fields(self, sparql_query, parse_book):
+        """ Tests that the type specific query is used when the combined query
+            classified the entity but didn't return its fields
+        """
+        # arrange
+        sparql_query.return_value = { "results": { "bindings": [
+            { "label": _literal("poem") },
+        ]}}
+        parse_book.return_value = { "title": "Dune" }
+        parser = WikidataParser("https://www.wikidata.org/wiki/Q190192")
+
+        # act
+        actual = parser.parse_combined()
+
+        # assert
+        self.assertEqual({ "title": "Dune" }, actual)
+        parse_book.assert_called_once()
+
+    @patch("rdf.parser.wikidata_parser.wikidata_sparql_query")
+    def test_parse_combined_unsupported_returns_none(self, sparql_query):
+        """ Tests that an unsupported entity type results in None """
+        # arrange
+        sparql_query.return_value = { "results": { "bindings": [
+            { "label": _literal("Wikimedia disambiguation page") },
+        ]}}
+        parser = WikidataParser("https://www.wikidata.org/wiki/Q6928344")
+
+        # act
+        actual = parser.parse_combined()
+
+        # assert
+        self.assertIsNone(actual)
+
+class SparqlTemplateTests(unittest.TestCase):
+    """ Tests the template registry behind read_sparql """
+
+    def test_read_rejects_invalid_entity_id(self):
+        """ Tests that only Wikidata IDs can be bound to a query """
+        self.assertRaises(
+            InvalidEntityIdException, read_sparql, "get_instance.sparql", "Q1 } #"
+        )
+
+    def test_read_values_binds_every_entity(self):
+        """ Tests that read_sparql_values fills the VALUES block """
+        # act
+        actual = read_sparql_values("get_instances.sparql", ["Q23", "Q142"])
+
+        # assert
+        self.assertIn("VALUES ?entity { wd:Q23 wd:Q142 }", actual)
+
+    def test_registered_template_can_be_read(self):
+        """ Tests that templates can be registered without a .sparql file """
+        # arrange
+        query = "# a comment\nSELECT ?l { wd:$0 rdfs:label ?l }"
+        register_sparql("test_label.sparql", query)
+
+        # act
+        actual = read_sparql("test_label.sparql", "Q23")
+
+        # assert
+        self.assertEqual("SELECT ?l { wd:Q23 rdfs:label ?l }", actual)
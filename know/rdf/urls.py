@@ -1,6 +1,18 @@
+from django.conf import settings
 from django.urls import re_path
-from rdf.views import get_knowledge_panel_data
+from rdf.views import (
+    get_knowledge_panel_data, get_knowledge_panel_data_fast,
+    get_knowledge_panel_data_async, get_knowledge_panels, metrics
+)
+
+if getattr(settings, 'PANEL_FAST_PATH', False):
+    panel_view = get_knowledge_panel_data_fast
+else:
+    panel_view = get_knowledge_panel_data
 
 urlpatterns = [
-    re_path(r'^$', get_knowledge_panel_data)
+    re_path(r'^$', panel_view),
+    re_path(r'^async/$', get_knowledge_panel_data_async),
+    re_path(r'^batch/$', get_knowledge_panels),
+    re_path(r'^metrics$', metrics),
 ]
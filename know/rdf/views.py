@@ -1,20 +1,168 @@
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
+from django.views.decorators.http import require_GET
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from rdf.parser.summarizer import Summarizer
+from rdf.parser.panel_cache import (
+    panel_cache, get_cache_control, encode_json, JSON_CONTENT_TYPE
+)
+from rdf.parser.panel_prefetcher import panel_prefetcher
+from rdf.parser.http_client import http_client
+from rdf.parser.wikidata_parser import resilience_metrics
+from rdf.parser.hedging import sparql_hedger
+from rdf.parser.telemetry import timed, render_metrics
+from rdf.parser.deadline import DeadlineExceeded, request_deadline, get_panel_deadline
+
+def _is_not_modified(request, etag: str) -> bool:
+    """ Returns whether the request's If-None-Match has the panel's ETag, i.e. the
+        client already has the panel. If-None-Match uses the weak comparison
+    """
+    etags = parse_etags(request.headers.get('If-None-Match', ''))
+    if etags == ['*']:
+        return True
+
+    return etag in (tag[2:] if tag.startswith('W/') else tag for tag in etags)
+
+def _panel_response(request, summarizer: Summarizer, data: dict, render):
+    """ Returns a 304 if the client already has the panel, and otherwise the panel.
+        A panel from the cache is sent as it was encoded when it was cached, and others
+        are rendered with render. Either way it has the panel's ETag and a Cache-Control
+        for its entity type, so browsers and CDNs can cache it, unless it's partial
+    """
+    if _is_not_modified(request, summarizer.etag):
+        response = HttpResponseNotModified()
+    elif summarizer.body is not None:
+        response = HttpResponse(summarizer.body, content_type=summarizer.content_type)
+    else:
+        response = render(data)
+
+    response['ETag'] = summarizer.etag
+    if summarizer.partial: # The full panel should be fetched on the next request
+        response['Cache-Control'] = "no-store"
+    else:
+        cache_control = get_cache_control(summarizer.entity_type, summarizer.stale)
+        response['Cache-Control'] = cache_control
+    return response
 
 @api_view(['GET'])
 def get_knowledge_panel_data(request):
     """ Gets the URI parameter from the request and calls summarize on Summarizer, then
         returns the Response.
-        Returns Error code 400 if the URI is not provided, or if summarize returns None
+        Summarizing has PANEL_DEADLINE seconds, and if the panel can't be fetched in
+        that time a partial one (with just a title and subtitle) is returned instead.
+        Returns Error code 400 if the URI is not provided, or if summarize returns None,
+        and 504 if not even a partial panel could be fetched in time
     """
     uri = request.query_params.get('uri')
 
     if not uri:
         return Response(status=400)
 
-    data = Summarizer(uri).summarize()
+    summarizer = Summarizer(uri)
+    try:
+        with request_deadline(get_panel_deadline()):
+            data = summarizer.summarize()
+    except DeadlineExceeded:
+        return Response(status=504)
     if not data:
         return Response(status=400)
 
-    return Response(data)
+    # The ETag is for the JSON, not the browsable API
+    if request.accepted_renderer.format != 'json':
+        return Response(data)
+
+    response = _panel_response(request, summarizer, data, Response)
+    patch_vary_headers(response, ('Accept',))
+    return response
+
+def _render_json(data: dict) -> HttpResponse:
+    with timed("serialize"):
+        return HttpResponse(encode_json(data), content_type=JSON_CONTENT_TYPE)
+
+@require_GET
+def get_knowledge_panel_data_fast(request):
+    """ get_knowledge_panel_data without DRF, which is used when the PANEL_FAST_PATH
+        setting is on. It always responds with JSON, so it skips DRF's request
+        wrapping, content negotiation and browsable API
+    """
+    uri = request.GET.get('uri')
+
+    if not uri:
+        return HttpResponse(status=400)
+
+    summarizer = Summarizer(uri)
+    try:
+        with request_deadline(get_panel_deadline()):
+            data = summarizer.summarize()
+    except DeadlineExceeded:
+        return HttpResponse(status=504)
+    if not data:
+        return HttpResponse(status=400)
+
+    return _panel_response(request, summarizer, data, _render_json)
+
+@api_view(['POST'])
+def get_knowledge_panels(request):
+    """ Gets the list of URIs from the 'uris' key of the request body and summarizes
+        all of them at once, returning a dict of each URI to its panel (or null if it
+        couldn't be summarized).
+        Returns Error code 400 if uris isn't a non-empty list of strings, or has more
+        than PANEL_BATCH_MAX_URIS URIs.
+        Summarizing has PANEL_DEADLINE seconds, and returns Error code 504 if they run
+        out
+    """
+    uris = request.data.get('uris') if isinstance(request.data, dict) else None
+
+    if not isinstance(uris, list) or not uris:
+        return Response(status=400)
+
+    if not all(isinstance(uri, str) for uri in uris):
+        return Response(status=400)
+
+    if len(uris) > getattr(settings, 'PANEL_BATCH_MAX_URIS', 50):
+        return Response(status=400)
+
+    try:
+        with request_deadline(get_panel_deadline()):
+            panels = Summarizer.summarize_many(uris)
+    except DeadlineExceeded:
+        return Response(status=504)
+
+    return Response(panels)
+
+async def get_knowledge_panel_data_async(request):
+    """ Async version of get_knowledge_panel_data. It doesn't go through DRF (which
+        doesn't support async views), so when served through know.asgi a single worker
+        can wait on many Wikidata requests at once.
+    """
+    uri = request.GET.get('uri')
+
+    if not uri:
+        return HttpResponse(status=400)
+
+    summarizer = Summarizer(uri)
+    try:
+        with request_deadline(get_panel_deadline()):
+            data = await summarizer.asummarize()
+    except DeadlineExceeded:
+        return HttpResponse(status=504)
+    if not data:
+        return HttpResponse(status=400)
+
+    return _panel_response(request, summarizer, data, _render_json)
+
+def metrics(_):
+    """ Returns the request timings, panel cache, prefetch, HTTP client, Wikidata
+        resilience and hedging metrics of this process in the Prometheus text format
+    """
+    body = render_metrics({
+        'know_panel_cache': panel_cache.stats(),
+        'know_panel_prefetch': panel_prefetcher.stats(),
+        'know_http_client': http_client.metrics(),
+        'know_wikidata': resilience_metrics(),
+        'know_wikidata_hedging': sparql_hedger.metrics(),
+    })
+    return HttpResponse(body, content_type="text/plain; version=0.0.4; charset=utf-8")